@@ -0,0 +1,233 @@
+import bz2
+import gzip
+import io
+import json
+import lzma
+import random
+import string
+import struct
+import tarfile
+import zipfile
+from base64 import b64encode
+from pathlib import Path
+
+from Crypto.Cipher import AES
+
+from src.kdf import derive_key
+
+ARCHIVE_FORMATS = ("zip", "tar.gz", "gz", "bz2", "xz")
+_PASSWORD_CHARS = string.ascii_letters + string.digits + "!@#$%_-."
+
+
+def _password(rng: random.Random) -> str:
+    length = rng.choice([4, 6, 8, 8, 9, 10, 12, 16])
+    return "".join(rng.choices(_PASSWORD_CHARS, k=length))
+
+
+def combo_lines(
+    lines: int,
+    seed: int = 0,
+    delimiters: str = ":;",
+    duplicate_ratio: float = 0.2,
+    malformed_ratio: float = 0.05,
+) -> bytes:
+    """
+    A deterministic combo list of `user@host<delimiter>password` lines. About
+    `duplicate_ratio` of the lines repeat an earlier password and
+    `malformed_ratio` have no delimiter. Passwords shorter than 8 characters
+    are mixed in as in real leaks.
+    """
+    rng = random.Random(seed)
+    passwords: list[str] = []
+    out = []
+    for i in range(lines):
+        if rng.random() < malformed_ratio:
+            out.append(f"broken line {i}")
+            continue
+        if passwords and rng.random() < duplicate_ratio:
+            password = rng.choice(passwords)
+        else:
+            password = _password(rng)
+            passwords.append(password)
+        out.append(f"user{i}@example.com{rng.choice(delimiters)}{password}")
+    return ("\n".join(out) + "\n").encode()
+
+
+def password_lines(lines: int, seed: int = 0, duplicate_ratio: float = 0.2) -> bytes:
+    """
+    A deterministic plain password list, one password per line.
+    """
+    rng = random.Random(seed)
+    passwords: list[str] = []
+    out = []
+    for _ in range(lines):
+        if passwords and rng.random() < duplicate_ratio:
+            out.append(rng.choice(passwords))
+        else:
+            passwords.append(_password(rng))
+            out.append(passwords[-1])
+    return ("\n".join(out) + "\n").encode()
+
+
+_WORDS = [
+    "password", "dragon", "monkey", "sunshine", "princess", "football", "shadow",
+    "master", "welcome", "freedom", "charlie", "summer", "flower", "hunter",
+    "soccer", "killer", "butterfly", "michael", "jessica", "ethereum", "bitcoin",
+    "wallet", "crypto", "letmein", "trustno", "superman", "batman", "starwars",
+    "computer", "whatever", "orange", "banana", "chocolate", "silver", "ginger",
+]  # fmt: skip
+_SUFFIXES = ["", "1", "12", "123", "1234", "2020", "2021", "2024", "69", "007", "88"]
+
+
+def human_passwords(count: int, seed: int = 0) -> list[str]:
+    """
+    Deterministic passwords built the way people build them: a word chosen with
+    a Zipf-like skew, mostly lowercase or capitalized, followed by digits and
+    sometimes a symbol. Unlike `password_lines` they have structure a password
+    model can learn.
+    """
+    rng = random.Random(seed)
+    word_weights = [1 / (rank + 1) for rank in range(len(_WORDS))]
+    suffix_weights = [1 / (rank + 1) for rank in range(len(_SUFFIXES))]
+    passwords = []
+    for _ in range(count):
+        word = rng.choices(_WORDS, word_weights)[0]
+        if rng.random() < 0.3:
+            word = word.capitalize()
+        elif rng.random() < 0.05:
+            word = word.upper()
+        password = word + rng.choices(_SUFFIXES, suffix_weights)[0]
+        if rng.random() < 0.2:
+            password += rng.choice("!@#.")
+        passwords.append(password)
+    return passwords
+
+
+def write_archive(path: Path, members: dict[str, bytes], fmt: str) -> Path:
+    """
+    Write the members into an archive of the given format. Single file formats
+    (gz, bz2, xz) take exactly one member and name the archive after it.
+    Returns:
+        The path of the archive.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "zip":
+        path = path.with_name(path.name + ".zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for name, data in members.items():
+                zipf.writestr(name, data)
+    elif fmt == "tar.gz":
+        path = path.with_name(path.name + ".tar.gz")
+        with tarfile.open(path, "w:gz") as tar:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    elif fmt in ("gz", "bz2", "xz"):
+        ((name, data),) = members.items()
+        compress = {"gz": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+        path = path.with_name(f"{name}.{fmt}")
+        path.write_bytes(compress[fmt](data))
+    else:
+        raise ValueError(f"Unsupported archive format {fmt}")
+    return path
+
+
+def make_vault(
+    password: str,
+    iterations: int = 1000,
+    mnemonic: str = "test test test test test test test test test test test junk",
+    seed: int = 0,
+) -> dict:
+    """
+    Encrypt a keyring like MetaMask does, with few PBKDF2 iterations so that
+    decryption benchmarks measure the code around the KDF too.
+    """
+    rng = random.Random(seed)
+    salt = rng.randbytes(32)
+    iv = rng.randbytes(16)
+    keyrings = [
+        {
+            "type": "HD Key Tree",
+            "data": {"mnemonic": [ord(c) for c in mnemonic], "numberOfAccounts": 1},
+        }
+    ]
+    key = derive_key(password.encode("utf-8"), salt, iterations)
+    cipher = AES.new(key, AES.MODE_GCM, iv)
+    data, tag = cipher.encrypt_and_digest(json.dumps(keyrings).encode())
+    return {
+        "data": b64encode(data + tag).decode(),
+        "iv": b64encode(iv).decode(),
+        "keyMetadata": {"algorithm": "PBKDF2", "params": {"iterations": iterations}},
+        "salt": b64encode(salt).decode(),
+    }
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _batch(sequence: int, key: bytes, value: bytes) -> bytes:
+    return (
+        struct.pack("<QIB", sequence, 1, 1)
+        + _varint(len(key))
+        + key
+        + _varint(len(value))
+        + value
+    )
+
+
+def _log_records(records: list[bytes]) -> bytes:
+    # Fragment the records over 32KiB blocks like the LevelDB log writer,
+    # checksums are left zero as the reader does not verify them
+    block_size = 32 * 1024
+    out = bytearray()
+    for record in records:
+        first = True
+        while True:
+            left = block_size - len(out) % block_size
+            if left < 7:
+                out += b"\x00" * left
+                left = block_size
+            fragment, record = record[: left - 7], record[left - 7 :]
+            kind = (1 if not record else 2) if first else (4 if not record else 3)
+            out += struct.pack("<IHB", 0, len(fragment), kind) + fragment
+            first = False
+            if not record:
+                break
+    return bytes(out)
+
+
+def _state(vault: dict) -> bytes:
+    # The whole extension state under the "data" key, as older MetaMask
+    # versions write it and the log regexes expect it
+    state = {"KeyringController": {"vault": json.dumps(vault, separators=(",", ":"))}}
+    return json.dumps(state, separators=(",", ":")).encode()
+
+
+def leveldb_log(vault: dict, noise_records: int = 1000, seed: int = 0) -> bytes:
+    """
+    A fake `000003.log` of the MetaMask extension storage: `noise_records`
+    writes of another controller around a stale and the current state,
+    which holds `vault`.
+    """
+    rng = random.Random(seed)
+    stale = dict(vault, iv=b64encode(rng.randbytes(16)).decode())
+    records = []
+    for sequence in range(1, noise_records + 1):
+        if sequence == noise_records // 3:
+            records.append(_batch(sequence, b"data", _state(stale)))
+            continue
+        state = {
+            "identities": {f"0x{rng.getrandbits(160):040x}": {"name": "Account"}},
+            "lastUpdated": rng.getrandbits(40),
+        }
+        value = json.dumps(state, separators=(",", ":")).encode()
+        records.append(_batch(sequence, b"PreferencesController", value))
+    records.append(_batch(noise_records + 1, b"data", _state(vault)))
+    return _log_records(records)
@@ -0,0 +1,288 @@
+"""
+Throughput benchmarks of the dictionary and vault paths on synthetic data.
+
+    python -m benchmarks.run                    # measure and compare to the baseline
+    python -m benchmarks.run --update-baseline  # store the results as the baseline
+
+Exits with status 1 if a stage is slower than its baseline by more than the
+tolerance, and with status 2 if there is no baseline to compare to. Baselines
+are machine specific, store one per benchmark machine.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+# Progress bars would dominate the output
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+from benchmarks.corpus import (  # noqa: E402
+    ARCHIVE_FORMATS,
+    combo_lines,
+    human_passwords,
+    leveldb_log,
+    make_vault,
+    password_lines,
+    write_archive,
+)
+from src.generate_dic import (  # noqa: E402
+    flatten_pass,
+    generate_dict,
+    iter_file_candidates,
+)
+from src.hack_metamask import (  # noqa: E402
+    check_vault_fileds,
+    check_vault_password,
+    parse_vault_data,
+    scan_vault_data,
+)
+from src.leveldb import read_keyring_vault  # noqa: E402
+from src.pcfg import PcfgModel, evaluate  # noqa: E402
+from src.pipeline import read_sources  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+_MB = 1024 * 1024
+
+# A benchmark prepares its input in a directory and returns the timed call and
+# the amount of work it does, or a callable returning the amount once it ran
+Setup = Callable[
+    [Path, float], tuple[Callable[[], object], float | Callable[[], float]]
+]
+
+
+def _split_combo(work: Path, scale: float):
+    # Sniffing and splitting of a combo list as flatten_pass reads it
+    source = work / "need_to_split" / "combo.txt"
+    source.parent.mkdir()
+    source.write_bytes(combo_lines(int(200_000 * scale)))
+    size = source.stat().st_size
+
+    def run():
+        def read(file_path, counts):
+            return iter_file_candidates(file_path, counts, need_split=True)
+
+        for _, batches, _ in read_sources([source], read):
+            for _ in batches:
+                pass
+
+    return run, size / _MB
+
+
+def _flatten_pass(work: Path, scale: float):
+    source = work / "a_only_pass.txt"
+    source.write_bytes(password_lines(int(300_000 * scale)))
+    size = source.stat().st_size
+    return lambda: flatten_pass(work, files=[source]), size / _MB
+
+
+def _archives(work: Path, scale: float) -> float:
+    size = 0
+    for i, fmt in enumerate(ARCHIVE_FORMATS):
+        data = password_lines(int(50_000 * scale), seed=i)
+        write_archive(work / f"leak{i}.txt", {f"leak{i}.txt": data}, fmt)
+        size += len(data)
+    return size
+
+
+def _flatten_archives(work: Path, scale: float):
+    size = _archives(work, scale)
+    return lambda: flatten_pass(work), size / _MB
+
+
+def _generate_dict(work: Path, scale: float):
+    # Archives, plain lists and combo lists through the whole pipeline
+    size = _archives(work, scale)
+    combo = work / "need_to_split" / "combo.txt"
+    combo.parent.mkdir()
+    combo.write_bytes(combo_lines(int(200_000 * scale)))
+    size += combo.stat().st_size
+    return lambda: generate_dict(work, processes=2), size / _MB
+
+
+def _trained_model(scale: float) -> PcfgModel:
+    model = PcfgModel()
+    model.train(human_passwords(int(100_000 * scale) + 100))
+    return model
+
+
+def _pcfg_guesses(work: Path, scale: float):
+    model = _trained_model(scale)
+    budget = int(200_000 * scale) + 100
+    return lambda: sum(1 for _ in model.guesses(budget)), budget
+
+
+def _pcfg_hits(work: Path, scale: float):
+    # Guesses that crack a held-out split of the same population, per second
+    # of generation, which rewards both a better ordering and a faster one
+    model = _trained_model(scale)
+    held_out = human_passwords(int(20_000 * scale) + 100, seed=1)
+    result = {}
+
+    def run():
+        result.update(evaluate(model, held_out, budget=int(20_000 * scale) + 100))
+        logger.info(f"pcfg hit rate {result['hit_rate']:.1%}")
+
+    return run, lambda: result["hits"]
+
+
+_VAULT_PASSWORD = "benchmark-password"
+
+
+def _vault_log(scale: float) -> bytes:
+    return leveldb_log(make_vault(_VAULT_PASSWORD), int(20_000 * scale))
+
+
+def _parse_vault_data(work: Path, scale: float):
+    data = _vault_log(scale)
+    text = data.decode("utf-8", errors="ignore")
+    return lambda: parse_vault_data(text), len(data) / _MB
+
+
+def _scan_vault_data(work: Path, scale: float):
+    data = _vault_log(scale)
+    return lambda: scan_vault_data(data), len(data) / _MB
+
+
+def _read_keyring_vault(work: Path, scale: float):
+    data = _vault_log(scale)
+    (work / "000003.log").write_bytes(data)
+    return lambda: read_keyring_vault(work), len(data) / _MB
+
+
+def _check_passwords(work: Path, scale: float):
+    fields = check_vault_fileds(make_vault(_VAULT_PASSWORD, iterations=1000))
+    candidates = [b"candidate%06d" % i for i in range(int(500 * scale))]
+
+    def check():
+        for candidate in candidates:
+            check_vault_password(fields, candidate)
+
+    return check, len(candidates)
+
+
+# Stage name, unit of the throughput, setup
+BENCHMARKS: list[tuple[str, str, Setup]] = [
+    ("split_combo", "MB/s", _split_combo),
+    ("flatten_pass", "MB/s", _flatten_pass),
+    ("flatten_archives", "MB/s", _flatten_archives),
+    ("generate_dict", "MB/s", _generate_dict),
+    ("parse_vault_data", "MB/s", _parse_vault_data),
+    ("scan_vault_data", "MB/s", _scan_vault_data),
+    ("read_keyring_vault", "MB/s", _read_keyring_vault),
+    ("check_vault_password", "candidates/s", _check_passwords),
+    ("pcfg_guesses", "candidates/s", _pcfg_guesses),
+    ("pcfg_hits", "hits/s", _pcfg_hits),
+]
+
+
+def run_benchmarks(
+    scale: float = 1.0, repeat: int = 3, only: list[str] | None = None
+) -> dict[str, dict]:
+    """
+    Run every benchmark `repeat` times on freshly generated input and keep the
+    best throughput, setup is not timed.
+    Returns:
+        The throughput and its unit per stage.
+    """
+    results = {}
+    for name, unit, setup in BENCHMARKS:
+        if only and name not in only:
+            continue
+        best = 0.0
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory(prefix="bench_") as work:
+                run, amount = setup(Path(work), scale)
+                start = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - start
+                if callable(amount):
+                    amount = amount()
+            best = max(best, amount / elapsed if elapsed else float("inf"))
+        results[name] = {"throughput": round(best, 3), "unit": unit}
+        logger.info(f"{name:<28} {best:12.2f} {unit}")
+    return results
+
+
+def compare_to_baseline(
+    results: dict[str, dict], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    """
+    Returns:
+        A message for every stage slower than `(1 - tolerance)` times its baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]["throughput"]
+        if result["throughput"] < expected * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['throughput']:.2f} {result['unit']}, "
+                f"baseline {expected:.2f} {result['unit']}"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier of the corpus sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage")
+    parser.add_argument(
+        "--only", nargs="+", choices=[name for name, _, _ in BENCHMARKS]
+    )
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown against the baseline, 0.25 is 25%%",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the new baseline",
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scale, args.repeat, args.only)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.update_baseline:
+        baseline = {}
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2), encoding="utf-8")
+        logger.info(f"Baseline saved: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        # A gate that passes without a baseline never catches a regression
+        logger.error(
+            f"No baseline at {args.baseline}, store one with --update-baseline"
+        )
+        return 2
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression in {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    # Keep the per-stage INFO logs of the measured code out of the report
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+    sys.exit(main())
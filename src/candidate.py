@@ -0,0 +1,86 @@
+import re
+from collections.abc import Iterator
+from typing import BinaryIO
+
+# MetaMask refuses passwords shorter than 8 characters
+MIN_PASSWORD_LENGTH = 8
+
+HEX_PREFIX = b"$HEX["
+# Control characters would be altered by hashcat's line reader
+_UNSAFE_BYTES = re.compile(rb"[\x00-\x1f\x7f]")
+
+
+def to_hex(password: bytes) -> bytes:
+    return HEX_PREFIX + password.hex().encode("ascii") + b"]"
+
+
+def from_hex(candidate: bytes) -> bytes:
+    """
+    Return the raw password of a `$HEX[...]` candidate, or the candidate itself
+    if it is not in that form.
+    """
+    if candidate.startswith(HEX_PREFIX) and candidate.endswith(b"]"):
+        try:
+            return bytes.fromhex(candidate[len(HEX_PREFIX) : -1].decode("ascii"))
+        except ValueError:
+            pass
+    return candidate
+
+
+def to_candidate(password: bytes) -> bytes | None:
+    """
+    Turn a raw password into a line for a hashcat wordlist.
+    Args:
+        password (bytes): The password without line ending, may already be in `$HEX[...]` form.
+    Returns:
+        The password itself if it is safe UTF-8, its `$HEX[...]` form if it is not
+        valid UTF-8 or contains control characters, or None if it is too short.
+    """
+    if password.startswith(HEX_PREFIX):
+        password = from_hex(password)
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return None
+
+    if password.isascii():
+        if _UNSAFE_BYTES.search(password) or password.startswith(HEX_PREFIX):
+            return to_hex(password)
+        return password
+
+    try:
+        text = password.decode("utf-8")
+    except UnicodeDecodeError:
+        return to_hex(password)
+    # Multi-byte characters count once towards the minimum length
+    if len(text) < MIN_PASSWORD_LENGTH:
+        return None
+    if _UNSAFE_BYTES.search(password):
+        return to_hex(password)
+    return password
+
+
+def to_candidates(passwords: list[bytes]) -> list[bytes]:
+    """
+    Batch version of `to_candidate` for raw passwords that may still carry
+    surrounding whitespace. Rejected passwords are left out.
+    """
+    candidates = []
+    append = candidates.append
+    for password in passwords:
+        # bytes.isalnum() only accepts ASCII, such passwords need no further checks
+        if len(password) >= MIN_PASSWORD_LENGTH and password.isalnum():
+            append(password)
+            continue
+        password = to_candidate(password.strip())
+        if password:
+            append(password)
+    return candidates
+
+
+def iter_wordlist(file: BinaryIO) -> Iterator[bytes]:
+    """
+    Yield the raw passwords of a hashcat wordlist, decoding `$HEX[...]` lines.
+    """
+    for line in file:
+        line = line.rstrip(b"\r\n")
+        if line:
+            yield from_hex(line)
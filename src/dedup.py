@@ -0,0 +1,309 @@
+import heapq
+import logging
+import math
+import tempfile
+import zlib
+from collections.abc import Iterator
+from pathlib import Path
+
+# Approximate memory cost of one entry in the in-memory table besides the raw
+# password bytes: the bytes object header (33) plus the dict slot and index.
+_ENTRY_OVERHEAD = 97
+# The first split uses the low bits of the crc32 value, every further split of
+# an oversized partition consumes the next _FANOUT_BITS bits. The first split
+# is capped at 64 partitions to keep few spill files open at a time, larger
+# inputs rely on the further splits
+_PARTITION_BITS = 6
+_FANOUT_BITS = 4
+_SPILL_BUFFER = 64 * 1024
+# Spilled records are "+line" for one occurrence, "-line" for an excluded line
+# and "*count\tline" for a line counted in memory before spilling. Candidates
+# never contain tabs, those are written as $HEX[].
+_ADDED = b"+"
+_EXCLUDED = b"-"
+_COUNTED = b"*"
+# Memory per entry of the in-memory top list in `ranked`
+_RANK_ENTRY_OVERHEAD = 200
+# Memory per entry of sorting the in-memory table in `ranked`: the list of
+# lines, the list of sort keys and the merge buffer of the sort
+_SORT_ENTRY_OVERHEAD = 24
+
+
+class ExternalDeduplicator:
+    """
+    Exact deduplication of password lines under a fixed memory budget.
+
+    Lines are kept in an insertion-ordered dict until the budget is reached.
+    After that everything is hash-partitioned into spill files under
+    `spill_dir`, and each partition is deduplicated on its own; partitions that
+    still do not fit are split again using the next bits of the hash.
+    Lines passed to `exclude` take part in deduplication but are never yielded,
+    which allows merging new lines into existing output.
+    As all occurrences of a line end up in the same partition, the number of
+    occurrences of every line is counted exactly as well, see `counted` and `ranked`.
+    The write buffers of the spill files are part of the budget.
+    Args:
+        memory_limit (int): Budget for the dedup table in bytes.
+        spill_dir (Path): Directory in which the temporary spill files are created.
+        expected_size (int): Total input size in bytes, used to size the partitions.
+    """
+
+    def __init__(self, memory_limit: int, spill_dir: Path, expected_size: int = 0):
+        self.memory_limit = max(memory_limit, 1024 * 1024)
+        # At most a sixteenth of the budget goes to the buffers of the
+        # partitions, which are open while the table is spilled into them
+        self._buffer_size = min(
+            _SPILL_BUFFER, (self.memory_limit // 16) >> _PARTITION_BITS
+        )
+        self._table_limit = self.memory_limit - (self._buffer_size << _PARTITION_BITS)
+        # Budget of the table of a spilled partition, less while `ranked`
+        # keeps its top list next to it
+        self._count_limit = self._table_limit
+        self.spill_dir = Path(spill_dir)
+        self.expected_size = expected_size
+
+        self.lines_in = 0
+        self.lines_out = 0
+
+        # Maps each line to its number of occurrences, -1 for excluded lines
+        self._seen: dict[bytes, int] = {}
+        self._memory = 0
+        self._bytes_in = 0
+        self._temp_dir: tempfile.TemporaryDirectory | None = None
+        self._partitions: list = []
+
+    @property
+    def duplicates(self) -> int:
+        return self.lines_in - self.lines_out
+
+    @property
+    def spilled(self) -> bool:
+        return self._temp_dir is not None
+
+    def add(self, line: bytes) -> None:
+        self.lines_in += 1
+        self._insert(line, False)
+
+    def exclude(self, line: bytes) -> None:
+        """
+        Mark a line as already present in the output. All exclusions have to
+        happen before the first `add`.
+        """
+        self._insert(line, True)
+
+    def _insert(self, line: bytes, excluded: bool) -> None:
+        self._bytes_in += len(line) + 1
+
+        if self._partitions:
+            self._partitions[zlib.crc32(line) % len(self._partitions)].write(
+                (_EXCLUDED if excluded else _ADDED) + line + b"\n"
+            )
+            return
+
+        count = self._seen.get(line)
+        if count is not None:
+            if count > 0:
+                self._seen[line] = count + 1
+            return
+        self._seen[line] = -1 if excluded else 1
+        self._memory += len(line) + _ENTRY_OVERHEAD
+        if self._memory >= self._table_limit:
+            self._spill()
+
+    def unique(self) -> Iterator[bytes]:
+        """
+        Yield every distinct line exactly once. Must be called after all `add` calls.
+        Without spilling the original first-occurrence order is kept, otherwise
+        lines come out grouped by partition.
+        """
+        for line, _ in self.counted():
+            yield line
+
+    def counted(self) -> Iterator[tuple[bytes, int]]:
+        """
+        Like `unique`, but yield each line together with its number of occurrences.
+        """
+        try:
+            if not self._partitions:
+                seen, self._seen = self._seen, {}
+                for line, count in seen.items():
+                    if count > 0:
+                        self.lines_out += 1
+                        yield line, count
+                return
+
+            paths = [Path(f.name) for f in self._partitions]
+            for f in self._partitions:
+                f.close()
+            self._partitions = []
+
+            for path in paths:
+                for item in self._count_partition(path, 0):
+                    self.lines_out += 1
+                    yield item
+        finally:
+            self.close()
+
+    def ranked(self) -> Iterator[bytes]:
+        """
+        Yield every distinct line exactly once, most frequent first.
+        The most frequent lines that fit into a quarter of the memory budget are
+        ordered exactly by their count, ties keep the order of `unique`.
+        All other lines are ordered by the power of two band of their count,
+        which is kept in spill files.
+        """
+        sort_memory = len(self._seen) * _SORT_ENTRY_OVERHEAD
+        if not self._partitions and self._memory + sort_memory >= self._table_limit:
+            # The table fits, but not together with its sorted copy
+            self._spill()
+        if not self._partitions:
+            # Everything fits into memory, sort exactly. Only the lines are
+            # sorted, not (line, count) pairs, and sorted() is stable.
+            seen, self._seen = self._seen, {}
+            try:
+                for line in sorted(seen, key=seen.__getitem__, reverse=True):
+                    if seen[line] < 0:
+                        # Excluded lines sort last
+                        break
+                    self.lines_out += 1
+                    yield line
+            finally:
+                self.close()
+            return
+
+        top_k = max(self.memory_limit // 4 // _RANK_ENTRY_OVERHEAD, 1)
+        self._count_limit = self._table_limit - self.memory_limit // 4
+        top: list[tuple[int, int, bytes]] = []
+        with tempfile.TemporaryDirectory(prefix=".rank_", dir=self.spill_dir) as temp:
+            bands: dict[int, object] = {}
+
+            def spill(line: bytes, count: int):
+                band = count.bit_length()
+                if band not in bands:
+                    bands[band] = open(
+                        Path(temp) / f"band_{band}.bin",
+                        "wb",
+                        buffering=self._buffer_size,
+                    )
+                bands[band].write(line + b"\n")
+
+            for seq, (line, count) in enumerate(self.counted()):
+                # Min-heap of the top_k most frequent lines, the sequence number
+                # breaks ties in favour of earlier lines
+                item = (count, -seq, line)
+                if len(top) < top_k:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    _, _, evicted = top[0]
+                    spill(evicted, top[0][0])
+                    heapq.heapreplace(top, item)
+                else:
+                    spill(line, count)
+
+            for f in bands.values():
+                f.close()
+            top.sort(reverse=True)
+            for _, _, line in top:
+                yield line
+            top = []
+            for band in sorted(bands, reverse=True):
+                with open(bands[band].name, "rb", buffering=self._buffer_size) as f:
+                    for record in f:
+                        yield record[:-1]
+
+    def close(self) -> None:
+        for f in self._partitions:
+            f.close()
+        self._partitions = []
+        self._seen = {}
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+    def _spill(self) -> None:
+        # Memory used per input byte so far, which includes the duplicate rate
+        ratio = self._memory / max(self._bytes_in, 1)
+        remaining = max(self.expected_size, self._bytes_in * 2)
+        # Aim for half the budget per partition to leave room for skew
+        bits = math.ceil(math.log2(max(remaining * ratio / (self._table_limit / 2), 2)))
+        count = 1 << min(bits, _PARTITION_BITS)
+
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._temp_dir = tempfile.TemporaryDirectory(
+            prefix=".dedup_", dir=self.spill_dir
+        )
+        self._partitions = self._open_partitions(Path(self._temp_dir.name), count)
+        logging.info(
+            f"Dedup table reached {self.memory_limit // (1024 * 1024)}MB, "
+            f"spilling into {count} partitions"
+        )
+
+        seen, self._seen = self._seen, {}
+        self._memory = 0
+        for line, occurrences in seen.items():
+            self._partitions[zlib.crc32(line) % count].write(_record(line, occurrences))
+
+    def _open_partitions(self, directory: Path, count: int, prefix="part") -> list:
+        return [
+            open(directory / f"{prefix}_{i}.bin", "wb", buffering=self._buffer_size)
+            for i in range(count)
+        ]
+
+    def _count_partition(self, path: Path, depth: int) -> Iterator[tuple[bytes, int]]:
+        shift = _PARTITION_BITS + depth * _FANOUT_BITS
+        can_split = shift + _FANOUT_BITS <= 32
+        seen: dict[bytes, int] = {}
+        memory = 0
+        fits = True
+        with open(path, "rb", buffering=self._buffer_size) as f:
+            # Excluded lines were written first, so they are never counted
+            for record in f:
+                line, occurrences = _parse_record(record)
+                count = seen.get(line)
+                if count is not None:
+                    if count > 0:
+                        seen[line] = count + occurrences
+                    continue
+                seen[line] = occurrences
+                memory += len(line) + _ENTRY_OVERHEAD
+                if memory >= self._count_limit and can_split:
+                    fits = False
+                    break
+
+        if fits:
+            path.unlink()
+            yield from ((line, count) for line, count in seen.items() if count > 0)
+            return
+
+        # Too many distinct lines share this partition, split it on the next hash bits
+        seen = {}
+        fanout = 1 << _FANOUT_BITS
+        subs = self._open_partitions(path.parent, fanout, prefix=f"{path.stem}_{depth}")
+        with open(path, "rb", buffering=self._buffer_size) as f:
+            for record in f:
+                line, _ = _parse_record(record)
+                subs[(zlib.crc32(line) >> shift) % fanout].write(record)
+        for sub in subs:
+            sub.close()
+        path.unlink()
+
+        for sub in subs:
+            yield from self._count_partition(Path(sub.name), depth + 1)
+
+
+def _record(line: bytes, count: int) -> bytes:
+    if count == 1:
+        return _ADDED + line + b"\n"
+    if count < 0:
+        return _EXCLUDED + line + b"\n"
+    return b"%s%d\t%s\n" % (_COUNTED, count, line)
+
+
+def _parse_record(record: bytes) -> tuple[bytes, int]:
+    tag = record[:1]
+    if tag == _ADDED:
+        return record[1:-1], 1
+    if tag == _EXCLUDED:
+        return record[1:-1], -1
+    count, line = record[1:-1].split(b"\t", 1)
+    return line, int(count)
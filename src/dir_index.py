@@ -0,0 +1,106 @@
+import logging
+import os
+from pathlib import Path
+
+from src.utils import match_name
+
+
+class DirectoryIndex:
+    """
+    The regular files below a directory with their stat results, from a single
+    `os.scandir` walk. The stages of a dictionary run query it instead of
+    walking the tree again, and report the files they create or delete so
+    that it stays in sync with the disk.
+    Args:
+        root (Path): The directory to index.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._stats: dict[Path, os.stat_result] = {}
+        self.scan(self.root)
+
+    def scan(self, directory: Path) -> None:
+        """
+        (Re)index a subtree, e.g. after an external tool wrote into it.
+        """
+        directory = Path(directory)
+        for path in [p for p in self._stats if directory in p.parents]:
+            del self._stats[path]
+
+        stack = [str(directory)]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError as e:
+                logging.warning(f"Skipping unreadable directory: {e}")
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            self._stats[Path(entry.path)] = entry.stat()
+                    except OSError:
+                        # Vanished or dangling symlink
+                        continue
+        logging.info(f"Indexed {len(self._stats)} files below {self.root}")
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    def __contains__(self, path: Path) -> bool:
+        return Path(path) in self._stats
+
+    def files(
+        self,
+        prefix: str | list[str] = "",
+        suffix: str | list[str] = "",
+        not_prefix: str | list[str] = "",
+        not_suffix: str | list[str] = "",
+        directory: Path | None = None,
+        recursive: bool = True,
+    ) -> list[Path]:
+        """
+        The indexed files matching the filter of `get_files_in_dir`, in walk order.
+        Args:
+            directory (Path): Only files below this directory, the root by default.
+            recursive (bool): Also files in subdirectories of `directory`.
+        """
+        directory = Path(directory) if directory is not None else self.root
+        return [
+            path
+            for path in self._stats
+            if match_name(path.name, prefix, suffix, not_prefix, not_suffix)
+            and (directory in path.parents if recursive else path.parent == directory)
+        ]
+
+    def stat(self, path: Path) -> os.stat_result:
+        """
+        The cached stat result of a file, files unknown to the index are
+        stat'ed and added.
+        """
+        path = Path(path)
+        stat = self._stats.get(path)
+        if stat is None:
+            stat = self._stats[path] = path.stat()
+        return stat
+
+    def size(self, path: Path) -> int:
+        return self.stat(path).st_size
+
+    def add(self, path: Path) -> None:
+        """
+        Record a file that was created or rewritten.
+        """
+        path = Path(path)
+        self._stats[path] = path.stat()
+
+    def remove(self, path: Path) -> None:
+        """
+        Delete a file from the disk and the index.
+        """
+        path = Path(path)
+        path.unlink(missing_ok=True)
+        self._stats.pop(path, None)
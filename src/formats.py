@@ -0,0 +1,202 @@
+import csv
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+from src.candidate import to_candidates
+
+# Text sources that are always sniffed, their name says they are no plain lists
+STRUCTURED_SUFFIXES = (".csv", ".tsv", ".jsonl")
+SOURCE_SUFFIXES = (".txt",) + STRUCTURED_SUFFIXES
+
+# How much of the head of a source `sniff` looks at
+SNIFF_SIZE = 64 * 1024
+_SNIFF_LINES = 200
+# Share of the sampled lines that must agree on a layout
+_AGREEMENT = 0.9
+# Share of the values of a column that may look like no password
+_NOT_PASSWORD_SHARE = 0.2
+
+# Column names and JSON keys of the password, in order of preference
+_PASSWORD_NAMES = ("password", "passwd", "pass", "pwd", "pw", "plaintext", "plain")
+# Columns that hold no password even though they are the last one
+_NOT_PASSWORD_RES = [
+    re.compile(rb"[^@\s]+@[^@\s]+\.\w+"),
+    re.compile(rb"[0-9a-fA-F]{32}|[0-9a-fA-F]{40}|[0-9a-fA-F]{64}|[0-9a-fA-F]{128}"),
+    re.compile(rb"\$2[aby]?\$\d\d\$[./0-9A-Za-z]{53}"),
+    re.compile(rb"\d*"),
+]
+_DELIMITERS = {"tsv": b"\t", "pipe": b"|", "csv": b","}
+
+
+@dataclass(frozen=True)
+class SourceFormat:
+    """
+    The layout of a leak source, see `sniff`.
+    Args:
+        name (str): `plain` (one password per line), `combo` (the password after
+            the first `:` or `;`), `tsv`, `pipe`, `csv` or `jsonl`.
+        column (int | str): Index of the password field of the delimited
+            layouts, key of the password for `jsonl`.
+        fields (int): Number of fields of the delimited layouts. A password in
+            the last field keeps any delimiters it contains.
+        header (bool): The first line of the source names the columns.
+    """
+
+    name: str
+    column: int | str | None = None
+    fields: int = 0
+    header: bool = False
+
+
+PLAIN = SourceFormat("plain")
+COMBO = SourceFormat("combo")
+
+
+def _is_password_name(name: bytes) -> bool:
+    return name.strip().strip(b"\"'").lower().decode("latin-1") in _PASSWORD_NAMES
+
+
+def _split_fields(line: bytes, name: str) -> list[bytes]:
+    if name == "csv":
+        row = next(csv.reader([line.decode("latin-1")]), [])
+        return [field.encode("latin-1") for field in row]
+    return line.split(_DELIMITERS[name])
+
+
+def _pick_column(rows: list[list[bytes]], fields: int) -> int:
+    # The last column that does not look like a user name, hash or id,
+    # e.g. the password of `email|hash|password` or `id,email,password,created`
+    for column in reversed(range(fields)):
+        values = [row[column].strip() for row in rows if len(row) == fields]
+        other = sum(
+            any(pattern.fullmatch(value) for pattern in _NOT_PASSWORD_RES)
+            for value in values
+        )
+        if other <= len(values) * _NOT_PASSWORD_SHARE:
+            return column
+    return fields - 1
+
+
+def _sniff_jsonl(lines: list[bytes]) -> SourceFormat | None:
+    objects = []
+    for line in lines:
+        try:
+            value = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            objects.append(value)
+    if len(objects) < len(lines) * _AGREEMENT:
+        return None
+    keys = {key.lower(): key for obj in objects for key in obj}
+    for name in _PASSWORD_NAMES:
+        if name in keys:
+            return SourceFormat("jsonl", column=keys[name])
+    return SourceFormat("jsonl")
+
+
+def _sniff_delimited(lines: list[bytes]) -> SourceFormat | None:
+    for name in _DELIMITERS:
+        rows = [_split_fields(line, name) for line in lines]
+        fields, agreeing = Counter(len(row) for row in rows).most_common(1)[0]
+        if fields < 2 or agreeing < len(rows) * _AGREEMENT:
+            continue
+        header = rows[0] if len(rows[0]) == fields else []
+        for column, value in enumerate(header):
+            if _is_password_name(value):
+                return SourceFormat(name, column, fields, header=True)
+        return SourceFormat(name, _pick_column(rows[1:] or rows, fields), fields)
+    return None
+
+
+def sniff(head: bytes) -> SourceFormat:
+    """
+    Detect the layout of a source that holds more than passwords from the
+    first lines of its head, falling back to `combo`.
+    """
+    lines = head[:SNIFF_SIZE].split(b"\n")
+    if len(head) > SNIFF_SIZE or not head.endswith(b"\n"):
+        # The last line may be cut off
+        lines = lines[:-1] or lines
+    lines = [line.rstrip(b"\r") for line in lines if line.strip()][:_SNIFF_LINES]
+    if not lines:
+        return COMBO
+    if lines[0].lstrip().startswith(b"{"):
+        return _sniff_jsonl(lines) or COMBO
+    return _sniff_delimited(lines) or COMBO
+
+
+@lru_cache(maxsize=64)
+def _field_re(fmt: SourceFormat) -> re.Pattern:
+    d = re.escape(_DELIMITERS[fmt.name])
+    # The last field runs to the end of the line, delimiters included
+    field = rb"[^\n]*" if fmt.column == fmt.fields - 1 else rb"[^%s\n]*" % d
+    return re.compile(rb"^(?:[^%s\n]*%s){%d}(%s)" % (d, d, fmt.column, field), re.M)
+
+
+def _delimited_passwords(block: bytes, fmt: SourceFormat) -> list[bytes]:
+    return _field_re(fmt).findall(block)
+
+
+def _csv_passwords(block: bytes, fmt: SourceFormat) -> list[bytes]:
+    passwords = []
+    column = fmt.column
+    last = column == fmt.fields - 1
+    # str.splitlines() would also break lines at \x85 and other bytes
+    for row in csv.reader(block.decode("latin-1").split("\n")):
+        if len(row) <= column:
+            continue
+        # An unquoted comma in the password makes more fields
+        value = ",".join(row[column:]) if last else row[column]
+        passwords.append(value.encode("latin-1"))
+    return passwords
+
+
+def _jsonl_passwords(block: bytes, fmt: SourceFormat) -> list[bytes]:
+    passwords = []
+    if fmt.column is None:
+        return passwords
+    for line in block.split(b"\n"):
+        try:
+            value = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            password = value.get(fmt.column)
+            if isinstance(password, str):
+                # Lone surrogates of "\ud800" escapes end up as $HEX[...]
+                passwords.append(password.encode("utf-8", "surrogatepass"))
+    return passwords
+
+
+_PARSERS = {
+    "tsv": _delimited_passwords,
+    "pipe": _delimited_passwords,
+    "csv": _csv_passwords,
+    "jsonl": _jsonl_passwords,
+}
+
+
+def parse_block(
+    block: bytes, fmt: SourceFormat, counts: Counter | None = None
+) -> list[bytes]:
+    """
+    Extract the candidates from a block of whole lines of a `tsv`, `pipe`,
+    `csv` or `jsonl` source. A header line must already be removed.
+    Args:
+        counts: If given, the lines of the block, the lines without the
+            password field (`no_field`) and the too short passwords are counted
+            into it.
+    """
+    passwords = _PARSERS[fmt.name](block, fmt)
+    candidates = to_candidates(passwords)
+    if counts is not None:
+        lines = block.count(b"\n") + (not block.endswith(b"\n"))
+        counts["lines_in"] += lines
+        counts["lines_out"] += len(candidates)
+        counts["no_field"] += lines - len(passwords)
+        counts["too_short"] += len(passwords) - len(candidates)
+    return candidates
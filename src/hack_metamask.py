@@ -1,19 +1,30 @@
 import glob
 import json
+import logging
+import mmap
+import multiprocessing
+import os
 import platform
 import re
 import shutil
 import tempfile
+import time
 from base64 import b64decode
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
 
 from Crypto.Cipher import AES
-from Crypto.Hash import SHA256
-from Crypto.Protocol.KDF import PBKDF2
 from termcolor import colored
+from tqdm import tqdm
 
+from src.kdf import derive_key, get_backend, set_backend
+from src.leveldb import read_keyring_vault
 
-def get_metamask_vault_path() -> Path:
+
+def get_metamask_vault_dir() -> Path:
     if platform.system() == "Darwin":
         base_path = (
             Path.home()
@@ -27,13 +38,79 @@ def get_metamask_vault_path() -> Path:
         )
     else:
         raise EnvironmentError("Unsupported OS for locating MetaMask vault.")
+    return base_path
+
 
-    vault_files = glob.glob(str(base_path / "[0-9]*.log"))
+def get_metamask_vault_path() -> Path:
+    vault_files = glob.glob(str(get_metamask_vault_dir() / "[0-9]*.log"))
     if len(vault_files) != 1:
         raise FileNotFoundError("Multiple or no MetaMask vault paths found.")
     return Path(vault_files[0])
 
 
+# Patterns of the Chromium log formats, see `parse_vault_data`
+_PRE_V3_RE = r'{"wallet-seed":"([^"}]*)"}'
+_PRE_V3_WALLET_RE = r'"wallet":("{[ -~]*\\"version\\":2}")'
+_LINUX_RE = r'"KeyringController":\{"vault":"({[^{}]*})"'
+_MACOS_RE = r'KeyringController":(\{"vault":".*?=\\"\}"\})'
+_WINDOWS_RE = r'Keyring[0-9][^\}]*({[^\{\}]*\\"\})'
+
+# Literal anchors of the patterns above. Searching a literal runs at memchr
+# speed, unlike an alternation which tests every byte.
+_VAULT_ANCHORS = (re.compile(rb"wallet"), re.compile(rb"Keyring"))
+# Bytes after an anchor in which its pattern has to match
+_ANCHOR_WINDOW = 256 * 1024
+
+
+def _pre_v3_vault(mnemonic: str, wallet: str | None) -> dict:
+    vault = json.loads(json.loads(wallet)) if wallet else {}
+    return {"data": {"mnemonic": mnemonic.replace("\\n", ""), **vault}}
+
+
+def _macos_vault(keyring_fragment: str) -> dict | None:
+    try:
+        data_regex = r'\\"data\\":\\"([A-Za-z0-9+/]*=*)'
+        iv_regex = r',\\"iv\\":\\"([A-Za-z0-9+/]{10,40}=*)'
+        salt_regex = r',\\"salt\\":\\"([A-Za-z0-9+/]{10,100}=*)\\"'
+        key_meta_regex = r',\\"keyMetadata\\":(.*}})'
+
+        vault_parts = [
+            re.search(regex, keyring_fragment).group(1)
+            for regex in [data_regex, iv_regex, salt_regex, key_meta_regex]
+        ]
+
+        return {
+            "data": vault_parts[0],
+            "iv": vault_parts[1],
+            "salt": vault_parts[2],
+            "keyMetadata": json.loads(vault_parts[3].replace("\\", "")),
+        }
+    except Exception:
+        return None
+
+
+def _windows_vault(capture: str) -> dict | None:
+    data_regex = r'\\"[^":,is]*\\":\\"([A-Za-z0-9+/]*=*)'
+    iv_regex = r'\\"iv.{1,4}[^A-Za-z0-9+/]{1,10}([A-Za-z0-9+/]{10,40}=*)'
+    salt_regex = r',\\"salt.{1,4}[^A-Za-z0-9+/]{1,10}([A-Za-z0-9+/]{10,100}=*)'
+
+    try:
+        d, i, s = [
+            re.search(r, capture).group(1) for r in [data_regex, iv_regex, salt_regex]
+        ]
+        return {"data": d, "iv": i, "salt": s}
+    except AttributeError:
+        return None
+
+
+def _single_vault(vaults: list[dict]) -> dict:
+    if not vaults:
+        raise Exception("No vaults found or metamask is closed")
+    if len(vaults) > 1:
+        raise Exception("Found multiple vaults!", vaults)
+    return vaults[0]
+
+
 def parse_vault_data(data: str):
 
     # Attempt 1: Try parsing as JSON
@@ -43,66 +120,140 @@ def parse_vault_data(data: str):
         pass
 
     # Attempt 2: Pre-v3 cleartext
-    pre_v3_matches = re.search(r'{"wallet-seed":"([^"}]*)"}', data)
+    pre_v3_matches = re.search(_PRE_V3_RE, data)
     if pre_v3_matches:
-        mnemonic = pre_v3_matches.group(1).replace("\\n", "")
-        vault_matches = re.search(r'"wallet":("{[ -~]*\\"version\\":2}")', data)
-        vault = json.loads(json.loads(vault_matches.group(1))) if vault_matches else {}
-        return {"data": {"mnemonic": mnemonic, **vault}}
+        vault_matches = re.search(_PRE_V3_WALLET_RE, data)
+        return _pre_v3_vault(
+            pre_v3_matches.group(1), vault_matches.group(1) if vault_matches else None
+        )
 
     # Attempt 3: Chromium 000003.log file (Linux)
-    linux_matches = re.search(r'"KeyringController":\{"vault":"({[^{}]*})"', data)
+    linux_matches = re.search(_LINUX_RE, data)
     if linux_matches:
         vault_body = linux_matches.group(1)
         return json.loads(vault_body)
 
     # Attempt 4: Chromium 000006.log file (MacOS)
-    macos_matches = re.search(r'KeyringController":(\{"vault":".*?=\\"\}"\})', data)
+    macos_matches = re.search(_MACOS_RE, data)
     if macos_matches:
-        keyring_fragment = macos_matches.group(1)
-        try:
-            data_regex = r'\\"data\\":\\"([A-Za-z0-9+/]*=*)'
-            iv_regex = r',\\"iv\\":\\"([A-Za-z0-9+/]{10,40}=*)'
-            salt_regex = r',\\"salt\\":\\"([A-Za-z0-9+/]{10,100}=*)\\"'
-            key_meta_regex = r',\\"keyMetadata\\":(.*}})'
-
-            vault_parts = [
-                re.search(regex, keyring_fragment).group(1)
-                for regex in [data_regex, iv_regex, salt_regex, key_meta_regex]
-            ]
-
-            return {
-                "data": vault_parts[0],
-                "iv": vault_parts[1],
-                "salt": vault_parts[2],
-                "keyMetadata": json.loads(vault_parts[3].replace("\\", "")),
-            }
-        except Exception:
-            pass
+        vault = _macos_vault(macos_matches.group(1))
+        if vault:
+            return vault
 
     # Attempt 5: Chromium 000005.ldb file (Windows)
-    windows_matches = re.finditer(r'Keyring[0-9][^\}]*({[^\{\}]*\\"\})', data)
     vaults = []
-    for match in windows_matches:
-        capture = match.group(1)
-        data_regex = r'\\"[^":,is]*\\":\\"([A-Za-z0-9+/]*=*)'
-        iv_regex = r'\\"iv.{1,4}[^A-Za-z0-9+/]{1,10}([A-Za-z0-9+/]{10,40}=*)'
-        salt_regex = r',\\"salt.{1,4}[^A-Za-z0-9+/]{1,10}([A-Za-z0-9+/]{10,100}=*)'
+    for match in re.finditer(_WINDOWS_RE, data):
+        vault = _windows_vault(match.group(1))
+        if vault:
+            vaults.append(vault)
+    return _single_vault(vaults)
+
 
+_PRE_V3_BYTES = re.compile(_PRE_V3_RE.encode())
+_PRE_V3_WALLET_BYTES = re.compile(_PRE_V3_WALLET_RE.encode())
+_LINUX_BYTES = re.compile(_LINUX_RE.encode())
+_MACOS_BYTES = re.compile(_MACOS_RE.encode())
+_WINDOWS_BYTES = re.compile(_WINDOWS_RE.encode())
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="ignore")
+
+
+def scan_vault_data(buffer) -> dict:
+    """
+    Same as `parse_vault_data`, but on the raw bytes of a LevelDB file, e.g. an
+    mmap. Only the literal anchors of the formats are searched in the whole
+    file, the format patterns run on a window after each anchor and nothing
+    else is decoded.
+    Args:
+        buffer: The file content, any object supporting the buffer protocol.
+    Returns:
+        The vault dict.
+    """
+    # Attempt 1: The whole file is JSON, LevelDB files never start with "{"
+    if bytes(buffer[:64]).lstrip()[:1] == b"{":
         try:
-            d, i, s = [
-                re.search(r, capture).group(1)
-                for r in [data_regex, iv_regex, salt_regex]
-            ]
-            vaults.append({"data": d, "iv": i, "salt": s})
-        except AttributeError:
+            return json.loads(_decode(bytes(buffer)))
+        except json.JSONDecodeError:
+            pass
+
+    size = len(buffer)
+    anchors: dict[bytes, list[int]] = {}
+    for anchor in _VAULT_ANCHORS:
+        for match in anchor.finditer(buffer):
+            pos = match.start()
+            following = bytes(buffer[pos : pos + 17])
+            if following.startswith(b"wallet-seed"):
+                key = b"wallet-seed"
+            elif following.startswith(b'wallet":"{'):
+                key = b'"wallet":"{'
+                pos -= 1
+            elif following == b"KeyringController":
+                key = b"KeyringController"
+            elif following[7:8].isdigit():
+                key = b"Keyring"
+            else:
+                continue
+            anchors.setdefault(key, []).append(pos)
+
+    def window_match(pattern: re.Pattern, pos: int) -> re.Match | None:
+        return pattern.match(buffer, max(pos, 0), min(pos + _ANCHOR_WINDOW, size))
+
+    # Attempt 2: Pre-v3 cleartext
+    for pos in anchors.get(b"wallet-seed", []):
+        seed = window_match(_PRE_V3_BYTES, pos - 2)
+        if seed:
+            wallet = None
+            for wallet_pos in anchors.get(b'"wallet":"{', []):
+                wallet_match = window_match(_PRE_V3_WALLET_BYTES, wallet_pos)
+                if wallet_match:
+                    wallet = _decode(wallet_match.group(1))
+                    break
+            return _pre_v3_vault(_decode(seed.group(1)), wallet)
+
+    # Attempt 3: Chromium 000003.log file (Linux)
+    controller = anchors.get(b"KeyringController", [])
+    for pos in controller:
+        linux_match = window_match(_LINUX_BYTES, pos - 1)
+        if linux_match:
+            return json.loads(_decode(linux_match.group(1)))
+
+    # Attempt 4: Chromium 000006.log file (MacOS)
+    for pos in controller:
+        macos_match = window_match(_MACOS_BYTES, pos)
+        if macos_match:
+            vault = _macos_vault(_decode(macos_match.group(1)))
+            if vault:
+                return vault
+            break
+
+    # Attempt 5: Chromium 000005.ldb file (Windows)
+    vaults = []
+    end = 0
+    for pos in anchors.get(b"Keyring", []):
+        # Matches do not overlap, like re.finditer
+        if pos < end:
             continue
+        windows_match = window_match(_WINDOWS_BYTES, pos)
+        if windows_match:
+            end = windows_match.end()
+            vault = _windows_vault(_decode(windows_match.group(1)))
+            if vault:
+                vaults.append(vault)
+    return _single_vault(vaults)
 
-    if not vaults:
-        raise Exception("No vaults found or metamask is closed")
-    if len(vaults) > 1:
-        raise Exception("Found multiple vaults!", vaults)
-    return vaults[0]
+
+def scan_vault_file(file_path: Path) -> dict:
+    """
+    Find the vault in a LevelDB log or ldb file with `scan_vault_data` on a
+    memory map of the file.
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise Exception("No vaults found or metamask is closed")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return scan_vault_data(mm)
 
 
 def check_vault_fileds(vault: dict) -> tuple[bytes, bytes, bytes, int]:
@@ -119,10 +270,20 @@ def check_vault_fileds(vault: dict) -> tuple[bytes, bytes, bytes, int]:
     return encrypted_data, iv, salt, iterations
 
 
-def decrypt_metamask_vault(vault_dict: dict, password: str) -> list[dict]:
-    encrypted_data, iv, salt, iterations = check_vault_fileds(vault_dict)
+def check_vault_password(
+    fields: tuple[bytes, bytes, bytes, int], password: bytes
+) -> bytes | None:
+    """
+    Derive the key for one candidate password and verify it against the GCM tag.
+    Args:
+        fields: The vault fields as returned by `check_vault_fileds`.
+        password (bytes): The candidate password, UTF-8 encoded like MetaMask does.
+    Returns:
+        The decrypted vault data, or None if the password is wrong.
+    """
+    encrypted_data, iv, salt, iterations = fields
 
-    key = PBKDF2(password, salt, dkLen=32, count=iterations, hmac_hash_module=SHA256)
+    key = derive_key(password, salt, iterations)
 
     # The tag is passed along with the data and is the last 16 bytes of the data
     tag = encrypted_data[-16:]
@@ -130,9 +291,17 @@ def decrypt_metamask_vault(vault_dict: dict, password: str) -> list[dict]:
 
     cipher = AES.new(key, AES.MODE_GCM, iv)
     try:
-        decrypted_data = cipher.decrypt_and_verify(encrypted_data, tag)
-    except Exception as e:
-        raise (f"Decryption failed: {str(e)}")
+        return cipher.decrypt_and_verify(encrypted_data, tag)
+    except ValueError:
+        return None
+
+
+def decrypt_metamask_vault(vault_dict: dict, password: str) -> list[dict]:
+    fields = check_vault_fileds(vault_dict)
+
+    decrypted_data = check_vault_password(fields, password.encode("utf-8"))
+    if decrypted_data is None:
+        raise ValueError("Decryption failed: wrong password or corrupted vault")
 
     decrypted_list = json.loads(decrypted_data)
     for item in decrypted_list:
@@ -144,15 +313,128 @@ def decrypt_metamask_vault(vault_dict: dict, password: str) -> list[dict]:
     return decrypted_list
 
 
-def extract_metamask_vault() -> dict:
-    vault_path = get_metamask_vault_path()
+@dataclass
+class WordlistResult:
+    password: bytes | None
+    checked: int
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+
+# State of a verification worker process, set once by _init_verify_worker
+_worker_fields: tuple[bytes, bytes, bytes, int] | None = None
+_worker_stop = None
+
+
+def _init_verify_worker(
+    fields: tuple[bytes, bytes, bytes, int], stop, backend: str
+) -> None:
+    global _worker_fields, _worker_stop
+    _worker_fields = fields
+    _worker_stop = stop
+    set_backend(backend)
+
+
+def _verify_batch(batch: list[bytes]) -> tuple[bytes | None, int]:
+    checked = 0
+    for password in batch:
+        # Another worker found the password, give up within one derivation
+        if _worker_stop.is_set():
+            break
+        checked += 1
+        if check_vault_password(_worker_fields, password) is not None:
+            _worker_stop.set()
+            return password, checked
+    return None, checked
+
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_file = Path(temp_dir) / vault_path.name
-        shutil.copy(vault_path, temp_file)
-        data = temp_file.read_text(encoding="utf-8", errors="ignore")
+def crack_vault_wordlist(
+    vault_dict: dict,
+    candidates: Iterable[bytes],
+    processes: int | None = None,
+    batch_size: int = 8,
+) -> WordlistResult:
+    """
+    Check candidate passwords against a vault on all cores. The vault is parsed
+    once, candidates are consumed lazily with a bounded number of batches in
+    flight, and all workers stop as soon as one candidate verifies.
+    """
+    fields = check_vault_fileds(vault_dict)
+    processes = processes or os.cpu_count() or 1
+    stop = multiprocessing.Event()
+    candidates = iter(candidates)
+
+    found = None
+    checked = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_verify_worker,
+        initargs=(fields, stop, get_backend()),
+    ) as executor, tqdm(desc="Checking candidates", unit="pw") as progress:
+        pending = set()
+
+        def submit_batches():
+            while len(pending) < processes * 2:
+                batch = list(islice(candidates, batch_size))
+                if not batch:
+                    return
+                pending.add(executor.submit(_verify_batch, batch))
+
+        submit_batches()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                password, count = future.result()
+                checked += count
+                progress.update(count)
+                if password is not None:
+                    found = password
+            if found is not None:
+                stop.set()
+                for future in pending:
+                    future.cancel()
+                break
+            submit_batches()
+
+    elapsed = time.perf_counter() - start
+    result = WordlistResult(found, checked, elapsed)
+    logging.info(
+        f"Checked {checked} candidates in {elapsed:.1f}s ({result.rate:.2f} candidates/s)"
+    )
+    return result
+
+
+def _read_vault_dir(vault_dir: Path) -> dict:
+    try:
+        return read_keyring_vault(vault_dir)
+    except PermissionError:
+        # Chrome may hold a lock on the database, read a copy instead
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_copy = Path(temp_dir) / vault_dir.name
+            shutil.copytree(vault_dir, temp_copy, ignore=shutil.ignore_patterns("LOCK"))
+            return read_keyring_vault(temp_copy)
+
+
+def extract_metamask_vault() -> dict:
+    # Read the current KeyringController record from the LevelDB database,
+    # fall back to scanning the log for formats the reader does not know
+    try:
+        return _read_vault_dir(get_metamask_vault_dir())
+    except Exception as e:
+        logging.debug(f"Structured vault lookup failed: {e}")
 
-    return parse_vault_data(data)
+    vault_path = get_metamask_vault_path()
+    try:
+        return scan_vault_file(vault_path)
+    except PermissionError:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_file = Path(temp_dir) / vault_path.name
+            shutil.copy(vault_path, temp_file)
+            return scan_vault_file(temp_file)
 
 
 def hack_metamask(password: str) -> list[dict]:
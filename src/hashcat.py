@@ -1,14 +1,38 @@
+import json
 import logging
+import subprocess
+import time
+from base64 import b64decode, b64encode
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
 from pathlib import Path
 
-from hack_metamask import check_vault_fileds
+from src.candidate import from_hex
+from src.hack_metamask import check_vault_fileds
 
+# MetaMask Wallet, decrypts the whole vault and checks the AES-GCM tag
+HASH_MODE = "26600"
+# MetaMask Wallet short hash, decrypts only the first ciphertext blocks and
+# checks them for the JSON that every vault starts with. The work per candidate
+# no longer grows with the vault, but a hit may be a false positive
+SHORT_HASH_MODE = "26610"
+_SHORT_DATA_SIZE = 32
+_SIGNATURES = {HASH_MODE: "metamask", SHORT_HASH_MODE: "metamask-short"}
 
-def generate_metamask_hash(vault_dict: dict, hashfile_path: Path) -> str:
+# hashcat exit codes
+_CRACKED, _EXHAUSTED = 0, 1
+
+
+def generate_metamask_hash(
+    vault_dict: dict, hashfile_path: Path, mode: str = HASH_MODE
+) -> str:
     try:
         data, iv, salt, iterations = check_vault_fileds(vault_dict)
 
-        hash_string = f"$metamask${salt}${iterations}${iv}${data}"
+        if mode == SHORT_HASH_MODE:
+            data = data[:_SHORT_DATA_SIZE]
+        salt, iv, data = (b64encode(field).decode() for field in (salt, iv, data))
+        hash_string = f"${_SIGNATURES[mode]}${salt}${iterations}${iv}${data}"
         logging.info("Generated hash string successfully.")
 
         hashfile_path.parent.mkdir(parents=True, exist_ok=True)
@@ -24,6 +48,251 @@ def generate_metamask_hash(vault_dict: dict, hashfile_path: Path) -> str:
         raise RuntimeError(f"Failed to generate metamask hash: {e}")
 
 
+def parse_metamask_hash(hash_string: str) -> tuple[bytes, bytes, bytes, int]:
+    """
+    The vault fields of a hash written by `generate_metamask_hash`, in the
+    order of `check_vault_fileds`. The data of a short hash is truncated.
+    """
+    parts = hash_string.strip().split("$")
+    if len(parts) != 6 or parts[1] not in _SIGNATURES.values():
+        raise ValueError("Not a MetaMask hash")
+    salt, iterations, iv, data = parts[2:]
+    return (
+        b64decode(data, validate=True),
+        b64decode(iv, validate=True),
+        b64decode(salt, validate=True),
+        int(iterations),
+    )
+
+
+def vault_from_hash(hash_string: str) -> dict:
+    """
+    The vault a full `HASH_MODE` hash was generated from, e.g. to confirm a
+    password with `decrypt_metamask_vault` without the browser profile.
+    """
+    if hash_string.startswith(f"${_SIGNATURES[SHORT_HASH_MODE]}$"):
+        raise ValueError("A short hash does not hold the whole vault")
+    data, iv, salt, iterations = parse_metamask_hash(hash_string)
+    return {
+        "data": b64encode(data).decode(),
+        "iv": b64encode(iv).decode(),
+        "salt": b64encode(salt).decode(),
+        "keyMetadata": {"algorithm": "PBKDF2", "params": {"iterations": iterations}},
+    }
+
+
+def short_hash_path(hashfile: Path) -> Path:
+    # Next to the full hash, which stays the reference for confirming hits
+    return hashfile.with_name(f"{hashfile.stem}_short{hashfile.suffix}")
+
+
+def supports_mode(executable: Path, mode: str) -> bool:
+    """
+    Check whether a hashcat binary knows a hash mode, older versions lack
+    the short MetaMask mode.
+    """
+    try:
+        result = subprocess.run(
+            [str(executable), "--hash-info", "-m", mode],
+            capture_output=True,
+            text=True,
+            errors="replace",
+            timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0 and mode in result.stdout
+
+
+def pick_hash_mode(executable: Path, fields: tuple[bytes, bytes, bytes, int]) -> str:
+    """
+    The faster hash mode the hashcat binary supports for a vault: the short
+    mode if the vault has enough data for its plaintext check, the full one
+    otherwise.
+    Args:
+        executable (Path): The hashcat binary.
+        fields: The vault fields as returned by `check_vault_fileds`.
+    """
+    data = fields[0]
+    # The GCM tag is not part of the plaintext check
+    if len(data) - 16 >= _SHORT_DATA_SIZE and supports_mode(
+        executable, SHORT_HASH_MODE
+    ):
+        logging.info(f"Using the short MetaMask hash mode {SHORT_HASH_MODE}")
+        return SHORT_HASH_MODE
+    logging.info(f"Using the MetaMask hash mode {HASH_MODE}")
+    return HASH_MODE
+
+
+@dataclass
+class HashcatStatus:
+    status: int
+    progress: int
+    total: int
+    speed: int
+    recovered: int
+    eta: float | None
+    session: str = ""
+
+    @property
+    def percent(self) -> float:
+        return 100 * self.progress / self.total if self.total else 0.0
+
+
+def parse_status_line(line: str) -> HashcatStatus | None:
+    """
+    Parse a line of `--status-json` output, other output gives None.
+    Args:
+        line (str): A line of hashcat's stdout.
+    Returns:
+        The status, with the summed speed of all devices in H/s and the
+        seconds left, or None.
+    """
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        status = json.loads(line)
+        progress, total = status["progress"]
+        recovered = status["recovered_hashes"][0]
+        speed = sum(device["speed"] for device in status.get("devices", []))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    eta = None
+    if status.get("estimated_stop"):
+        eta = max(status["estimated_stop"] - time.time(), 0.0)
+    elif speed:
+        eta = (total - progress) / speed
+    return HashcatStatus(
+        status["status"],
+        progress,
+        total,
+        speed,
+        recovered,
+        eta,
+        status.get("session", ""),
+    )
+
+
+def _format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours:02}:{minutes:02}:{seconds:02}"
+
+
+def log_status(status: HashcatStatus) -> None:
+    logging.info(
+        f"Progress {status.progress}/{status.total} ({status.percent:.2f}%), "
+        f"{status.speed} H/s, ETA {_format_eta(status.eta)}"
+    )
+
+
+def run_hashcat(
+    executable: Path,
+    hashfile: Path,
+    attacks: Sequence[Sequence[str]],
+    session: str = "maskcracker",
+    status_timer: int = 10,
+    on_status: Callable[[HashcatStatus], None] = log_status,
+    names: Sequence[str] | None = None,
+    on_exhausted: Callable[[int], None] | None = None,
+    mode: str = HASH_MODE,
+) -> str | None:
+    """
+    Run the attacks one after another under supervision until one cracks the
+    hash. Every attack runs in its own hashcat session with the restore file
+    next to the hashfile, a later run restores the last interrupted attack and
+    skips the attacks before it, which were exhausted. With `names` the caller
+    drops exhausted attacks itself, so interrupted attacks are restored first
+    and every other attack runs after them.
+    Args:
+        executable (Path): The hashcat binary.
+        hashfile (Path): The file written by `generate_metamask_hash`.
+        attacks: The attack arguments, e.g. `["-a", "0", "dict.txt"]`.
+        session (str): Prefix of the hashcat session names.
+        status_timer (int): Seconds between status updates.
+        on_status: Called with every status update.
+        names: Session name suffixes of the attacks, their index by default.
+            Stable names keep a restore file with its attack when the list of
+            attacks changes between runs.
+        on_exhausted: Called with the index of every exhausted attack.
+        mode (str): The hash mode of the hashfile.
+    Returns:
+        The password, or None if all attacks are exhausted.
+    """
+    work_dir = hashfile.resolve().parent
+    outfile = work_dir / f"{session}.cracked"
+    # Without names, an attack's session only identifies its position
+    positional = names is None
+    if positional:
+        names = [str(i) for i in range(len(attacks))]
+    sessions = [f"{session}_{name}" for name in names]
+    restore_files = [work_dir / f"{name}.restore" for name in sessions]
+    interrupted = [i for i, path in enumerate(restore_files) if path.exists()]
+    if positional:
+        order = range(interrupted[-1] if interrupted else 0, len(attacks))
+    else:
+        # Attacks added in front of an interrupted one since the last run
+        order = interrupted + [i for i in range(len(attacks)) if i not in interrupted]
+
+    for i in order:
+        name = sessions[i]
+        if restore_files[i].exists():
+            logging.info(f"Restoring hashcat session {name}")
+            # hashcat restores every other argument from the restore file
+            args = ["--restore"]
+        else:
+            logging.info(f"Starting hashcat session {name}: {' '.join(attacks[i])}")
+            args = [
+                "-m",
+                mode,
+                "--self-test-disable",
+                "--status",
+                "--status-json",
+                f"--status-timer={status_timer}",
+                f"--outfile={outfile}",
+                "--outfile-format=2",
+                str(hashfile.resolve()),
+                *attacks[i],
+            ]
+        command = [
+            str(executable),
+            f"--session={name}",
+            f"--restore-file-path={restore_files[i]}",
+            *args,
+        ]
+
+        with subprocess.Popen(
+            command, stdout=subprocess.PIPE, text=True, errors="replace"
+        ) as process:
+            for line in process.stdout:
+                status = parse_status_line(line)
+                if status is not None:
+                    on_status(status)
+                elif line.strip():
+                    logging.debug(line.rstrip())
+        returncode = process.returncode
+
+        if returncode == _CRACKED:
+            lines = outfile.read_bytes().splitlines()
+            # hashcat writes non-ASCII plains as $HEX[...]
+            return from_hex(lines[-1]).decode("utf-8", "replace") if lines else None
+        if returncode != _EXHAUSTED:
+            raise RuntimeError(
+                f"hashcat session {name} stopped with exit code {returncode}, "
+                "run again to restore it"
+            )
+        logging.info(f"hashcat session {name} exhausted")
+        restore_files[i].unlink(missing_ok=True)
+        if on_exhausted is not None:
+            on_exhausted(i)
+    return None
+
+
 # Example usage
 if __name__ == "__main__":
     vault_example = {
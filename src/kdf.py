@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import time
+from collections.abc import Callable
+
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import PBKDF2
+
+# MetaMask derives a 32-byte AES key with PBKDF2-HMAC-SHA256
+KEY_LENGTH = 32
+# Iterations used to rank the backends at startup, high enough to hide call overhead
+_SELECTION_ITERATIONS = 20_000
+
+
+def _hashlib_pbkdf2(password: bytes, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password, salt, iterations, KEY_LENGTH)
+
+
+def _pycryptodome_pbkdf2(password: bytes, salt: bytes, iterations: int) -> bytes:
+    return PBKDF2(
+        password, salt, dkLen=KEY_LENGTH, count=iterations, hmac_hash_module=SHA256
+    )
+
+
+def _cryptography_pbkdf2(password: bytes, salt: bytes, iterations: int) -> bytes:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(), length=KEY_LENGTH, salt=salt, iterations=iterations
+    )
+    return kdf.derive(password)
+
+
+KDF_BACKENDS: dict[str, Callable[[bytes, bytes, int], bytes]] = {
+    "hashlib": _hashlib_pbkdf2,
+    "pycryptodome": _pycryptodome_pbkdf2,
+    "cryptography": _cryptography_pbkdf2,
+}
+
+_selected: str | None = None
+
+
+def available_backends() -> list[str]:
+    backends = ["hashlib", "pycryptodome"]
+    try:
+        import cryptography  # noqa: F401
+
+        backends.append("cryptography")
+    except ImportError:
+        pass
+    return backends
+
+
+def benchmark_backends(
+    iterations: int, rounds: int = 3, backends: list[str] | None = None
+) -> dict[str, float]:
+    """
+    Measure PBKDF2-HMAC-SHA256 derivations per second of each backend.
+    Args:
+        iterations (int): PBKDF2 iterations per derivation, use the vault's own count.
+        rounds (int): Derivations per backend, the best one is reported.
+    Returns:
+        Derivations per second by backend name, fastest first.
+    """
+    salt = b"\x00" * 32
+    results = {}
+    for name in backends or available_backends():
+        derive = KDF_BACKENDS[name]
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            derive(b"benchmark-password", salt, iterations)
+            best = min(best, time.perf_counter() - start)
+        results[name] = 1 / best if best > 0 else float("inf")
+    return dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+
+
+def set_backend(name: str | None = None) -> str:
+    """
+    Select the KDF backend used by `derive_key`. Without a name the fastest
+    available backend is picked by a short benchmark.
+    Returns:
+        The selected backend name.
+    """
+    global _selected
+    if name is None:
+        results = benchmark_backends(_SELECTION_ITERATIONS, rounds=1)
+        name = next(iter(results))
+        logging.info(
+            "KDF backend speeds: "
+            + ", ".join(
+                f"{n} {r * _SELECTION_ITERATIONS:,.0f} it/s" for n, r in results.items()
+            )
+            + f", using {name}"
+        )
+    elif name not in available_backends():
+        raise ValueError(
+            f"Unknown or unavailable KDF backend {name}, choose from {available_backends()}"
+        )
+    _selected = name
+    return name
+
+
+def get_backend() -> str:
+    if _selected is None:
+        return set_backend()
+    return _selected
+
+
+def derive_key(password: bytes, salt: bytes, iterations: int) -> bytes:
+    return KDF_BACKENDS[get_backend()](password, salt, iterations)
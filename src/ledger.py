@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from src.shard_index import ShardIndex
+
+LEDGER_NAME = ".ledger.json"
+LEDGER_VERSION = 1
+
+
+def vault_fingerprint(fields: tuple[bytes, bytes, bytes, int]) -> str:
+    """
+    Identifies a vault by what determines its keys, so a re-encrypted vault
+    gets a ledger of its own.
+    Args:
+        fields: The vault fields as returned by `check_vault_fileds`.
+    """
+    _, iv, salt, iterations = fields
+    h = hashlib.blake2b(digest_size=16)
+    h.update(salt + b"$" + iv + b"$" + str(iterations).encode())
+    return h.hexdigest()
+
+
+def shard_checksum(shard: Path) -> str:
+    """
+    Identifies the content of a shard by its index, without reading it. A
+    renamed shard keeps its checksum, an extended or rebuilt one does not.
+    """
+    index = ShardIndex.for_shard(shard)
+    return f"{index.crc32:08x}-{index.size}-{index.lines}"
+
+
+def verify_shard(shard: Path, full: bool = False) -> bool:
+    """
+    Check a shard against its index before the ledger trusts its checksum. A
+    shard that changed without its index, e.g. edited in place, is indexed
+    again and so gets a checksum of its own.
+    Args:
+        shard (Path): The shard.
+        full (bool): Compare the crc32 of the content even if the size and
+            modification time of the shard are unchanged.
+    Returns:
+        Whether the shard matched its index.
+    """
+    index = ShardIndex.for_shard(shard)
+    if not full and index.unchanged(shard):
+        return True
+    if index.verify(shard):
+        # Only touched, or the index predates the modification time
+        index.save(shard)
+        return True
+    logging.warning(f"{shard.name} does not match its index, indexing it again")
+    ShardIndex.build(shard).save(shard)
+    return False
+
+
+def files_checksum(files: list[Path]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for file in files:
+        h.update(file.read_bytes())
+    return h.hexdigest()
+
+
+class VaultLedger:
+    """
+    Persistent record of the attacks already run against one vault, stored
+    in `.ledger.json` of a dictionary directory next to the ledgers of other
+    vaults. Attacks are keyed by the checksum of their wordlist, e.g.
+    `shard_checksum`, and either fully tested or tested up to a number of
+    candidates, the `--skip` to continue with.
+    Args:
+        directory (Path): The dictionary directory.
+        fingerprint (str): The `vault_fingerprint` of the vault.
+    """
+
+    def __init__(self, directory: Path, fingerprint: str):
+        self.path = Path(directory) / LEDGER_NAME
+        self.fingerprint = fingerprint
+        self.attacks: dict[str, dict] = _load(self.path).get(fingerprint, {})
+
+    def tested(self, key: str) -> bool:
+        return self.attacks.get(key, {}).get("tested", False)
+
+    def progress(self, key: str) -> int:
+        """
+        Number of candidates of a partially tested attack that are done.
+        """
+        return self.attacks.get(key, {}).get("progress", 0)
+
+    def record_progress(self, key: str, name: str, progress: int) -> None:
+        entry = self.attacks.setdefault(key, {"tested": False, "progress": 0})
+        if progress <= entry["progress"]:
+            return
+        entry.update(name=name, progress=progress, updated_at=_now())
+
+    def mark_tested(self, key: str, name: str) -> None:
+        entry = self.attacks.setdefault(key, {"progress": 0})
+        entry.update(name=name, tested=True, updated_at=_now())
+
+    def save(self) -> None:
+        # Other vaults may have been recorded since this ledger was loaded
+        vaults = _load(self.path)
+        vaults[self.fingerprint] = self.attacks
+        data = {"version": LEDGER_VERSION, "vaults": vaults}
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        temp_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        os.replace(temp_path, self.path)
+
+
+def covered_checksums(directory: Path) -> set[str]:
+    """
+    Checksums of the shards tested, fully or in part, against any vault in
+    the ledger of a dictionary directory. Such shards are not extended, so
+    what was tested stays valid.
+    """
+    return {
+        key
+        for attacks in _load(Path(directory) / LEDGER_NAME).values()
+        for key in attacks
+    }
+
+
+def _load(path: Path) -> dict[str, dict]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    if data.get("version") != LEDGER_VERSION:
+        raise ValueError(f"Unsupported ledger version in {path}")
+    return data["vaults"]
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
@@ -0,0 +1,253 @@
+import json
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+
+# Log files are split into blocks, a record never spans a block header
+_LOG_BLOCK_SIZE = 32 * 1024
+_LOG_HEADER_SIZE = 7
+_FULL, _FIRST, _MIDDLE, _LAST = 1, 2, 3, 4
+
+_TABLE_MAGIC = 0xDB4775248B80FB57
+_FOOTER_SIZE = 48
+_NO_COMPRESSION, _SNAPPY_COMPRESSION = 0, 1
+
+_TYPE_DELETION, _TYPE_VALUE = 0, 1
+
+# Storage keys under which MetaMask keeps the keyring, newer versions store
+# every controller under its own key instead of a single "data" object
+_VAULT_KEYS = (b"KeyringController", b"data")
+
+# key, sequence number, value or None for a deletion
+Entry = tuple[bytes, int, bytes | None]
+
+
+def _varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def snappy_decompress(data: bytes) -> bytes:
+    """
+    Decompress a raw Snappy block, as used by LevelDB table blocks.
+    """
+    length, pos = _varint(data, 0)
+    out = bytearray()
+    while pos < len(data):
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:
+            # Literal, long lengths follow the tag in 1-4 bytes
+            n = tag >> 2
+            if n >= 60:
+                extra = n - 59
+                n = int.from_bytes(data[pos : pos + extra], "little")
+                pos += extra
+            n += 1
+            out += data[pos : pos + n]
+            pos += n
+            continue
+
+        if kind == 1:
+            n = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif kind == 2:
+            n = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos : pos + 2], "little")
+            pos += 2
+        else:
+            n = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos : pos + 4], "little")
+            pos += 4
+        if not 0 < offset <= len(out):
+            raise ValueError("Invalid Snappy copy offset")
+        start = len(out) - offset
+        if offset >= n:
+            out += out[start : start + n]
+        else:
+            # Overlapping copy, repeats the last `offset` bytes
+            out += (out[start:] * (n // offset + 1))[:n]
+
+    if len(out) != length:
+        raise ValueError("Snappy block length mismatch")
+    return bytes(out)
+
+
+def iter_log_records(data) -> Iterator[bytes]:
+    """
+    Yield the records of a LevelDB log, joining records fragmented over blocks.
+    Checksums are not verified, a truncated tail ends the iteration.
+    Args:
+        data: The file content, bytes or an mmap.
+    """
+    pos = 0
+    fragments: list[bytes] = []
+    while pos + _LOG_HEADER_SIZE <= len(data):
+        block_left = _LOG_BLOCK_SIZE - pos % _LOG_BLOCK_SIZE
+        if block_left < _LOG_HEADER_SIZE:
+            # Trailer padding of the block
+            pos += block_left
+            continue
+        length, record_type = struct.unpack_from("<HB", data, pos + 4)
+        start = pos + _LOG_HEADER_SIZE
+        end = start + length
+        if end > len(data) or length > block_left - _LOG_HEADER_SIZE:
+            return
+        pos = end
+        if record_type == _FULL:
+            fragments = []
+            yield data[start:end]
+        elif record_type == _FIRST:
+            fragments = [data[start:end]]
+        elif record_type == _MIDDLE and fragments:
+            fragments.append(data[start:end])
+        elif record_type == _LAST and fragments:
+            fragments.append(data[start:end])
+            yield b"".join(fragments)
+            fragments = []
+
+
+def iter_log_entries(data) -> Iterator[Entry]:
+    """
+    Yield the key/value pairs of the write batches in a LevelDB `.log` file.
+    """
+    for record in iter_log_records(data):
+        if len(record) < 12:
+            continue
+        sequence, count = struct.unpack_from("<QI", record)
+        pos = 12
+        try:
+            for i in range(count):
+                tag = record[pos]
+                key_length, pos = _varint(record, pos + 1)
+                key = record[pos : pos + key_length]
+                pos += key_length
+                value = None
+                if tag == _TYPE_VALUE:
+                    value_length, pos = _varint(record, pos)
+                    value = record[pos : pos + value_length]
+                    pos += value_length
+                elif tag != _TYPE_DELETION:
+                    break
+                yield key, sequence + i, value
+        except IndexError:
+            # Batch cut off at the end of the log
+            continue
+
+
+def _read_block(data, handle: tuple[int, int]) -> bytes:
+    offset, size = handle
+    block = data[offset : offset + size]
+    compression = data[offset + size]
+    if compression == _SNAPPY_COMPRESSION:
+        return snappy_decompress(block)
+    if compression != _NO_COMPRESSION:
+        raise ValueError(f"Unsupported block compression {compression}")
+    return block
+
+
+def _iter_block(block: bytes) -> Iterator[tuple[bytes, bytes]]:
+    num_restarts = struct.unpack_from("<I", block, len(block) - 4)[0]
+    limit = len(block) - 4 - 4 * num_restarts
+    pos = 0
+    key = b""
+    while pos < limit:
+        shared, pos = _varint(block, pos)
+        non_shared, pos = _varint(block, pos)
+        value_length, pos = _varint(block, pos)
+        key = key[:shared] + block[pos : pos + non_shared]
+        pos += non_shared
+        yield key, block[pos : pos + value_length]
+        pos += value_length
+
+
+def iter_table_entries(data) -> Iterator[Entry]:
+    """
+    Yield the key/value pairs of a LevelDB table (`.ldb`/`.sst`) file, reading
+    data blocks one at a time through the index block.
+    """
+    if len(data) < _FOOTER_SIZE:
+        raise ValueError("File too short for a LevelDB table")
+    footer = data[-_FOOTER_SIZE:]
+    if struct.unpack_from("<Q", footer, _FOOTER_SIZE - 8)[0] != _TABLE_MAGIC:
+        raise ValueError("Not a LevelDB table")
+    # Skip the metaindex handle
+    _, pos = _varint(footer, 0)
+    _, pos = _varint(footer, pos)
+    index_offset, pos = _varint(footer, pos)
+    index_size, _ = _varint(footer, pos)
+
+    for _, handle in _iter_block(_read_block(data, (index_offset, index_size))):
+        offset, pos = _varint(handle, 0)
+        size, _ = _varint(handle, pos)
+        for internal_key, value in _iter_block(_read_block(data, (offset, size))):
+            trailer = struct.unpack_from("<Q", internal_key, len(internal_key) - 8)[0]
+            value_type = trailer & 0xFF
+            yield internal_key[:-8], trailer >> 8, (
+                value if value_type == _TYPE_VALUE else None
+            )
+
+
+def iter_entries(directory: Path) -> Iterator[Entry]:
+    """
+    Yield the key/value pairs of all `.log` and `.ldb` files of a LevelDB
+    database directory, in no particular order. Use the sequence numbers to
+    find the current value of a key.
+    """
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix == ".log":
+            parse = iter_log_entries
+        elif path.suffix in (".ldb", ".sst"):
+            parse = iter_table_entries
+        else:
+            continue
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            # Only the blocks that are parsed get paged in
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from parse(mm)
+
+
+def _vault_from_value(key: bytes, value: bytes) -> dict | None:
+    try:
+        state = json.loads(value)
+        if key == b"data":
+            state = state["KeyringController"]
+        vault = state["vault"]
+        return json.loads(vault) if isinstance(vault, str) else vault
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def read_keyring_vault(directory: Path) -> dict:
+    """
+    Read the current MetaMask vault from the extension's LevelDB directory,
+    i.e. the `KeyringController` value with the highest sequence number.
+    Stale copies of the vault in older records are ignored.
+    """
+    newest: dict[bytes, tuple[int, bytes | None]] = {}
+    for key, sequence, value in iter_entries(directory):
+        if key in _VAULT_KEYS and sequence >= newest.get(key, (-1, None))[0]:
+            newest[key] = (sequence, value)
+
+    candidates = sorted(
+        (sequence, key, value)
+        for key, (sequence, value) in newest.items()
+        if value is not None
+    )
+    for _, key, value in reversed(candidates):
+        vault = _vault_from_value(key, value)
+        if vault:
+            return vault
+    raise Exception("No vaults found or metamask is closed")
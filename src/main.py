@@ -1,23 +1,117 @@
 import argparse
+import contextlib
 import logging
+import os
+import platform
+import sys
 from pathlib import Path
 
+from src.candidate import iter_wordlist
 from src.generate_dic import generate_dict
 from src.hack_chrome_password import beauty_print_chrome, hack_chrome_login_info
 from src.hack_metamask import (
     beauty_print_metamask,
+    check_vault_fileds,
+    crack_vault_wordlist,
+    decrypt_metamask_vault,
     extract_metamask_vault,
     hack_metamask,
 )
-from src.hashcat import generate_metamask_hash
+from src.hashcat import (
+    HASH_MODE,
+    SHORT_HASH_MODE,
+    HashcatStatus,
+    generate_metamask_hash,
+    log_status,
+    parse_metamask_hash,
+    pick_hash_mode,
+    run_hashcat,
+    short_hash_path,
+    vault_from_hash,
+)
+from src.kdf import KDF_BACKENDS, benchmark_backends, set_backend
+from src.ledger import (
+    VaultLedger,
+    files_checksum,
+    shard_checksum,
+    vault_fingerprint,
+    verify_shard,
+)
+from src.mutate import write_mutation_files
+from src.pcfg import ShardFilter, load_or_train, write_guesses
+from src.shard_index import count_lines, find_shards, shard_glob
+from src.stats import PipelineStats
 
 
-def generate_dict_command(directory: Path, chrome_pass: bool) -> None:
+def generate_dict_command(
+    directory: Path,
+    chrome_pass: bool,
+    dedup: bool,
+    memory_limit: int,
+    processes: int,
+    incremental: bool,
+    rank: bool,
+    compress: bool,
+    stats_json: Path | None,
+    profile: Path | None,
+    model: bool,
+    model_budget: int,
+    model_output: str,
+    model_train_lines: int,
+) -> None:
     # Execute the generate-dict sub-command
+    if model:
+        generate_model_candidates(
+            directory, chrome_pass, model_budget, model_output, model_train_lines
+        )
+        return
     logging.info(
         f"Generating dictionary in {directory}, chrome passwords included: {chrome_pass}"
     )
-    generate_dict(directory, chrome_pass)
+    stats = None
+    if stats_json or profile:
+        stats = PipelineStats(trace_memory=stats_json is not None, profile_path=profile)
+    try:
+        generate_dict(
+            directory,
+            chrome_pass,
+            dedup=dedup,
+            memory_limit=memory_limit,
+            processes=processes,
+            incremental=incremental,
+            rank=rank,
+            compress=compress,
+            stats=stats,
+        )
+    finally:
+        # Also report a failed run, up to the stage that failed
+        if stats_json:
+            stats.write(stats_json)
+        if profile:
+            stats.dump_profile()
+
+
+def generate_model_candidates(
+    directory: Path, chrome_pass: bool, budget: int, output: str, train_lines: int
+) -> None:
+    # Train a model on the existing shards, or load it, and stream its guesses
+    shards = find_shards(directory)
+    personal = []
+    if chrome_pass:
+        personal = [info.password for info in hack_chrome_login_info()]
+    if not shards and not personal:
+        logging.error(f"No shards in {directory} to train the model on")
+        return
+    model = load_or_train(directory, shards, personal, max_lines=train_lines)
+    # Candidates of the shards are attacked, or were tested, on their own
+    exclude = ShardFilter(shards)
+    logging.info(f"Writing the {budget} most likely candidates to {output}")
+    with (
+        contextlib.nullcontext(sys.stdout.buffer)
+        if output == "-"
+        else open(output, "wb")
+    ) as f:
+        write_guesses(model, f, budget, exclude)
 
 
 def chrome_password_command() -> None:
@@ -26,13 +120,133 @@ def chrome_password_command() -> None:
     beauty_print_chrome(login_infos)
 
 
-def decrypt_metamask_command(password: str) -> None:
+def decrypt_metamask_command(
+    password: str | None, wordlist: str | None, processes: int
+) -> None:
     # Execute the decrypt-metamask sub-command
-    decrypted_data = hack_metamask(password)
-    beauty_print_metamask(decrypted_data)
+    if wordlist is None:
+        decrypted_data = hack_metamask(password)
+        beauty_print_metamask(decrypted_data)
+        return
+
+    vault = extract_metamask_vault()
+    with (
+        contextlib.nullcontext(sys.stdin.buffer)
+        if wordlist == "-"
+        else open(wordlist, "rb")
+    ) as f:
+        result = crack_vault_wordlist(vault, iter_wordlist(f), processes=processes)
+
+    if result.password is None:
+        logging.info("None of the candidates is the MetaMask password")
+        return
+    password = result.password.decode("utf-8")
+    logging.info(f"Found MetaMask password: {password}")
+    beauty_print_metamask(decrypt_metamask_vault(vault, password))
+
+
+def benchmark_kdf_command(iterations: int | None, rounds: int) -> None:
+    # Execute the benchmark-kdf sub-command
+    if iterations is None:
+        _, _, _, iterations = check_vault_fileds(extract_metamask_vault())
+    logging.info(f"Benchmarking PBKDF2-HMAC-SHA256 with {iterations} iterations")
+
+    results = benchmark_backends(iterations, rounds)
+    for i, (name, rate) in enumerate(results.items()):
+        fastest = " (fastest)" if i == 0 else ""
+        print(f"{name:<14} {rate:10.2f} derivations/s{fastest}")
 
 
-def prepare_hashcat_command(hashfile: Path, dict_dir: Path) -> None:
+def hashcat_attacks(
+    hashfile: Path,
+    dict_dir: Path,
+    chrome_rules: bool,
+    ledger: VaultLedger | None = None,
+    verify_shards: bool = False,
+) -> list[tuple[str, list[str]]]:
+    # Attacks in order of priority with the ledger key of their wordlist. The
+    # rule attack on the user's own Chrome passwords is small and the most
+    # likely to succeed, then every shard, tier by tier, highest first
+    attacks = []
+    if chrome_rules:
+        passwords = [info.password for info in hack_chrome_login_info()]
+        base_path, rule_path = write_mutation_files(passwords, hashfile.parent)
+        attacks.append(
+            (
+                files_checksum([base_path, rule_path]),
+                ["-a", "0", str(base_path.resolve()), "-r", str(rule_path.resolve())],
+            )
+        )
+    shards = {}
+    for shard in find_shards(dict_dir):
+        key = shard_checksum(shard)
+        # A ledger entry is only trusted for the content it was recorded for,
+        # read the shard again only if its size or mtime changed or if asked
+        if (
+            ledger is not None
+            and key in ledger.attacks
+            and not verify_shard(shard, full=verify_shards)
+        ):
+            key = shard_checksum(shard)
+        shards[key] = shard
+        attacks.append((key, ["-a", "0", str(shard.resolve())]))
+    if ledger is None:
+        return attacks
+
+    # Leave out what was already tested against this vault and continue
+    # partially tested shards where they stopped
+    remaining = []
+    for key, attack in attacks:
+        progress = ledger.progress(key)
+        # hashcat refuses to skip the whole wordlist
+        done = key in shards and progress >= count_lines([shards[key]])
+        if ledger.tested(key) or done:
+            logging.info(f"Skipping {attack[2]}, already tested against this vault")
+            continue
+        if progress:
+            logging.info(f"Continuing {attack[2]} after {progress} candidates")
+            attack = [f"--skip={progress}", *attack]
+        remaining.append((key, attack))
+    untested = {key: shards[key] for key, _ in remaining if key in shards}
+    left = count_lines(list(untested.values())) - sum(map(ledger.progress, untested))
+    logging.info(f"{left} candidates left in {len(untested)} shards")
+    return remaining
+
+
+def hashcat_target(
+    hashfile: Path,
+    fields: tuple[bytes, bytes, bytes, int],
+    executable: Path,
+    hash_mode: str,
+) -> tuple[Path, str]:
+    # The hashfile and mode hashcat attacks, the short hash next to the full
+    # one if the short mode is faster and supported
+    if hash_mode == "auto":
+        hash_mode = pick_hash_mode(executable, fields)
+    if hash_mode != SHORT_HASH_MODE:
+        return hashfile, hash_mode
+    # The short hash is cut from the full one, no need for the browser
+    target = short_hash_path(hashfile)
+    generate_metamask_hash(vault_from_hash(hashfile.read_text()), target, hash_mode)
+    return target, hash_mode
+
+
+def confirm_password(hashfile: Path, password: str) -> bool:
+    # A short mode hit only matched the first blocks, the full vault decides
+    try:
+        decrypt_metamask_vault(vault_from_hash(hashfile.read_text()), password)
+    except ValueError:
+        return False
+    return True
+
+
+def prepare_hashcat_command(
+    hashfile: Path,
+    dict_dir: Path,
+    chrome_rules: bool,
+    hash_mode: str = "auto",
+    verify_shards: bool = False,
+) -> None:
     # Execute the prepare-hashcat sub-command
     logging.info(
         f"Preparing hashcat with hashfile: {hashfile}, dictionary directory: {dict_dir}"
@@ -40,15 +254,32 @@ def prepare_hashcat_command(hashfile: Path, dict_dir: Path) -> None:
 
     vault = extract_metamask_vault()
     generate_metamask_hash(vault_dict=vault, hashfile_path=hashfile)
+    fields = check_vault_fileds(vault)
+    ledger = VaultLedger(dict_dir, vault_fingerprint(fields))
 
     repo_path = Path(__file__).resolve().parent.parent
     hashcat_repo_path = repo_path / "hashcat"
-    dictionary_path = dict_dir / "plain_pass_*"
+    name = "hashcat.exe" if platform.system() == "Windows" else "hashcat"
+    target, hash_mode = hashcat_target(
+        hashfile, fields, hashcat_repo_path / name, hash_mode
+    )
+    attacks = [
+        " ".join(attack)
+        for _, attack in hashcat_attacks(
+            hashfile, dict_dir, chrome_rules, ledger, verify_shards
+        )
+    ]
+    if not find_shards(dict_dir):
+        # The dictionary may still be generated after the scripts
+        attacks.append(str((dict_dir / shard_glob(dict_dir)).resolve()))
 
     # Linux or macOS
     bash_path = repo_path / "run_hashcat.sh"
     execute_path = hashcat_repo_path / "hashcat"
-    bash_script = f"{execute_path} -m 26600 --self-test-disable {hashfile.resolve()} {dictionary_path.resolve()}\n"
+    bash_script = "".join(
+        f"{execute_path} -m {hash_mode} --self-test-disable {target.resolve()} {attack}\n"
+        for attack in attacks
+    )
     bash_path.write_text(bash_script)
     logging.info(f"Generated bash script at {bash_path}")
 
@@ -57,13 +288,89 @@ def prepare_hashcat_command(hashfile: Path, dict_dir: Path) -> None:
     bat_script = (
         "@echo off\n"
         f'pushd "{hashcat_repo_path.resolve()}"\n'
-        f"hashcat.exe -m 26600 --self-test-disable {hashfile.resolve()} {dictionary_path.resolve()}\n"
-        "popd\n"
+        + "".join(
+            f"hashcat.exe -m {hash_mode} --self-test-disable {target.resolve()} {attack}\n"
+            for attack in attacks
+        )
+        + "popd\n"
     )
     bat_path.write_text(bat_script)
     logging.info(f"Generated batch script at {bat_path}")
 
 
+def run_hashcat_command(
+    hashfile: Path,
+    dict_dir: Path,
+    chrome_rules: bool,
+    session: str,
+    status_timer: int,
+    executable: Path | None,
+    hash_mode: str = "auto",
+    verify_shards: bool = False,
+) -> None:
+    # Execute the run-hashcat sub-command
+    if hashfile.exists():
+        fields = parse_metamask_hash(hashfile.read_text())
+    else:
+        vault = extract_metamask_vault()
+        generate_metamask_hash(vault_dict=vault, hashfile_path=hashfile)
+        fields = check_vault_fileds(vault)
+    if executable is None:
+        name = "hashcat.exe" if platform.system() == "Windows" else "hashcat"
+        executable = Path(__file__).resolve().parent.parent / "hashcat" / name
+
+    ledger = VaultLedger(dict_dir, vault_fingerprint(fields))
+    keys, attacks = [], []
+    for key, attack in hashcat_attacks(
+        hashfile, dict_dir, chrome_rules, ledger, verify_shards
+    ):
+        keys.append(key)
+        attacks.append(attack)
+    sessions = {f"{session}_{key}": i for i, key in enumerate(keys)}
+    # The wordlist of every attack, the base words of a rule attack
+    labels = [a[a.index("-r") - 1] if "-r" in a else a[-1] for a in attacks]
+
+    def on_status(status: HashcatStatus) -> None:
+        log_status(status)
+        i = sessions.get(status.session)
+        # Progress of a rule attack counts candidates, not words to skip
+        if i is not None and "-r" not in attacks[i]:
+            ledger.record_progress(keys[i], labels[i], status.progress)
+            ledger.save()
+
+    def on_exhausted(i: int) -> None:
+        # A shard changed during the attack was not tested as recorded
+        if "-r" not in attacks[i] and not verify_shard(
+            Path(labels[i]), full=verify_shards
+        ):
+            return
+        ledger.mark_tested(keys[i], labels[i])
+        ledger.save()
+
+    target, hash_mode = hashcat_target(hashfile, fields, executable, hash_mode)
+    password = run_hashcat(
+        executable,
+        target,
+        attacks,
+        session=session,
+        status_timer=status_timer,
+        on_status=on_status,
+        names=keys,
+        on_exhausted=on_exhausted,
+        mode=hash_mode,
+    )
+    if password is None:
+        logging.info("All attacks exhausted without finding the password")
+        return
+    if not confirm_password(hashfile, password):
+        logging.error(
+            f"hashcat reported {password}, but it does not decrypt the vault. "
+            f"Run again with --hash-mode {HASH_MODE} to attack the full vault"
+        )
+        return
+    logging.info(f"Found MetaMask password: {password}")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Test your Metamask's security if a hacker invades your computer"
@@ -80,6 +387,71 @@ def main() -> None:
         action="store_true",
         help="Include Chrome passwords in dictionary",
     )
+    parser_generate.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Keep duplicate passwords instead of removing them",
+    )
+    parser_generate.add_argument(
+        "--memory-limit",
+        type=int,
+        default=1024,
+        help="Memory budget in MB for deduplication, spills to disk beyond it",
+    )
+    parser_generate.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes that parse the text sources in parallel ranges (1 parses on the reader threads)",
+    )
+    parser_generate.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep the sources and only append passwords from sources not in the manifest yet",
+    )
+    parser_generate.add_argument(
+        "--rank",
+        action="store_true",
+        help="Write the most frequent passwords across all sources first",
+    )
+    parser_generate.add_argument(
+        "--compress",
+        action="store_true",
+        help="Write gzip compressed plain_pass_*.txt.gz shards, compressed in parallel",
+    )
+    parser_generate.add_argument(
+        "--stats-json",
+        type=str,
+        help="Write a JSON report with time, bytes, lines, rejections and memory of every stage",
+    )
+    parser_generate.add_argument(
+        "--profile",
+        type=str,
+        help="Write a cProfile dump of the flatten loop to this file",
+    )
+    parser_generate.add_argument(
+        "--model",
+        action="store_true",
+        help="Instead of building shards, train a PCFG model on them and stream its most likely candidates",
+    )
+    parser_generate.add_argument(
+        "--model-budget",
+        type=int,
+        default=10_000_000,
+        help="Number of candidates the model generates",
+    )
+    parser_generate.add_argument(
+        "--model-output",
+        type=str,
+        default="-",
+        help="File the model candidates are written to, - for stdout",
+    )
+    parser_generate.add_argument(
+        "--model-train-lines",
+        type=int,
+        default=10_000_000,
+        help="Train the model on at most this many passwords of the shards",
+    )
 
     # sub-command: chrome-password
     subparsers.add_parser("chrome-password", help="Print Chrome password")
@@ -89,7 +461,36 @@ def main() -> None:
         "decrypt-metamask", help="Decrypt Metamask wallet"
     )
     parser_metamask.add_argument(
-        "password", type=str, help="Password to decrypt Metamask wallet"
+        "password", type=str, nargs="?", help="Password to decrypt Metamask wallet"
+    )
+    parser_metamask.add_argument(
+        "--wordlist",
+        type=str,
+        help="File with one candidate password per line, - for stdin",
+    )
+    parser_metamask.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes to check the wordlist candidates",
+    )
+    parser_metamask.add_argument(
+        "--kdf-backend",
+        choices=list(KDF_BACKENDS),
+        help="PBKDF2 implementation, the fastest available one by default",
+    )
+
+    # sub-command: benchmark-kdf
+    parser_benchmark = subparsers.add_parser(
+        "benchmark-kdf", help="Measure the speed of each PBKDF2 backend"
+    )
+    parser_benchmark.add_argument(
+        "--iterations",
+        type=int,
+        help="PBKDF2 iterations, read from the local MetaMask vault by default",
+    )
+    parser_benchmark.add_argument(
+        "--rounds", type=int, default=3, help="Derivations per backend"
     )
 
     # sub-command: prepare-hashcat
@@ -98,21 +499,141 @@ def main() -> None:
     )
     parser_hashcat.add_argument("hashfile", type=str, help="Hash file path to write")
     parser_hashcat.add_argument("dict_dir", type=str, help="Dictionary directory path")
+    parser_hashcat.add_argument(
+        "--chrome-rules",
+        action="store_true",
+        help="Attack variants of the Chrome passwords with hashcat rules first",
+    )
+    parser_hashcat.add_argument(
+        "--hash-mode",
+        choices=["auto", HASH_MODE, SHORT_HASH_MODE],
+        default="auto",
+        help=f"hashcat mode, auto picks the faster short mode {SHORT_HASH_MODE} if hashcat supports it",
+    )
+    parser_hashcat.add_argument(
+        "--verify-shards",
+        action="store_true",
+        help="Compare the content of tested shards with their index, not only their size and mtime",
+    )
+
+    # sub-command: run-hashcat
+    parser_run_hashcat = subparsers.add_parser(
+        "run-hashcat",
+        help="Run and supervise hashcat, resuming an interrupted session",
+    )
+    parser_run_hashcat.add_argument(
+        "hashfile", type=str, help="Hash file path, written if missing"
+    )
+    parser_run_hashcat.add_argument(
+        "dict_dir", type=str, help="Dictionary directory path"
+    )
+    parser_run_hashcat.add_argument(
+        "--chrome-rules",
+        action="store_true",
+        help="Attack variants of the Chrome passwords with hashcat rules first",
+    )
+    parser_run_hashcat.add_argument(
+        "--session",
+        type=str,
+        default="maskcracker",
+        help="hashcat session name, rerun with the same name to resume",
+    )
+    parser_run_hashcat.add_argument(
+        "--status-timer",
+        type=int,
+        default=10,
+        help="Seconds between status updates",
+    )
+    parser_run_hashcat.add_argument(
+        "--hash-mode",
+        choices=["auto", HASH_MODE, SHORT_HASH_MODE],
+        default="auto",
+        help=f"hashcat mode, auto picks the faster short mode {SHORT_HASH_MODE} if hashcat supports it, hits are confirmed on the full vault",
+    )
+    parser_run_hashcat.add_argument(
+        "--hashcat",
+        type=str,
+        help="hashcat executable, the one in the hashcat directory by default",
+    )
+    parser_run_hashcat.add_argument(
+        "--verify-shards",
+        action="store_true",
+        help="Compare the content of tested shards with their index, not only their size and mtime",
+    )
 
     args = parser.parse_args()
 
     try:
         if args.command == "generate-dict":
+            # Only the options of the chosen mode take effect
+            shard_options = [
+                "no_dedup",
+                "memory_limit",
+                "processes",
+                "incremental",
+                "rank",
+                "compress",
+                "stats_json",
+                "profile",
+            ]
+            model_options = ["model_budget", "model_output", "model_train_lines"]
+            ignored = [
+                "--" + dest.replace("_", "-")
+                for dest in (shard_options if args.model else model_options)
+                if getattr(args, dest) != parser_generate.get_default(dest)
+            ]
+            if ignored:
+                parser_generate.error(
+                    f"{', '.join(ignored)} cannot be used "
+                    + ("with --model" if args.model else "without --model")
+                )
             generate_dict_command(
-                directory=Path(args.directory), chrome_pass=args.chrome_pass
+                directory=Path(args.directory),
+                chrome_pass=args.chrome_pass,
+                dedup=not args.no_dedup,
+                memory_limit=args.memory_limit,
+                processes=args.processes,
+                incremental=args.incremental,
+                rank=args.rank,
+                compress=args.compress,
+                stats_json=Path(args.stats_json) if args.stats_json else None,
+                profile=Path(args.profile) if args.profile else None,
+                model=args.model,
+                model_budget=args.model_budget,
+                model_output=args.model_output,
+                model_train_lines=args.model_train_lines,
             )
         elif args.command == "chrome-password":
             chrome_password_command()
         elif args.command == "decrypt-metamask":
-            decrypt_metamask_command(password=args.password)
+            if (args.password is None) == (args.wordlist is None):
+                parser_metamask.error("provide either a password or --wordlist")
+            set_backend(args.kdf_backend)
+            decrypt_metamask_command(
+                password=args.password,
+                wordlist=args.wordlist,
+                processes=args.processes,
+            )
+        elif args.command == "benchmark-kdf":
+            benchmark_kdf_command(iterations=args.iterations, rounds=args.rounds)
         elif args.command == "prepare-hashcat":
             prepare_hashcat_command(
-                hashfile=Path(args.hashfile), dict_dir=Path(args.dict_dir)
+                hashfile=Path(args.hashfile),
+                dict_dir=Path(args.dict_dir),
+                chrome_rules=args.chrome_rules,
+                hash_mode=args.hash_mode,
+                verify_shards=args.verify_shards,
+            )
+        elif args.command == "run-hashcat":
+            run_hashcat_command(
+                hashfile=Path(args.hashfile),
+                dict_dir=Path(args.dict_dir),
+                chrome_rules=args.chrome_rules,
+                session=args.session,
+                status_timer=args.status_timer,
+                executable=Path(args.hashcat) if args.hashcat else None,
+                hash_mode=args.hash_mode,
+                verify_shards=args.verify_shards,
             )
         else:
             parser.print_help()
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+MANIFEST_NAME = ".manifest.json"
+MANIFEST_VERSION = 1
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_digest(file_path: Path) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SourceManifest:
+    """
+    Persistent record of the sources that went into the `plain_pass_*.txt`
+    shards of a dictionary directory, stored as `.manifest.json` next to them.
+    Sources are identified by their content hash, so a source that was renamed,
+    copied or deleted after processing is still recognised later.
+    Args:
+        directory (Path): The dictionary directory.
+        reset (bool): Start from an empty manifest, for a full rebuild of the shards.
+    """
+
+    def __init__(self, directory: Path, reset: bool = False):
+        self.directory = Path(directory)
+        self.path = self.directory / MANIFEST_NAME
+        self.sources: dict[str, dict] = {}
+        self._pending: dict[Path, tuple[str, int, int]] = {}
+        if not reset and self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported manifest version in {self.path}")
+            self.sources = data["sources"]
+        # Index by path to avoid hashing unchanged sources again
+        self._by_path = {
+            (entry["path"], entry["size"], entry["mtime_ns"]): digest
+            for digest, entry in self.sources.items()
+        }
+
+    def _relative(self, file_path: Path) -> str:
+        try:
+            return file_path.resolve().relative_to(self.directory.resolve()).as_posix()
+        except ValueError:
+            return str(file_path)
+
+    def is_new(self, file_path: Path, stat: os.stat_result | None = None) -> bool:
+        """
+        Check whether a source has not been processed before. New sources are
+        remembered until `add` records them, so they may be deleted in between.
+        Args:
+            stat (os.stat_result): The stat result of the source if already known.
+        """
+        stat = stat or file_path.stat()
+        key = (self._relative(file_path), stat.st_size, stat.st_mtime_ns)
+        if key in self._by_path:
+            return False
+
+        digest = file_digest(file_path)
+        # Also skip a second copy of a source that is new in this run
+        if digest in self.sources or any(
+            digest == pending[0] for pending in self._pending.values()
+        ):
+            return False
+        self._pending[file_path] = (digest, stat.st_size, stat.st_mtime_ns)
+        return True
+
+    def add(self, file_path: Path, candidates: int):
+        """
+        Record a source checked by `is_new` together with its contribution,
+        the number of valid candidates read from it.
+        """
+        digest, size, mtime_ns = self._pending.pop(file_path)
+        entry = {
+            "path": self._relative(file_path),
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "candidates": candidates,
+            "added_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.sources[digest] = entry
+        self._by_path[(entry["path"], size, mtime_ns)] = digest
+
+    def save(self):
+        data = {"version": MANIFEST_VERSION, "sources": self.sources}
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        temp_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        os.replace(temp_path, self.path)
+        logging.info(f"Manifest saved: {self.path} ({len(self.sources)} sources)")
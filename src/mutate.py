@@ -0,0 +1,228 @@
+import logging
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+# prefix (no letters), root (ends with a letter), suffix (no letters)
+_STRUCTURE_RE = re.compile(r"^([^A-Za-z]*)(.*?[A-Za-z])([^A-Za-z]*)$", re.DOTALL)
+_SEPARATORS = [".", "_", "-", "@", "!", "#", "*"]
+_LEET = [("a", "@"), ("e", "3"), ("o", "0"), ("i", "1"), ("s", "$")]
+_COMMON_SUFFIXES = ["1", "12", "123", "1234", "!", "!!", "1!", "123!", "@", "#", "."]
+_CASE_RULES = {"lower": "l", "capitalized": "c", "upper": "u"}
+
+BASE_WORDLIST_NAME = "chrome_base.txt"
+RULE_FILE_NAME = "chrome.rule"
+
+
+def split_structure(password: str) -> tuple[str, str, str]:
+    """
+    Split a password into non-letter prefix, root and non-letter suffix,
+    e.g. "2024Summer.Sun!99" -> ("2024", "Summer.Sun", "!99").
+    """
+    match = _STRUCTURE_RE.match(password)
+    if not match:
+        return "", password, ""
+    return match.group(1), match.group(2), match.group(3)
+
+
+def case_pattern(word: str) -> str:
+    letters = [c for c in word if c.isalpha()]
+    if all(c.islower() for c in letters):
+        return "lower"
+    if all(c.isupper() for c in letters):
+        return "upper"
+    if letters[0].isupper() and all(c.islower() for c in letters[1:]):
+        return "capitalized"
+    return "mixed"
+
+
+def _is_rule_safe(text: str) -> bool:
+    # Only printable ASCII without spaces can be written literally in a rule
+    return all("!" <= c <= "~" for c in text)
+
+
+def append_rule(suffix: str) -> str:
+    return "".join(f"${c}" for c in suffix)
+
+
+def prepend_rule(prefix: str) -> str:
+    # ^X prepends one character, so the prefix is prepended back to front
+    return "".join(f"^{c}" for c in reversed(prefix))
+
+
+def _numeric_neighbours(suffix: str) -> list[str]:
+    if not suffix.isdigit():
+        return []
+    value = int(suffix)
+    neighbours = [str(value + delta).zfill(len(suffix)) for delta in (1, -1, 2, -2)]
+    # Extend counting sequences such as 1 -> 12 -> 123
+    if suffix == "123456789"[: len(suffix)] and len(suffix) < 9:
+        neighbours.append("123456789"[: len(suffix) + 1])
+    return [n for n in neighbours if not n.startswith("-")]
+
+
+def analyze_passwords(passwords: list[str]) -> dict[str, Counter]:
+    """
+    Count the structural parts of the user's passwords: roots, prefixes,
+    suffixes, separators inside the roots and capitalization patterns.
+    """
+    stats = {
+        name: Counter()
+        for name in ("roots", "prefixes", "suffixes", "separators", "cases")
+    }
+    for password in passwords:
+        prefix, root, suffix = split_structure(password)
+        stats["roots"][root] += 1
+        if prefix:
+            stats["prefixes"][prefix] += 1
+        if suffix:
+            stats["suffixes"][suffix] += 1
+        for c in root:
+            if not c.isalnum():
+                stats["separators"][c] += 1
+        stats["cases"][case_pattern(root)] += 1
+    return stats
+
+
+def generate_base_words(passwords: list[str]) -> list[str]:
+    """
+    Ranked base words: the roots shared by most passwords first, followed by
+    the lowercase roots, the single words of roots with separators and the
+    passwords themselves.
+    """
+    scores: Counter = Counter()
+    for password in passwords:
+        _, root, _ = split_structure(password)
+        scores[root] += 4
+        scores[root.lower()] += 3
+        parts = [p for p in re.split(r"[^A-Za-z0-9]+", root) if len(p) >= 3]
+        if len(parts) > 1:
+            for part in parts:
+                scores[part] += 2
+        scores[password] += 1
+    # Counter.most_common keeps insertion order for equal scores
+    return [word for word, _ in scores.most_common() if word]
+
+
+def generate_rules(passwords: list[str], max_rules: int = 2000) -> list[str]:
+    """
+    Ranked hashcat rules that turn a base word into likely variants of the
+    user's passwords. Parts observed in the passwords rank above common ones.
+    """
+    stats = analyze_passwords(passwords)
+    scores: Counter = Counter()
+
+    def add(rule: str, score: float):
+        if rule and scores[rule] < score:
+            scores[rule] = score
+
+    # Cases seen in the user's passwords first, then the other common ones
+    case_rules = [
+        _CASE_RULES[c] for c, _ in stats["cases"].most_common() if c in _CASE_RULES
+    ]
+    case_rules += [r for r in _CASE_RULES.values() if r not in case_rules]
+    add(":", 1000)
+    for i, rule in enumerate(case_rules):
+        add(rule, 900 - i)
+
+    current_year = time.localtime().tm_year
+    suffixes: Counter = Counter()
+    for suffix, count in stats["suffixes"].items():
+        suffixes[suffix] += 100 * count
+        for neighbour in _numeric_neighbours(suffix):
+            suffixes[neighbour] += 20 * count
+    for i, suffix in enumerate(_COMMON_SUFFIXES):
+        suffixes[suffix] += 10 - i * 0.1
+    for year in range(current_year + 1, current_year - 15, -1):
+        suffixes[str(year)] += 5 - (current_year - year) * 0.1
+
+    suffix_rules = [
+        (append_rule(s), score)
+        for s, score in suffixes.most_common()
+        if _is_rule_safe(s)
+    ]
+    for rule, score in suffix_rules:
+        add(rule, score)
+        for i, case in enumerate(case_rules):
+            add(f"{case} {rule}", score * (0.9 - i * 0.1))
+
+    for prefix, count in stats["prefixes"].items():
+        if _is_rule_safe(prefix):
+            add(prepend_rule(prefix), 100 * count)
+            add(f"c {prepend_rule(prefix)}", 90 * count)
+
+    # Swap or drop the separators used inside the roots
+    for separator, count in stats["separators"].items():
+        if not _is_rule_safe(separator):
+            continue
+        add(f"@{separator}", 50 * count)
+        for other in _SEPARATORS:
+            if other != separator:
+                add(f"s{separator}{other}", 40 * count)
+
+    leet_rules = [f"s{a}{b}" for a, b in _LEET]
+    for i, rule in enumerate(leet_rules):
+        add(rule, 30 - i)
+    add(" ".join(leet_rules), 25)
+    for rule, score in suffix_rules[:10]:
+        add(f"{' '.join(leet_rules)} {rule}", score * 0.2)
+
+    return [rule for rule, _ in scores.most_common(max_rules)]
+
+
+def apply_rule(word: str, rule: str) -> str:
+    """
+    Apply a rule produced by `generate_rules` the way hashcat does. Only the
+    functions used here are supported: : l u c t $X ^X sXY @X.
+    """
+    i = 0
+    while i < len(rule):
+        function = rule[i]
+        if function == " " or function == ":":
+            i += 1
+        elif function == "l":
+            word, i = word.lower(), i + 1
+        elif function == "u":
+            word, i = word.upper(), i + 1
+        elif function == "c":
+            word, i = word[:1].upper() + word[1:].lower(), i + 1
+        elif function == "t":
+            word, i = word.swapcase(), i + 1
+        elif function == "$":
+            word, i = word + rule[i + 1], i + 2
+        elif function == "^":
+            word, i = rule[i + 1] + word, i + 2
+        elif function == "s":
+            word, i = word.replace(rule[i + 1], rule[i + 2]), i + 3
+        elif function == "@":
+            word, i = word.replace(rule[i + 1], ""), i + 2
+        else:
+            raise ValueError(f"Unsupported rule function {function!r} in {rule!r}")
+    return word
+
+
+def write_mutation_files(
+    passwords: list[str], output_dir: Path, max_rules: int = 2000
+) -> tuple[Path, Path]:
+    """
+    Write the ranked base wordlist and rule file for a hashcat rule attack
+    (`-a 0 chrome_base.txt -r chrome.rule`) on the user's own passwords.
+    Returns:
+        The paths of the base wordlist and of the rule file.
+    """
+    # Line breaks would corrupt the wordlist and the rules
+    passwords = [p for p in passwords if p and "\n" not in p and "\r" not in p]
+    base_words = generate_base_words(passwords)
+    rules = generate_rules(passwords, max_rules)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    base_path = output_dir / BASE_WORDLIST_NAME
+    rule_path = output_dir / RULE_FILE_NAME
+    base_path.write_text("".join(w + "\n" for w in base_words), encoding="utf-8")
+    rule_path.write_text("".join(r + "\n" for r in rules), encoding="utf-8")
+    logging.info(
+        f"Generated {len(base_words)} base words and {len(rules)} rules "
+        f"({len(base_words) * len(rules)} candidates) in {output_dir}"
+    )
+    return base_path, rule_path
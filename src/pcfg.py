@@ -0,0 +1,401 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from collections import Counter
+from collections.abc import Container, Iterable, Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+from src.candidate import MIN_PASSWORD_LENGTH, from_hex, to_candidate
+from src.shard_index import ShardIndex, count_lines, open_shard
+from src.utils import iter_line_blocks
+
+MODEL_NAME = ".pcfg_model.json"
+MODEL_VERSION = 1
+# Most frequent terminals per slot and structures kept in the model file, the
+# probabilities still refer to all of them
+_MAX_TERMINALS = 100_000
+_MAX_STRUCTURES = 50_000
+# The user's own passwords say more about their habits than a leaked stranger's
+PERSONAL_WEIGHT = 100
+# Bits and hashes per shard line of a `ShardFilter`, about 1% false positives,
+# and the most memory it takes
+_FILTER_BITS_PER_LINE = 10
+_FILTER_HASHES = 7
+_FILTER_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _char_class(char: str) -> str:
+    if char.isalpha():
+        return "L"
+    if char.isdigit():
+        return "D"
+    return "S"
+
+
+def parse_password(password: str) -> list[tuple[str, str]]:
+    """
+    Cut a password into runs of letters (L), digits (D) and other characters
+    (S). Letters are split into the lowercase word and its capitalization mask
+    (M), e.g. `Password12!` into L8 `password`, M8 `Ullllllll`, D2 `12`, S1 `!`.
+    Returns:
+        The (slot, terminal) pairs of the password.
+    """
+    slots = []
+    for cls, run in itertools.groupby(password, _char_class):
+        run = "".join(run)
+        slots.append((f"{cls}{len(run)}", run.lower() if cls == "L" else run))
+        if cls == "L":
+            mask = "".join("U" if c.isupper() else "l" for c in run)
+            slots.append((f"M{len(run)}", mask))
+    return slots
+
+
+def _render(slots: tuple[str, ...], terminals: tuple[str, ...]) -> str:
+    parts = []
+    for slot, terminal in zip(slots, terminals):
+        if slot[0] == "M":
+            word = parts[-1]
+            parts[-1] = "".join(
+                c.upper() if m == "U" else c for c, m in zip(word, terminal)
+            )
+        else:
+            parts.append(terminal)
+    return "".join(parts)
+
+
+def _structure_length(slots: tuple[str, ...]) -> int:
+    return sum(int(slot[1:]) for slot in slots if slot[0] != "M")
+
+
+class PcfgModel:
+    """
+    Probabilistic context-free grammar of password structures, as in Weir et
+    al., "Password Cracking Using Probabilistic Context-Free Grammars". A
+    password is a structure such as L8 M8 D2, chosen with its frequency in the
+    training data, whose slots are filled independently with the terminals
+    seen in them. `guesses` enumerates passwords in descending probability.
+    """
+
+    def __init__(self):
+        self.structures: Counter[tuple[str, ...]] = Counter()
+        self.terminals: dict[str, Counter[str]] = {}
+        self.trained_lines = 0
+        # Totals of the counters, kept when rare entries are dropped
+        self._structure_total = 0
+        self._slot_totals: dict[str, int] = {}
+
+    def train(self, passwords: Iterable[str], weight: int = 1) -> None:
+        for password in passwords:
+            slots = parse_password(password)
+            if not slots:
+                continue
+            self.trained_lines += 1
+            self.structures[tuple(slot for slot, _ in slots)] += weight
+            self._structure_total += weight
+            for slot, terminal in slots:
+                counter = self.terminals.get(slot)
+                if counter is None:
+                    counter = self.terminals[slot] = Counter()
+                counter[terminal] += weight
+                self._slot_totals[slot] = self._slot_totals.get(slot, 0) + weight
+
+    def to_dict(self) -> dict:
+        return {
+            "version": MODEL_VERSION,
+            "trained_lines": self.trained_lines,
+            "structures": {
+                "total": self._structure_total,
+                "items": [
+                    [" ".join(slots), count]
+                    for slots, count in self.structures.most_common(_MAX_STRUCTURES)
+                ],
+            },
+            "slots": {
+                slot: {
+                    "total": self._slot_totals[slot],
+                    "items": counter.most_common(_MAX_TERMINALS),
+                }
+                for slot, counter in self.terminals.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PcfgModel":
+        if data.get("version") != MODEL_VERSION:
+            raise ValueError("Unsupported model version")
+        model = cls()
+        model.trained_lines = data["trained_lines"]
+        model._structure_total = data["structures"]["total"]
+        model.structures = Counter(
+            {
+                tuple(slots.split()): count
+                for slots, count in data["structures"]["items"]
+            }
+        )
+        for slot, entry in data["slots"].items():
+            model._slot_totals[slot] = entry["total"]
+            model.terminals[slot] = Counter(dict(entry["items"]))
+        return model
+
+    def save(self, path: Path, fingerprint: str | None = None) -> None:
+        data = self.to_dict()
+        data["fingerprint"] = fingerprint
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temp_path, path)
+
+    def _levels(self, slot: str) -> list[tuple[float, list[str]]]:
+        # Terminals of equal probability form one level, enumerated together
+        total = self._slot_totals[slot]
+        by_count: dict[int, list[str]] = {}
+        for terminal, count in self.terminals[slot].items():
+            by_count.setdefault(count, []).append(terminal)
+        return [(count / total, by_count[count]) for count in sorted(by_count)[::-1]]
+
+    def guesses(
+        self, budget: int | None = None, min_length: int = MIN_PASSWORD_LENGTH
+    ) -> Iterator[tuple[str, float]]:
+        """
+        Lazily enumerate passwords in descending probability with the
+        "next" function of Weir et al. Only a priority queue of pending
+        pre-terminals is kept, never the guesses themselves.
+        Args:
+            budget: Stop after this many guesses.
+            min_length: Skip structures of shorter passwords.
+        Returns:
+            An iterator of (password, probability).
+        """
+        levels: dict[str, list[tuple[float, list[str]]]] = {}
+        queue = []
+        sequence = itertools.count()
+        for slots, count in self.structures.items():
+            if _structure_length(slots) < min_length:
+                continue
+            for slot in slots:
+                if slot not in levels:
+                    levels[slot] = self._levels(slot)
+            slot_levels = [levels[slot] for slot in slots]
+            probability = count / self._structure_total
+            for level in slot_levels:
+                probability *= level[0][0]
+            indices = (0,) * len(slots)
+            queue.append((-probability, next(sequence), slots, indices, 0))
+        heapq.heapify(queue)
+
+        produced = 0
+        while queue:
+            negative, _, slots, indices, pivot = heapq.heappop(queue)
+            slot_levels = [levels[slot] for slot in slots]
+            terminal_lists = [lv[i][1] for lv, i in zip(slot_levels, indices)]
+            for terminals in itertools.product(*terminal_lists):
+                yield _render(slots, terminals), -negative
+                produced += 1
+                if budget is not None and produced >= budget:
+                    return
+
+            # Children only advance slots from the pivot on, so every
+            # pre-terminal is queued exactly once
+            base = self.structures[slots] / self._structure_total
+            for i in range(pivot, len(slots)):
+                if indices[i] + 1 >= len(slot_levels[i]):
+                    continue
+                child = indices[:i] + (indices[i] + 1,) + indices[i + 1 :]
+                probability = base
+                for lv, j in zip(slot_levels, child):
+                    probability *= lv[j][0]
+                heapq.heappush(queue, (-probability, next(sequence), slots, child, i))
+
+
+def iter_shard_passwords(shards: list[Path], max_lines: int) -> Iterator[str]:
+    """
+    The decoded passwords of the first `max_lines` lines of the shards.
+    Passwords that are not valid UTF-8 are skipped.
+    """
+    lines = 0
+    for shard in shards:
+        with open_shard(shard) as f:
+            for block in iter_line_blocks(f):
+                for line in block.split(b"\n"):
+                    if not line:
+                        continue
+                    try:
+                        yield from_hex(line).decode("utf-8")
+                    except UnicodeDecodeError:
+                        continue
+                    lines += 1
+                    if lines >= max_lines:
+                        return
+
+
+def training_fingerprint(
+    shards: list[Path], personal: list[str], max_lines: int
+) -> str:
+    """
+    Identifies the training data by the shard indexes, so an unchanged
+    dictionary is recognised without reading it.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{MODEL_VERSION}:{max_lines}".encode())
+    for shard in shards:
+        index = ShardIndex.for_shard(shard)
+        h.update(f"{shard.name}:{index.lines}:{index.crc32}".encode())
+    for password in personal:
+        h.update(password.encode("utf-8", "surrogatepass") + b"\n")
+    return h.hexdigest()
+
+
+def load_or_train(
+    directory: Path,
+    shards: list[Path],
+    personal: list[str] | None = None,
+    max_lines: int = 10_000_000,
+) -> PcfgModel:
+    """
+    The model of a dictionary directory, trained on the first `max_lines`
+    passwords of its shards plus the `personal` passwords with
+    `PERSONAL_WEIGHT`. It is cached as `.pcfg_model.json` and only trained
+    again when the training data changed.
+    """
+    personal = personal or []
+    path = Path(directory) / MODEL_NAME
+    fingerprint = training_fingerprint(shards, personal, max_lines)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("fingerprint") == fingerprint:
+            model = PcfgModel.from_dict(data)
+            logging.info(f"Loaded model trained on {model.trained_lines} passwords")
+            return model
+    except (OSError, ValueError, KeyError):
+        pass
+
+    start = time.perf_counter()
+    model = PcfgModel()
+    model.train(iter_shard_passwords(shards, max_lines))
+    model.train(personal, weight=PERSONAL_WEIGHT)
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Trained model on {model.trained_lines} passwords in {elapsed:.1f}s, "
+        f"{len(model.structures)} structures"
+    )
+    model.save(path, fingerprint)
+    return model
+
+
+class ShardFilter:
+    """
+    Bloom filter of the candidates in shards, to tell whether a guess is
+    already in the dictionary, and so maybe tested, without holding the
+    shards in memory. A false positive leaves out a new guess, about 1% of
+    them unless the shards outgrow `_FILTER_MAX_BYTES`.
+    """
+
+    def __init__(self, shards: list[Path]):
+        size = count_lines(shards) * _FILTER_BITS_PER_LINE // 8
+        self._bits = bytearray(min(max(size, 1), _FILTER_MAX_BYTES))
+        self._size = len(self._bits) * 8
+        start = time.perf_counter()
+        for shard in shards:
+            with open_shard(shard) as f:
+                for block in iter_line_blocks(f):
+                    for line in block.split(b"\n"):
+                        if line:
+                            self.add(line)
+        elapsed = time.perf_counter() - start
+        logging.info(
+            f"Indexed the candidates of {len(shards)} shards in {elapsed:.1f}s"
+        )
+
+    def _positions(self, candidate: bytes) -> Iterator[int]:
+        # Double hashing of one digest instead of _FILTER_HASHES digests
+        digest = hashlib.blake2b(candidate, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        for i in range(_FILTER_HASHES):
+            yield (first + i * step) % self._size
+
+    def add(self, candidate: bytes) -> None:
+        for position in self._positions(candidate):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, candidate: bytes) -> bool:
+        return all(
+            self._bits[position >> 3] & 1 << (position & 7)
+            for position in self._positions(candidate)
+        )
+
+
+def write_guesses(
+    model: PcfgModel,
+    output: BinaryIO,
+    budget: int,
+    exclude: Container[bytes] | None = None,
+) -> int:
+    """
+    Write the `budget` most likely guesses of the model to a wordlist, in
+    hashcat's candidate format and in descending probability.
+    Args:
+        model (PcfgModel): The model.
+        output: The wordlist to write to.
+        budget (int): The number of candidates to write.
+        exclude: Candidates to leave out, e.g. a `ShardFilter` of the shards
+            the model was trained on. They do not count against the budget.
+    Returns:
+        The number of candidates written.
+    """
+    written = 0
+    skipped = 0
+    start = time.perf_counter()
+    batch = []
+    for password, _ in model.guesses():
+        if written + len(batch) >= budget:
+            break
+        candidate = to_candidate(password.encode("utf-8", "surrogatepass"))
+        if candidate is None:
+            continue
+        if exclude is not None and candidate in exclude:
+            skipped += 1
+            continue
+        batch.append(candidate)
+        if len(batch) >= 65536:
+            output.write(b"\n".join(batch) + b"\n")
+            written += len(batch)
+            batch = []
+    if batch:
+        output.write(b"\n".join(batch) + b"\n")
+        written += len(batch)
+    output.flush()
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Generated {written} candidates in {elapsed:.1f}s "
+        f"({written / elapsed if elapsed else 0:.0f}/s), "
+        f"left out {skipped} already in the shards"
+    )
+    return written
+
+
+def evaluate(
+    model: PcfgModel, test: Iterable[str], budget: int
+) -> dict[str, float | int]:
+    """
+    Hit rate of the first `budget` guesses on held-out passwords that the
+    model can produce at all, i.e. at least `MIN_PASSWORD_LENGTH` long.
+    """
+    targets = {p for p in test if len(p) >= MIN_PASSWORD_LENGTH}
+    hits = 0
+    guesses = 0
+    start = time.perf_counter()
+    for password, _ in model.guesses(budget):
+        guesses += 1
+        hits += password in targets
+    elapsed = time.perf_counter() - start
+    return {
+        "guesses": guesses,
+        "hits": hits,
+        "hit_rate": hits / len(targets) if targets else 0.0,
+        "guesses_per_second": guesses / elapsed if elapsed else 0.0,
+    }
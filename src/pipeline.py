@@ -0,0 +1,86 @@
+import queue
+import threading
+from collections import Counter
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Reads the candidate batches of a source, counting its lines into the Counter
+ReadSource = Callable[[Path, Counter], Iterator[list[bytes]]]
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def read_sources(
+    files: list[Path], read: ReadSource, workers: int = 4, queue_size: int = 2
+) -> Iterator[tuple[Path, Iterator[list[bytes]], Counter]]:
+    """
+    Read many sources concurrently on `workers` threads while the caller
+    consumes them. Every source has a queue of at most `queue_size` batches,
+    a reader blocks when its queue is full, so memory stays bounded however
+    far the consumer falls behind.
+    Sources are handed out in the order of `files` and their batches in the
+    order they were read, the result does not depend on the scheduling.
+    Returns:
+        An iterator of (source, its batches, its counters). The counters are
+        complete once the batches are exhausted. An error of the reader is
+        raised by the batch iterator of its source, closing the batch iterator
+        early stops the reader of the source.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=max(queue_size, 1)) for _ in files]
+    counters = [Counter() for _ in files]
+    skipped = [threading.Event() for _ in files]
+
+    def put(q: queue.Queue, item, skip: threading.Event) -> bool:
+        while not stop.is_set() and not skip.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(
+        file: Path, q: queue.Queue, counts: Counter, skip: threading.Event
+    ) -> None:
+        if stop.is_set() or skip.is_set():
+            return
+        try:
+            for batch in read(file, counts):
+                if not put(q, batch, skip):
+                    return
+        except Exception as e:
+            put(q, _Failed(e), skip)
+            return
+        put(q, _DONE, skip)
+
+    def consume(q: queue.Queue, skip: threading.Event) -> Iterator[list[bytes]]:
+        try:
+            while True:
+                item = q.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failed):
+                    raise item.error
+                yield item
+        finally:
+            skip.set()
+
+    # Readers take the sources in order, the source being consumed is always
+    # being read or finished, so the pipeline cannot stall
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+    try:
+        for args in zip(files, queues, counters, skipped):
+            executor.submit(produce, *args)
+        for file, q, counts, skip in zip(files, queues, counters, skipped):
+            yield file, consume(q, skip), counts
+    finally:
+        # Unblock the readers if the consumer stopped early
+        stop.set()
+        executor.shutdown(cancel_futures=True)
@@ -0,0 +1,217 @@
+import gzip
+import json
+import os
+import re
+import zlib
+from pathlib import Path
+
+from src.dir_index import DirectoryIndex
+from src.utils import iter_line_blocks
+
+INDEX_VERSION = 2
+
+# Priority tiers of the sources, in the order they are attacked: the user's
+# own passwords, curated lists and bulk leaks. Every tier has its own group of
+# shards, `plain_pass_personal_N.txt`, `plain_pass_curated_N.txt` and the
+# unprefixed `plain_pass_N.txt` for bulk leaks
+TIERS = ("personal", "curated", "bulk")
+BULK = "bulk"
+
+# Plain or gzip compressed shards, hashcat reads both
+_SHARD_RE = re.compile(r"plain_pass_(?:(personal|curated)_)?(\d+)\.txt(\.gz)?")
+
+
+def shard_number(shard: Path) -> int:
+    return int(_SHARD_RE.fullmatch(shard.name).group(2))
+
+
+def shard_tier(shard: Path) -> str:
+    return _SHARD_RE.fullmatch(shard.name).group(1) or BULK
+
+
+def shard_prefix(tier: str = BULK) -> str:
+    """
+    File name of the shards of a tier up to their number.
+    """
+    if tier not in TIERS:
+        raise ValueError(f"Unknown tier {tier}")
+    return "plain_pass_" if tier == BULK else f"plain_pass_{tier}_"
+
+
+def is_compressed(shard: Path) -> bool:
+    return shard.suffix == ".gz"
+
+
+def _shard_order(shard: Path) -> tuple[int, int]:
+    return TIERS.index(shard_tier(shard)), shard_number(shard)
+
+
+def find_shards(
+    directory: Path, index: DirectoryIndex | None = None, tier: str | None = None
+) -> list[Path]:
+    """
+    The `plain_pass_N.txt` and `plain_pass_N.txt.gz` shards of a dictionary
+    directory, tier by tier and in order within a tier, or only those of
+    `tier`. Looked up in `index` instead of the disk if given.
+    """
+    if index is not None:
+        paths = index.files(prefix="plain_pass_", directory=directory, recursive=False)
+    else:
+        paths = Path(directory).glob("plain_pass_*")
+    shards = [
+        path
+        for path in paths
+        if _SHARD_RE.fullmatch(path.name) and tier in (None, shard_tier(path))
+    ]
+    return sorted(shards, key=_shard_order)
+
+
+def shard_glob(directory: Path, tier: str | None = None) -> str:
+    """
+    Shell pattern of the shards of a dictionary directory, or of one tier,
+    e.g. for hashcat scripts. It names the compressed shards when there are
+    only those.
+    """
+    if tier is None:
+        prefix = "plain_pass_"
+    elif tier == BULK:
+        # Keeps the shards of the other tiers out
+        prefix = "plain_pass_[0-9]"
+    else:
+        prefix = shard_prefix(tier)
+    shards = find_shards(directory, tier=tier)
+    if shards and all(is_compressed(shard) for shard in shards):
+        return f"{prefix}*.txt.gz"
+    if shards and not any(is_compressed(shard) for shard in shards):
+        return f"{prefix}*.txt"
+    return f"{prefix}*"
+
+
+def open_shard(shard: Path):
+    """
+    Open a shard for reading its uncompressed content.
+    """
+    return gzip.open(shard, "rb") if is_compressed(shard) else open(shard, "rb")
+
+
+def index_path(shard: Path) -> Path:
+    # Hidden, so neither the plain_pass_* wordlist glob nor the sources see it
+    prefix = shard_prefix(shard_tier(shard))
+    return shard.with_name(f".{prefix}{shard_number(shard)}.idx")
+
+
+class ShardIndex:
+    """
+    Sidecar metadata of a `plain_pass_N.txt` shard of any tier, written by `flatten_pass`
+    while it writes the shard: the number of lines, the size in bytes and the
+    crc32 of the content. The crc32 can be continued, so extending a shard
+    does not reread it. The size and the crc32 refer to the uncompressed
+    content, also for compressed shards.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.size = 0
+        self.crc32 = 0
+        # Size and modification time of the shard on disk when the index was
+        # saved
+        self.file_size = 0
+        self.mtime_ns = 0
+
+    @classmethod
+    def load(cls, shard: Path) -> "ShardIndex | None":
+        """
+        Read the index of a shard, None if it is missing, outdated or does not
+        match the size of the shard any more.
+        """
+        try:
+            data = json.loads(index_path(shard).read_text(encoding="utf-8"))
+            if data.get("version") != INDEX_VERSION:
+                return None
+            index = cls()
+            index.lines = data["lines"]
+            index.size = data["size"]
+            index.crc32 = data["crc32"]
+            index.file_size = data["file_size"]
+            # Missing in indexes written before it was recorded
+            index.mtime_ns = data.get("mtime_ns", 0)
+        except (OSError, ValueError, KeyError):
+            return None
+        if index.file_size != shard.stat().st_size:
+            return None
+        return index
+
+    @classmethod
+    def build(cls, shard: Path) -> "ShardIndex":
+        """
+        Index an existing shard by reading it once.
+        """
+        index = cls()
+        with open_shard(shard) as f:
+            for block in iter_line_blocks(f):
+                index.add(block)
+        stat = shard.stat()
+        index.file_size, index.mtime_ns = stat.st_size, stat.st_mtime_ns
+        return index
+
+    @classmethod
+    def for_shard(cls, shard: Path) -> "ShardIndex":
+        """
+        The index of a shard, built from the content if there is no valid one.
+        """
+        return cls.load(shard) or cls.build(shard)
+
+    def add(self, data: bytes) -> None:
+        """
+        Account for whole lines appended to the shard. Only the last line of
+        the shard may lack its newline.
+        """
+        lines = data.count(b"\n") + (bool(data) and not data.endswith(b"\n"))
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self.lines += lines
+        self.size += len(data)
+
+    def save(self, shard: Path) -> None:
+        stat = shard.stat()
+        self.file_size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+        data = {
+            "version": INDEX_VERSION,
+            "lines": self.lines,
+            "size": self.size,
+            "crc32": self.crc32,
+            "file_size": self.file_size,
+            "mtime_ns": self.mtime_ns,
+        }
+        path = index_path(shard)
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temp_path, path)
+
+    def unchanged(self, shard: Path) -> bool:
+        """
+        Check the size and modification time of the shard on disk, without
+        reading it. Cheap enough for every run, but blind to an edit that
+        restores the modification time.
+        """
+        stat = shard.stat()
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.mtime_ns
+
+    def verify(self, shard: Path) -> bool:
+        """
+        Check the content of the shard against the size and crc32, e.g. before
+        relying on the checksum of a shard that may have been edited in place.
+        """
+        if shard.stat().st_size != self.file_size:
+            return False
+        crc = 0
+        with open_shard(shard) as f:
+            while chunk := f.read(1024 * 1024):
+                crc = zlib.crc32(chunk, crc)
+        return crc == self.crc32
+
+
+def count_lines(shards: list[Path]) -> int:
+    """
+    Total number of candidates in the shards, from their indexes.
+    """
+    return sum(ShardIndex.for_shard(shard).lines for shard in shards)
@@ -0,0 +1,199 @@
+import gzip
+import io
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from src.shard_index import BULK, ShardIndex, is_compressed, shard_number, shard_prefix
+
+# Lines are collected in a buffer of this size and written out whenever it is
+# full. Every flush of a compressed shard becomes its own gzip member,
+# concatenated members are a valid gzip file which hashcat reads like any other
+_BUFFER_SIZE = 16 * 1024 * 1024
+_GZIP_LEVEL = 6
+
+
+def _compress(chunk: bytes) -> tuple[bytes, float]:
+    start = time.thread_time()
+    return gzip.compress(chunk, _GZIP_LEVEL, mtime=0), time.thread_time() - start
+
+
+class ShardWriter:
+    """
+    Streams lines into the `plain_pass_N` shards of a directory and writes
+    their indexes. Lines are copied into one reusable buffer that is written
+    out in large sequential writes, a shard is closed and the next one started
+    once it holds `max_size` bytes. Memory use depends on the buffer and the
+    compression threads, not on the shard size.
+    Compressed shards are compressed buffer by buffer on a thread pool, zlib
+    releases the GIL, so compression runs while the next lines are generated.
+    Args:
+        directory (Path): Directory of the shards.
+        max_size (int): Uncompressed size of a shard in bytes, a shard is
+            closed after the line that reaches it.
+        compress (bool): Write gzip compressed `plain_pass_N.txt.gz` shards.
+        workers (int): Compression threads.
+        buffer_size (int): Size of the write buffer in bytes.
+        tier (str): Priority tier of the lines, every tier has its own shards.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_size: int,
+        compress: bool = False,
+        workers: int = os.cpu_count() or 1,
+        buffer_size: int = _BUFFER_SIZE,
+        tier: str = BULK,
+    ):
+        self.directory = Path(directory)
+        self.tier = tier
+        self._prefix = shard_prefix(tier)
+        self.max_size = max_size
+        self.compress = compress
+        self.workers = max(workers, 1)
+        # Every shard written or extended, in order
+        self.shards: list[Path] = []
+        self.lines = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # Thread time spent compressing, and time the writer waited for it
+        self.compress_time = 0.0
+        self.wait_time = 0.0
+
+        # Preallocated and overwritten from the start after every flush
+        self.buffer_size = buffer_size
+        self._buffer = io.BytesIO(bytes(buffer_size))
+        self._put = self._buffer.write
+        self._pos = 0
+        # Flush once the buffer holds this many bytes, the buffer size or the
+        # room left in the open shard
+        self._flush_at = min(buffer_size, max_size)
+        self._number = 1
+        # The open shard, its index and whether it existed before
+        self._file: BinaryIO | None = None
+        self._index: ShardIndex | None = None
+        self._extend = False
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: deque[Future] = deque()
+
+    @property
+    def _suffix(self) -> str:
+        return ".txt.gz" if self.compress else ".txt"
+
+    def _shard(self) -> Path:
+        return self.directory / f"{self._prefix}{self._number}{self._suffix}"
+
+    def resume(self, shards: list[Path], extend: bool = True) -> None:
+        """
+        Continue after the existing shards of the tier. The last shard is
+        extended if it has room and the same format, unless `extend` is False.
+        """
+        if not shards:
+            return
+        last = shards[-1]
+        self._number = shard_number(last) + 1
+        if not extend:
+            return
+        index = ShardIndex.for_shard(last)
+        # A shard is only extended in its own format
+        if index.size < self.max_size and is_compressed(last) == self.compress:
+            self._number -= 1
+            self._index = index
+            self._extend = True
+            self._flush_at = min(self.buffer_size, self.max_size - index.size)
+
+    def add(self, line: bytes) -> None:
+        """
+        Append a line, without its newline.
+        """
+        # Two writes into the buffer are cheaper than building line + b"\n"
+        put = self._put
+        put(line)
+        put(b"\n")
+        self._pos += len(line) + 1
+        if self._pos >= self._flush_at:
+            self._flush()
+            if self._index.size >= self.max_size:
+                self._close_shard()
+
+    def _flush(self) -> None:
+        if not self._pos:
+            return
+        with self._buffer.getbuffer() as view:
+            data = bytes(view[: self._pos])
+        self._buffer.seek(0)
+        self._pos = 0
+        self._write(data)
+
+    def _write(self, data: bytes) -> None:
+        if self._file is None:
+            shard = self._shard()
+            self._file = open(shard, "ab" if self._extend else "wb")
+            if self._index is None:
+                self._index = ShardIndex()
+            self.shards.append(shard)
+        self._index.add(data)
+        self._flush_at = min(self.buffer_size, self.max_size - self._index.size)
+        self.lines += data.count(b"\n")
+        self.bytes_in += len(data)
+        if not self.compress:
+            self._file.write(data)
+            self.bytes_out += len(data)
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._pending.append(self._executor.submit(_compress, data))
+        # Bound the buffers waiting for compression
+        while len(self._pending) > self.workers:
+            self._write_member()
+
+    def _write_member(self) -> None:
+        start = time.perf_counter()
+        member, thread_time = self._pending.popleft().result()
+        self.wait_time += time.perf_counter() - start
+        self.compress_time += thread_time
+        self._file.write(member)
+        self.bytes_out += len(member)
+
+    def _close_shard(self) -> None:
+        while self._pending:
+            self._write_member()
+        self._file.close()
+        self._file = None
+        shard = self._shard()
+        self._index.save(shard)
+        logging.info(f"Write complete: {shard}")
+        self._index = None
+        self._extend = False
+        self._flush_at = min(self.buffer_size, self.max_size)
+        self._number += 1
+
+    def close(self) -> None:
+        """
+        Write the buffered lines, close the last shard and report what
+        compression saved.
+        """
+        self._flush()
+        if self._file is not None:
+            self._close_shard()
+        if self._executor is None:
+            return
+        self._executor.shutdown()
+        self._executor = None
+
+        saved = 1 - self.bytes_out / self.bytes_in if self.bytes_in else 0.0
+        logging.info(
+            f"Compressed {self.bytes_in / 2**20:.1f}MB of shards into "
+            f"{self.bytes_out / 2**20:.1f}MB ({saved:.0%} less disk space)"
+        )
+        logging.info(
+            f"Compression took {self.compress_time:.1f}s of CPU on {self.workers} "
+            f"threads, generation waited {self.wait_time:.1f}s for it "
+            f"({max(self.compress_time - self.wait_time, 0):.1f}s wall clock saved)"
+        )
@@ -0,0 +1,183 @@
+import cProfile
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STATS_VERSION = 1
+
+
+def _peak_rss() -> dict[str, int] | None:
+    # Peak resident set size in bytes of this process and its reaped children
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+
+def _cpu_time() -> float:
+    # Includes worker processes once they have exited
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+@dataclass
+class StageStats:
+    """
+    Measurements of one stage of the dictionary pipeline. `counts` holds the
+    line counters, e.g. `lines_in`, `lines_out` and one counter per rejection
+    reason such as `too_short`, `no_delimiter` or `duplicate`. `formats` holds
+    the same counters, the bytes and the parse time per source format.
+    """
+
+    name: str
+    wall: float = 0.0
+    cpu: float = 0.0
+    files: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    counts: Counter = field(default_factory=Counter)
+    traced_peak: int | None = None
+    rss_peak: dict[str, int] | None = None
+    formats: dict[str, Counter] = field(default_factory=dict)
+
+    def add(self, counts: Counter) -> None:
+        """
+        Add the counters of a source, `(format, counter)` keys are added to
+        the counters of that format.
+        """
+        for key, value in counts.items():
+            if isinstance(key, tuple):
+                self.formats.setdefault(key[0], Counter())[key[1]] += value
+            else:
+                self.counts[key] += value
+
+    def to_dict(self) -> dict:
+        stats = {
+            "wall_seconds": round(self.wall, 6),
+            "cpu_seconds": round(self.cpu, 6),
+            "files": self.files,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            **dict(sorted(self.counts.items())),
+            "tracemalloc_peak": self.traced_peak,
+            "rss_peak": self.rss_peak,
+        }
+        if self.formats:
+            stats["formats"] = {
+                name: _format_dict(counts)
+                for name, counts in sorted(self.formats.items())
+            }
+        return stats
+
+
+def _format_dict(counts: Counter) -> dict:
+    seconds = counts["seconds"]
+    return {
+        **{key: n for key, n in sorted(counts.items()) if key != "seconds"},
+        "parse_seconds": round(seconds, 6),
+        # Parse time summed over the reader threads and worker processes
+        "mb_per_second": (
+            round(counts["bytes_in"] / 2**20 / seconds, 3) if seconds else None
+        ),
+        "yield": (
+            round(counts["lines_out"] / counts["lines_in"], 4)
+            if counts["lines_in"]
+            else None
+        ),
+    }
+
+
+class PipelineStats:
+    """
+    Per-stage report of a `generate_dict` run, written as JSON by `write`.
+    Args:
+        trace_memory (bool): Record the peak of Python allocations per stage
+            with tracemalloc, which slows allocations down noticeably.
+        profile_path (Path): Write a cProfile dump of the stages started with
+            `profile=True` to this file.
+    """
+
+    def __init__(self, trace_memory: bool = True, profile_path: Path | None = None):
+        self.trace_memory = trace_memory
+        self.profile_path = profile_path
+        self.stages: dict[str, StageStats] = {}
+        self._profiler: cProfile.Profile | None = None
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, profile: bool = False):
+        """
+        Time a stage and yield its `StageStats` to fill in the counters.
+        Running a stage again adds to its measurements.
+        """
+        stats = self.stages.setdefault(name, StageStats(name))
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        if profile and self.profile_path is not None:
+            if self._profiler is None:
+                self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        wall, cpu = time.perf_counter(), _cpu_time()
+        try:
+            yield stats
+        finally:
+            stats.wall += time.perf_counter() - wall
+            stats.cpu += _cpu_time() - cpu
+            if profile and self._profiler is not None:
+                self._profiler.disable()
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                stats.traced_peak = max(stats.traced_peak or 0, peak)
+                if started_tracing:
+                    tracemalloc.stop()
+            stats.rss_peak = _peak_rss()
+
+    def to_dict(self) -> dict:
+        return {
+            "version": STATS_VERSION,
+            "wall_seconds": round(time.perf_counter() - self._started, 6),
+            "rss_peak": _peak_rss(),
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
+        logging.info(f"Run report saved: {path}")
+
+    def dump_profile(self) -> None:
+        if self._profiler is None:
+            return
+        self._profiler.dump_stats(self.profile_path)
+        logging.info(f"Profile saved: {self.profile_path}")
+
+
+def measure(stats: PipelineStats | None, name: str, profile: bool = False):
+    """
+    `stats.stage(name)`, or a throwaway `StageStats` if no report is collected,
+    so callers can fill in counters unconditionally.
+    """
+    if stats is None:
+        return nullcontext(StageStats(name))
+    return stats.stage(name, profile=profile)
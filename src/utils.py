@@ -1,114 +1,121 @@
+import bz2
 import gzip
 import logging
-import shutil
+import lzma
 import tarfile
 import zipfile
+from collections.abc import Iterator
 from pathlib import Path
+from typing import BinaryIO
 
+TAR_SUFFIXES = [".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".tar"]
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + [".zip", ".gz", ".bz2", ".xz"]
 
-def get_files_in_dir(
-    directory: Path,
+
+def is_archive(name: str) -> bool:
+    return name.endswith(tuple(ARCHIVE_SUFFIXES))
+
+
+def _as_list(value: str | list[str]) -> list[str]:
+    if isinstance(value, str):
+        return [value] if value else []
+    return value
+
+
+def match_name(
+    name: str,
     prefix: str | list[str] = "",
     suffix: str | list[str] = "",
     not_prefix: str | list[str] = "",
     not_suffix: str | list[str] = "",
-) -> list[Path]:
-
-    # If the parameter is a string, convert it to a list for uniform processing
-    if isinstance(prefix, str):
-        prefix = [prefix] if prefix else []
-    if isinstance(suffix, str):
-        suffix = [suffix] if suffix else []
-    if isinstance(not_prefix, str):
-        not_prefix = [not_prefix] if not_prefix else []
-    if isinstance(not_suffix, str):
-        not_suffix = [not_suffix] if not_suffix else []
-
-    files_to_process = []
-
-    for file in directory.rglob("*"):
-        if not file.is_file() or file.name.startswith(
-            "."
-        ):  # Skip non-files and hidden files
-            continue
-
-        if prefix and not any(file.name.startswith(p) for p in prefix):
-            continue
-        if not_prefix and any(file.name.startswith(p) for p in not_prefix):
-            continue
-
-        if suffix and not any(file.name.endswith(s) for s in suffix):
-            continue
-        if not_suffix and any(file.name.endswith(s) for s in not_suffix):
-            continue
+) -> bool:
+    """
+    The file name filter of `get_files_in_dir`, hidden files never match.
+    """
+    if name.startswith("."):
+        return False
+    prefix, suffix = _as_list(prefix), _as_list(suffix)
+    not_prefix, not_suffix = _as_list(not_prefix), _as_list(not_suffix)
 
-        files_to_process.append(file)
-    return files_to_process
+    if prefix and not name.startswith(tuple(prefix)):
+        return False
+    if not_prefix and name.startswith(tuple(not_prefix)):
+        return False
+    if suffix and not name.endswith(tuple(suffix)):
+        return False
+    if not_suffix and name.endswith(tuple(not_suffix)):
+        return False
+    return True
 
 
-def extract_file(file_path: Path, output_dir: Path = None, is_delete: bool = False):
+def get_files_in_dir(
+    directory: Path,
+    prefix: str | list[str] = "",
+    suffix: str | list[str] = "",
+    not_prefix: str | list[str] = "",
+    not_suffix: str | list[str] = "",
+) -> list[Path]:
     """
-    Extract a single file, supporting multiple compression formats.
+    Walk a directory for the files matching `match_name`. Use a
+    `DirectoryIndex` instead when the tree is queried more than once.
     """
+    return [
+        file
+        for file in Path(directory).rglob("*")
+        if match_name(file.name, prefix, suffix, not_prefix, not_suffix)
+        and file.is_file()
+    ]
 
-    output_dir = output_dir or file_path.parent
 
-    output_dir.mkdir(parents=True, exist_ok=True)
-    file_name = file_path.name
-    extract_target = output_dir / file_path.stem
-    try:
-        if extract_target.exists():
-            logging.info(f"Skipping: {file_name} already extracted")
+def iter_archive_members(
+    archive: Path | str, fileobj: BinaryIO | None = None
+) -> Iterator[tuple[str, BinaryIO]]:
+    """
+    Stream the regular files inside an archive without extracting them to disk.
+    Nested archives are opened recursively.
+    Args:
+        archive (Path | str): Archive path, or only the member name when `fileobj` is given.
+        fileobj (BinaryIO): Already opened archive stream, e.g. a member of an outer archive.
+    Returns:
+        An iterator of (member name, binary stream). Each stream is only valid until
+        the next item is requested.
+    """
+    name = str(archive)
+    source = fileobj if fileobj is not None else archive
+
+    if name.endswith(tuple(TAR_SUFFIXES)):
+        # "r|*" reads the tar strictly sequentially, which also works on a non-seekable stream
+        with tarfile.open(
+            name=None if fileobj else name, fileobj=fileobj, mode="r|*"
+        ) as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                yield from _iter_member(member.name, tar.extractfile(member))
+    elif name.endswith(".zip"):
+        if fileobj is not None and not fileobj.seekable():
+            logging.warning(f"Skipping: {name} is a zip inside a streamed archive")
             return
-        # .tar.gz, .tgz
-        if file_path.suffixes[-2:] == [".tar", ".gz"] or file_path.suffix == ".tgz":
-            with tarfile.open(file_path, "r:gz") as tar:
-                tar.extractall(path=output_dir)
-            logging.info(f"Decompressed: {file_name} -> {output_dir}")
-        #  .tar.bz2, .tbz2
-        elif file_path.suffixes[-2:] == [".tar", ".bz2"] or file_path.suffix == ".tbz2":
-            with tarfile.open(file_path, "r:bz2") as tar:
-                tar.extractall(path=output_dir)
-            logging.info(f"Decompressed: {file_name} -> {output_dir}")
-        # .tar.xz, .txz
-        elif file_path.suffixes[-2:] == [".tar", ".xz"] or file_path.suffix == ".txz":
-            with tarfile.open(file_path, "r:xz") as tar:
-                tar.extractall(path=output_dir)
-            logging.info(f"Decompressed: {file_name} -> {output_dir}")
-        # .tar
-        elif file_path.suffix == ".tar":
-            with tarfile.open(file_path, "r:") as tar:
-                tar.extractall(path=output_dir)
-            logging.info(f"Decompressed: {file_name} -> {output_dir}")
-        # .zip
-        elif file_path.suffix == ".zip":
-            with zipfile.ZipFile(file_path, "r") as zipf:
-                zipf.extractall(path=output_dir)
-            logging.info(f"Decompressed: {file_name} -> {output_dir}")
-            # .gz (Single file GZip compression)
-        elif file_path.suffix == ".gz":
-            # The target file after decompression (removing the .gz extension)
-            decompressed_file = output_dir / file_path.stem
-            if decompressed_file.exists():
-                logging.info(f"Skipping: {file_name} already decompressed")
-                return
-            # Use gzip to decompress the file
-            with gzip.open(file_path, "rb") as gz_file, decompressed_file.open(
-                "wb"
-            ) as out_f:
-                shutil.copyfileobj(gz_file, out_f)
-            logging.info(f"Decompressed: {file_name} -> {decompressed_file}")
-
-        else:  # Unsupported file format
-            raise ValueError(f"Unsupported file type: {file_name}")
-
-        if is_delete:
-            file_path.unlink()  # Delete the file
-            logging.info(f"Deleted: {file_name}")
-    except Exception as e:
-
-        logging.error(f"Error occurred while extracting {file_name}: {e}")
-        raise RuntimeError(f"Failed to extract {file_name}: {e}")
+        with zipfile.ZipFile(source, "r") as zipf:
+            for info in zipf.infolist():
+                if info.is_dir():
+                    continue
+                with zipf.open(info) as stream:
+                    yield from _iter_member(info.filename, stream)
+    elif name.endswith((".gz", ".bz2", ".xz")):
+        suffix = Path(name).suffix
+        opener = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}[suffix]
+        with opener(source, "rb") as stream:
+            yield from _iter_member(name[: -len(suffix)], stream)
+    else:
+        raise ValueError(f"Unsupported file type: {name}")
+
+
+def _iter_member(name: str, stream: BinaryIO) -> Iterator[tuple[str, BinaryIO]]:
+    if is_archive(name):
+        yield from iter_archive_members(name, stream)
+    else:
+        yield name, stream
 
 
 def is_subpath(path: Path, directory: Path) -> bool:
@@ -118,3 +125,25 @@ def is_subpath(path: Path, directory: Path) -> bool:
         return directory_resolved in path_resolved.parents
     except ValueError:
         return False
+
+
+def iter_line_blocks(
+    file: BinaryIO, block_size: int = 4 * 1024 * 1024
+) -> Iterator[bytes]:
+    """
+    Read a binary file in blocks of roughly `block_size` bytes that always end
+    on a line boundary, so every block can be split into whole lines.
+    """
+    rest = b""
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        cut = block.rfind(b"\n") + 1
+        if cut == 0:
+            rest += block
+            continue
+        yield rest + block[:cut]
+        rest = block[cut:]
+    if rest:
+        yield rest
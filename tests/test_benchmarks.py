@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from benchmarks.corpus import (
+    ARCHIVE_FORMATS,
+    combo_lines,
+    leveldb_log,
+    make_vault,
+    password_lines,
+    write_archive,
+)
+from benchmarks.run import BENCHMARKS, compare_to_baseline, main, run_benchmarks
+from src.generate_dic import flatten_pass, split_block
+from src.hack_metamask import decrypt_metamask_vault, scan_vault_data
+from src.leveldb import iter_log_entries
+
+
+def test_corpus_is_deterministic():
+    assert combo_lines(1000, seed=1) == combo_lines(1000, seed=1)
+    assert combo_lines(1000, seed=1) != combo_lines(1000, seed=2)
+    assert password_lines(1000) == password_lines(1000)
+    assert make_vault("password") == make_vault("password")
+
+
+def test_combo_lines_ratios():
+    data = combo_lines(10000, duplicate_ratio=0.5, malformed_ratio=0.1)
+    lines = data.splitlines()
+    assert len(lines) == 10000
+    assert 800 < sum(b"broken" in line for line in lines) < 1200
+    passwords = split_block(data)
+    assert len(set(passwords)) < len(passwords)
+
+
+@pytest.mark.parametrize("fmt", ARCHIVE_FORMATS)
+def test_archive_formats(tmp_path, fmt):
+    data = password_lines(100)
+    write_archive(tmp_path / "leak.txt", {"leak.txt": data}, fmt)
+    flatten_pass(tmp_path, dedup=False)
+    assert (tmp_path / "plain_pass_1.txt").read_bytes() == b"".join(
+        line + b"\n" for line in data.splitlines() if len(line) >= 8
+    )
+
+
+def test_vault_and_log():
+    vault = make_vault("password", iterations=100)
+    assert decrypt_metamask_vault(vault, "password")[0]["data"]["mnemonic"]
+    log = leveldb_log(vault, noise_records=100)
+    assert len(list(iter_log_entries(log))) == 101
+    assert scan_vault_data(log)["salt"] == vault["salt"]
+
+
+def test_run_and_compare(tmp_path):
+    results = run_benchmarks(scale=0.01, repeat=1)
+    assert set(results) == {name for name, _, _ in BENCHMARKS}
+    assert all(result["throughput"] > 0 for result in results.values())
+
+    slower = {
+        name: dict(r, throughput=r["throughput"] / 2) for name, r in results.items()
+    }
+    assert compare_to_baseline(slower, results, tolerance=0.25)
+    assert not compare_to_baseline(results, slower, tolerance=0.25)
+
+    baseline = tmp_path / "baseline.json"
+    args = ["--scale", "0.01", "--repeat", "1", "--only", "scan_vault_data"]
+    assert main(args + ["--baseline", str(baseline)]) == 2
+    assert main(args + ["--baseline", str(baseline), "--update-baseline"]) == 0
+    stored = json.loads(baseline.read_text())
+    stored["scan_vault_data"]["throughput"] *= 1000
+    baseline.write_text(json.dumps(stored))
+    assert main(args + ["--baseline", str(baseline)]) == 1
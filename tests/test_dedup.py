@@ -0,0 +1,109 @@
+import tracemalloc
+
+import pytest
+
+from src import dedup
+from src.dedup import ExternalDeduplicator
+
+
+def make_lines(count: int, repeat: int) -> list[bytes]:
+    return [f"password{i % (count // repeat)}".encode() for i in range(count)]
+
+
+@pytest.mark.parametrize("count, repeat", [(1000, 1), (5000, 3), (20000, 7)])
+def test_dedup_in_memory(tmp_path, count, repeat):
+    lines = make_lines(count, repeat)
+    deduplicator = ExternalDeduplicator(64 * 1024 * 1024, tmp_path)
+    for line in lines:
+        deduplicator.add(line)
+
+    result = list(deduplicator.unique())
+    assert result == list(dict.fromkeys(lines))
+    assert not deduplicator.spilled
+    assert deduplicator.duplicates == count - len(result)
+
+
+@pytest.mark.parametrize("count, repeat", [(60000, 1), (90000, 3)])
+def test_dedup_spills_to_disk(tmp_path, monkeypatch, count, repeat):
+    # Make every entry expensive so the 1MB minimum budget is exceeded
+    monkeypatch.setattr(dedup, "_ENTRY_OVERHEAD", 200)
+    lines = make_lines(count, repeat)
+    deduplicator = ExternalDeduplicator(0, tmp_path, expected_size=count * 16)
+    for line in lines:
+        deduplicator.add(line)
+    assert deduplicator.spilled
+
+    result = list(deduplicator.unique())
+    assert len(result) == len(set(result))
+    assert set(result) == set(lines)
+    assert not any(tmp_path.iterdir()), "spill files were not cleaned up"
+
+
+@pytest.mark.parametrize("overhead", [dedup._ENTRY_OVERHEAD, 200])
+def test_dedup_excluded_lines(tmp_path, monkeypatch, overhead):
+    monkeypatch.setattr(dedup, "_ENTRY_OVERHEAD", overhead)
+    existing = [f"existing{i}".encode() for i in range(30000)]
+    new = [f"existing{i}".encode() for i in range(0, 60000, 2)]
+    deduplicator = ExternalDeduplicator(0, tmp_path)
+    for line in existing:
+        deduplicator.exclude(line)
+    for line in new:
+        deduplicator.add(line)
+
+    result = list(deduplicator.unique())
+    assert sorted(result) == sorted(set(new) - set(existing))
+    assert deduplicator.duplicates == len(new) - len(result)
+
+
+@pytest.mark.parametrize("memory_limit", [64 * 1024 * 1024, 0])
+def test_dedup_ranked(tmp_path, memory_limit):
+    # password{i} occurs i % 50 + 1 times
+    lines = [f"password{i}".encode() for i in range(20000) for _ in range(i % 50 + 1)]
+    deduplicator = ExternalDeduplicator(memory_limit, tmp_path)
+    for line in lines:
+        deduplicator.add(line)
+    spilled = deduplicator.spilled
+    assert spilled == (memory_limit == 0)
+
+    result = list(deduplicator.ranked())
+    assert sorted(result) == sorted(set(lines))
+    counts = [int(line[len("password") :]) % 50 + 1 for line in result]
+    # The head is ordered exactly, the rest at least by power of two bands
+    assert counts[:400] == [50] * 400
+    bands = [count.bit_length() for count in counts]
+    assert bands == sorted(bands, reverse=True)
+    if not spilled:
+        assert counts == sorted(counts, reverse=True)
+    assert not any(tmp_path.iterdir())
+
+
+def test_dedup_spill_fanout_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "_ENTRY_OVERHEAD", 200)
+    # A corpus far larger than the budget still opens few spill files at once
+    deduplicator = ExternalDeduplicator(0, tmp_path, expected_size=100 * 2**30)
+    lines = make_lines(30000, 1)
+    for line in lines:
+        deduplicator.add(line)
+    assert deduplicator.spilled
+    (spill_dir,) = tmp_path.iterdir()
+    assert len(list(spill_dir.iterdir())) == 2**dedup._PARTITION_BITS == 64
+    assert sorted(deduplicator.unique()) == sorted(lines)
+
+
+def test_dedup_ranked_memory_limit(tmp_path):
+    # The table alone fits, but not together with its sorted copy
+    count = 140_000
+    memory_limit = 16 * 1024 * 1024
+    tracemalloc.start()
+    try:
+        deduplicator = ExternalDeduplicator(memory_limit, tmp_path)
+        for i in range(count):
+            line = b"password%07d" % i
+            for _ in range(i % 3 + 1):
+                deduplicator.add(line)
+        ranked = sum(1 for _ in deduplicator.ranked())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert ranked == count
+    assert peak < memory_limit
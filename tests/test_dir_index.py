@@ -0,0 +1,88 @@
+import os
+from pathlib import Path
+
+from src.dir_index import DirectoryIndex
+from src.generate_dic import generate_dict
+from src.shard_index import find_shards
+from src.utils import get_files_in_dir
+
+
+def test_files_match_get_files_in_dir(tmp_path):
+    for name in [
+        "a.txt",
+        ".hidden.txt",
+        "plain_pass_1.txt",
+        "sub/b_only_pass.txt",
+        "sub/deeper/c.zip",
+        "sub/deeper/d.md",
+    ]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(name)
+    (tmp_path / "empty").mkdir()
+
+    index = DirectoryIndex(tmp_path)
+    filters = [
+        {},
+        {"suffix": ".txt"},
+        {"suffix": [".txt", ".zip"], "not_prefix": "plain_pass_"},
+        {"prefix": "b", "not_suffix": "only_pass.txt"},
+    ]
+    for kwargs in filters:
+        assert sorted(index.files(**kwargs)) == sorted(
+            get_files_in_dir(tmp_path, **kwargs)
+        )
+    assert index.files(directory=tmp_path / "sub", recursive=False) == [
+        tmp_path / "sub" / "b_only_pass.txt"
+    ]
+    assert find_shards(tmp_path, index) == find_shards(tmp_path)
+
+
+def test_add_remove_and_cached_stat(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_bytes(b"12345")
+    index = DirectoryIndex(tmp_path)
+    assert index.size(source) == 5
+
+    # The stat result is cached until the file is reported again
+    source.write_bytes(b"1234567890")
+    assert index.size(source) == 5
+    index.add(source)
+    assert index.size(source) == 10
+
+    created = tmp_path / "b.txt"
+    created.write_bytes(b"1")
+    assert created not in index
+    index.add(created)
+    assert sorted(index.files()) == [source, created]
+
+    index.remove(source)
+    assert not source.exists()
+    assert index.files() == [created]
+
+
+def test_generate_dict_walks_once(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_bytes(b"password1\n")
+    (tmp_path / "need_to_split").mkdir()
+    (tmp_path / "need_to_split" / "combo.txt").write_bytes(b"user:password2\n")
+
+    scans = []
+    scandir = os.scandir
+
+    def counting_scandir(path="."):
+        if not isinstance(path, int):
+            # shutil.rmtree scans by file descriptor
+            scans.append(Path(path))
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    monkeypatch.setattr(
+        Path, "rglob", lambda *args: (_ for _ in ()).throw(AssertionError("rglob"))
+    )
+    generate_dict(tmp_path)
+
+    # One scandir per directory, plus the final cleanup of the root
+    assert sorted(scans) == [tmp_path, tmp_path, tmp_path / "need_to_split"]
+    assert (tmp_path / "plain_pass_1.txt").read_bytes().splitlines() == [
+        b"password1",
+        b"password2",
+    ]
@@ -0,0 +1,95 @@
+import json
+import zipfile
+from collections import Counter
+
+import pytest
+
+from src.candidate import to_hex
+from src.formats import COMBO, SourceFormat, parse_block, sniff
+from src.generate_dic import generate_dict
+from src.stats import PipelineStats
+
+HASH = b"5f4dcc3b5aa765d61d8327deb882cf99"
+
+
+@pytest.mark.parametrize(
+    "head, expected",
+    [
+        (b"a@b.com:password1\nc@d.com;password2\n", COMBO),
+        (b"user1\tpassword1\nuser2\tpassword2\n", SourceFormat("tsv", 1, 2)),
+        (
+            b"a@b.com|%s|password1\nc@d.com|%s|password2\n" % (HASH, HASH),
+            SourceFormat("pipe", 2, 3),
+        ),
+        # The password is not always the last column
+        (
+            b"a@b.com|password1|%s\nc@d.com|password2|%s\n" % (HASH, HASH),
+            SourceFormat("pipe", 1, 3),
+        ),
+        (
+            b'id,email,password,created\n1,a@b.com,"pass,word1",2020\n',
+            SourceFormat("csv", 2, 4, header=True),
+        ),
+        (
+            b'{"email": "a@b.com", "Password": "password1"}\n{"email": "c"}\n',
+            SourceFormat("jsonl", "Password"),
+        ),
+        (b'{"email": "a@b.com"}\n', SourceFormat("jsonl")),
+        (b"", COMBO),
+    ],
+)
+def test_sniff(head, expected):
+    assert sniff(head) == expected
+
+
+def test_parse_block():
+    tsv = SourceFormat("tsv", 1, 2)
+    block = b"user1\tpassword1\r\nuser2\tshort\nbroken\nuser3\tpass\tword\n"
+    counts = Counter()
+    # The tab of the last field stays part of the password
+    assert parse_block(block, tsv, counts) == [b"password1", to_hex(b"pass\tword")]
+    assert counts == {"lines_in": 4, "lines_out": 2, "no_field": 1, "too_short": 1}
+
+    pipe = SourceFormat("pipe", 1, 3)
+    assert parse_block(b"a|password1|x\na|pass|word|x\n", pipe) == [b"password1"]
+
+    csv = SourceFormat("csv", 1, 2)
+    block = b'a,"quoted, password"\nb,unquoted,password\nc,caf\xe9caf\xe9\n'
+    assert parse_block(block, csv) == [
+        b"quoted, password",
+        b"unquoted,password",
+        b"$HEX[636166e9636166e9]",
+    ]
+
+    jsonl = SourceFormat("jsonl", "password")
+    block = b'{"password": "p\\u00e4sswort1"}\n{"password": 12345678}\nnot json\n'
+    assert parse_block(block, jsonl) == ["pässwort1".encode()]
+
+
+def test_generate_dict_formats(tmp_path):
+    need_to_split = tmp_path / "need_to_split"
+    need_to_split.mkdir()
+    (need_to_split / "combo.txt").write_bytes(b"a@b.com:password1\n")
+    (need_to_split / "dump.txt").write_bytes(
+        b"a@b.com|%s|password2\nc@d.com|%s|password3\n" % (HASH, HASH)
+    )
+    # Structured sources are sniffed wherever they are
+    (tmp_path / "users.csv").write_bytes(b"email,password\na@b.com,password4\n")
+    with zipfile.ZipFile(tmp_path / "export.zip", "w") as zipf:
+        zipf.writestr("export.jsonl", b'{"pass": "password5"}\n{"pass": "tiny"}\n')
+    (tmp_path / "plain.txt").write_bytes(b"a@b.com|plain|password6\n")
+
+    stats = PipelineStats(trace_memory=False)
+    generate_dict(tmp_path, stats=stats)
+
+    lines = (tmp_path / "plain_pass_1.txt").read_bytes().splitlines()
+    assert sorted(lines) == [b"a@b.com|plain|password6"] + [
+        b"password%d" % i for i in range(1, 6)
+    ]
+    formats = json.loads(json.dumps(stats.to_dict()))["stages"]["flatten"]["formats"]
+    assert sorted(formats) == ["combo", "csv", "jsonl", "pipe", "plain"]
+    assert formats["pipe"]["files"] == 1
+    assert formats["pipe"]["lines_out"] == 2
+    assert formats["jsonl"]["yield"] == 0.5
+    assert formats["csv"]["bytes_in"] == len(b"a@b.com,password4\n")
+    assert formats["combo"]["mb_per_second"] > 0
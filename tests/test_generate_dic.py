@@ -0,0 +1,278 @@
+import gzip
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+from src.formats import COMBO
+from src.generate_dic import (
+    find_line_ranges,
+    flatten_pass,
+    generate_dict,
+    read_range,
+    split_block,
+    split_line,
+)
+from src.manifest import MANIFEST_NAME
+from src.shard_index import (
+    ShardIndex,
+    count_lines,
+    find_shards,
+    open_shard,
+    shard_glob,
+)
+from src.stats import PipelineStats
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (b"user@example.com:hunter2hunter2\n", b"hunter2hunter2"),
+        (b"5f4dcc3b5aa765d61d8327deb882cf99;password123\r\n", b"password123"),
+        (b"user;name:pass:word:1\n", b"name:pass:word:1"),
+        (b"user:short\n", None),
+        (b"no delimiter here\n", None),
+        (b"\n", None),
+        (b"user:p\xc3\xa4sswort1\n", b"p\xc3\xa4sswort1"),
+        # 7 characters in 8 bytes is still too short
+        (b"user:p\xc3\xa4sswo\n", None),
+        (b"user:caf\xe9caf\xe9\n", b"$HEX[636166e9636166e9]"),
+        (b"user:pass\x00word\n", b"$HEX[7061737300776f7264]"),
+        (b"user:$HEX[70617373776f7264]\n", b"password"),
+        # A literal "$HEX[" prefix must not be interpreted by hashcat
+        (
+            b"user:$HEX[zz]password\n",
+            b"$HEX[" + b"$HEX[zz]password".hex().encode() + b"]",
+        ),
+    ],
+)
+def test_split_line(line, expected):
+    assert split_line(line) == expected
+    assert split_block(line) == ([expected] if expected else [])
+
+
+def test_flatten_pass(tmp_path):
+    (tmp_path / "a_only_pass.txt").write_bytes(
+        b"password1\nshort\ncaf\xe9caf\xe9\npassword2\n"
+    )
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b_only_pass.txt").write_bytes(
+        b"password2\n  password1  \r\n$HEX[636166e9636166e9]\n"
+    )
+
+    flatten_pass(tmp_path, is_delete=True)
+
+    shards = sorted(tmp_path.glob("plain_pass_*.txt"))
+    lines = b"".join(p.read_bytes() for p in shards).splitlines()
+    assert sorted(lines) == [b"$HEX[636166e9636166e9]", b"password1", b"password2"]
+    assert not list(tmp_path.rglob("*_only_pass.txt"))
+
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 7])
+def test_read_range_matches_split_line(tmp_path, parts):
+    lines = [f"user{i}@mail.com:password{i}".encode() for i in range(500)]
+    lines += [b"no-delimiter", b"user:short", b"user;caf\xe9caf\xe9"]
+    source = tmp_path / "combo.txt"
+    source.write_bytes(b"\n".join(lines))
+
+    ranges = find_line_ranges(source, parts)
+    assert ranges[0][0] == 0 and ranges[-1][1] == source.stat().st_size
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+    result = []
+    for start, end in ranges:
+        joined, _ = read_range(source, start, end, COMBO)
+        result += joined.splitlines()
+    assert result == [p for p in map(split_line, lines) if p]
+
+
+def test_generate_dict_streams_archives(tmp_path):
+    with zipfile.ZipFile(tmp_path / "rockyou.txt.zip", "w") as zipf:
+        zipf.writestr("rockyou.txt", b"password1\nshort\npassword2\n")
+    (tmp_path / "crackstation.txt.gz").write_bytes(gzip.compress(b"password3\n"))
+    (tmp_path / "plain.txt").write_bytes(b"password1\npassword4\n")
+
+    need_to_split = tmp_path / "need_to_split"
+    need_to_split.mkdir()
+    nested = gzip.compress(b"a@b.com:password5\nc@d.com;password6\nbroken\n")
+    with tarfile.open(need_to_split / "collection.tar.gz", "w:gz") as tar:
+        info = tarfile.TarInfo("collection/combo.txt.gz")
+        info.size = len(nested)
+        tar.addfile(info, io.BytesIO(nested))
+
+    generate_dict(tmp_path)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        ".manifest.json",
+        ".plain_pass_1.idx",
+        "plain_pass_1.txt",
+    ]
+    lines = (tmp_path / "plain_pass_1.txt").read_bytes().splitlines()
+    assert sorted(lines) == [b"password%d" % i for i in range(1, 7)]
+
+
+def test_generate_dict_incremental(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"password1\npassword2\n")
+    need_to_split = tmp_path / "need_to_split"
+    need_to_split.mkdir()
+    (need_to_split / "combo.txt").write_bytes(b"x:password2\ny:password3\n")
+
+    generate_dict(tmp_path, incremental=True, processes=1)
+    shard = tmp_path / "plain_pass_1.txt"
+    first = shard.read_bytes()
+    assert sorted(first.splitlines()) == [b"password1", b"password2", b"password3"]
+    # Sources are kept, temporary split files are removed
+    assert (tmp_path / "a.txt").exists() and (need_to_split / "combo.txt").exists()
+    assert not list(tmp_path.rglob("*only_pass.txt"))
+
+    # Nothing new, nothing changes
+    generate_dict(tmp_path, incremental=True)
+    assert shard.read_bytes() == first
+
+    (tmp_path / "b.txt").write_bytes(b"password3\npassword4\n")
+    # A copy of an already processed source is recognised by its content
+    (tmp_path / "a_copy.txt").write_bytes(b"password1\npassword2\n")
+    generate_dict(tmp_path, incremental=True)
+    assert shard.read_bytes() == first + b"password4\n"
+
+    manifest = json.loads((tmp_path / ".manifest.json").read_text())
+    entries = sorted((e["path"], e["candidates"]) for e in manifest["sources"].values())
+    assert entries == [("a.txt", 2), ("b.txt", 2), ("need_to_split/combo.txt", 2)]
+
+
+def test_generate_dict_rerun_keeps_shards(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"password1\npassword2\n")
+    generate_dict(tmp_path)
+    shards = find_shards(tmp_path)
+    content = [shard.read_bytes() for shard in shards]
+    manifest = (tmp_path / MANIFEST_NAME).read_text()
+
+    # The sources were consumed, nothing is left to rebuild from
+    generate_dict(tmp_path)
+    assert find_shards(tmp_path) == shards
+    assert [shard.read_bytes() for shard in shards] == content
+    assert (tmp_path / MANIFEST_NAME).read_text() == manifest
+
+
+def test_flatten_pass_rank(tmp_path):
+    (tmp_path / "a_only_pass.txt").write_bytes(b"password1\npassword2\npassword3\n")
+    (tmp_path / "b_only_pass.txt").write_bytes(b"password3\npassword2\npassword3\n")
+
+    flatten_pass(tmp_path, rank=True)
+
+    lines = (tmp_path / "plain_pass_1.txt").read_bytes().splitlines()
+    assert lines == [b"password3", b"password2", b"password1"]
+
+
+def test_generate_dict_tiers(tmp_path):
+    (tmp_path / "chrome_pass.txt").write_bytes(b"personal1\n")
+    (tmp_path / "personal").mkdir()
+    (tmp_path / "personal" / "old.txt").write_bytes(b"personal2\nshared12\n")
+    (tmp_path / "curated").mkdir()
+    (tmp_path / "curated" / "top.txt").write_bytes(b"curated1\nshared12\n")
+    (tmp_path / "leak.txt").write_bytes(b"bulk0001\ncurated1\npersonal1\n")
+
+    generate_dict(tmp_path, incremental=True)
+    shards = find_shards(tmp_path)
+    assert [shard.name for shard in shards] == [
+        "plain_pass_personal_1.txt",
+        "plain_pass_curated_1.txt",
+        "plain_pass_1.txt",
+    ]
+    # Every password is only in the highest tier it occurs in
+    assert [sorted(shard.read_bytes().splitlines()) for shard in shards] == [
+        [b"personal1", b"personal2", b"shared12"],
+        [b"curated1"],
+        [b"bulk0001"],
+    ]
+    assert (tmp_path / ".plain_pass_personal_1.idx").exists()
+    assert shard_glob(tmp_path, "bulk") == "plain_pass_[0-9]*.txt"
+    assert shard_glob(tmp_path, "curated") == "plain_pass_curated_*.txt"
+    assert find_shards(tmp_path, tier="bulk") == shards[2:]
+
+    # New sources of a tier are appended to its shards, a password already in
+    # a lower tier shard is promoted and stays there as well
+    (tmp_path / "curated" / "new.txt").write_bytes(b"curated2\nbulk0001\n")
+    (tmp_path / "leak2.txt").write_bytes(b"curated2\npersonal2\nbulk0002\n")
+    generate_dict(tmp_path, incremental=True)
+    assert find_shards(tmp_path) == shards
+    assert sorted(shards[1].read_bytes().splitlines()) == [
+        b"bulk0001",
+        b"curated1",
+        b"curated2",
+    ]
+    assert sorted(shards[2].read_bytes().splitlines()) == [b"bulk0001", b"bulk0002"]
+
+
+def test_generate_dict_promotes_to_personal(tmp_path):
+    (tmp_path / "leak.txt").write_bytes(b"sharedpass1\n")
+    generate_dict(tmp_path, incremental=True)
+    (tmp_path / "personal").mkdir()
+    (tmp_path / "personal" / "mine.txt").write_bytes(b"sharedpass1\nmyownpass\n")
+    generate_dict(tmp_path, incremental=True)
+    personal, bulk = find_shards(tmp_path)
+    assert personal.name == "plain_pass_personal_1.txt"
+    assert sorted(personal.read_bytes().splitlines()) == [b"myownpass", b"sharedpass1"]
+    assert bulk.read_bytes() == b"sharedpass1\n"
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_flatten_pass_shard_index(tmp_path, compress):
+    passwords = [b"password%05d" % i for i in range(10000)]
+    (tmp_path / "a_only_pass.txt").write_bytes(b"\n".join(passwords[:6000]) + b"\n")
+    # Shards of about 64KiB
+    flatten_pass(tmp_path, size=1 / 16, is_delete=True, compress=compress)
+
+    (tmp_path / "b_only_pass.txt").write_bytes(b"\n".join(passwords[6000:]) + b"\n")
+    flatten_pass(
+        tmp_path,
+        size=1 / 16,
+        append=True,
+        files=[tmp_path / "b_only_pass.txt"],
+        compress=compress,
+    )
+
+    shards = find_shards(tmp_path)
+    assert len(shards) == 3
+    assert count_lines(shards) == len(passwords)
+    for shard in shards:
+        index = ShardIndex.load(shard)
+        assert shard.name.endswith(".txt.gz" if compress else ".txt")
+        with open_shard(shard) as f:
+            assert index.lines == len(f.read().splitlines())
+        assert index.verify(shard)
+        assert vars(index) == vars(ShardIndex.build(shard))
+
+    with open(shards[0], "ab") as f:
+        f.write(b"tampered\n")
+    assert ShardIndex.load(shards[0]) is None
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_generate_dict_stats(tmp_path, processes):
+    (tmp_path / "plain.txt").write_bytes(b"password1\nshort\npassword2\n")
+    need_to_split = tmp_path / "need_to_split"
+    need_to_split.mkdir()
+    (need_to_split / "combo.txt").write_bytes(
+        b"a@b.com:password1\nc@d.com;tiny\nbroken\ne@f.com:password3\n"
+    )
+
+    stats = PipelineStats(profile_path=tmp_path / "flatten.prof")
+    generate_dict(tmp_path, processes=processes, stats=stats)
+    report_path = tmp_path / "report" / "stats.json"
+    stats.write(report_path)
+    stats.dump_profile()
+
+    stages = json.loads(report_path.read_text())["stages"]
+    # Splitting is part of the flatten pipeline, 4 combo lines and 3 plain lines
+    assert "split" not in stages
+    assert stages["flatten"]["lines_in"] == 7
+    assert stages["flatten"]["no_delimiter"] == 1
+    assert stages["flatten"]["too_short"] == 2
+    assert stages["flatten"]["lines_out"] == 4
+    assert stages["write"]["duplicate"] == 1
+    assert stages["write"]["lines_out"] == 3
+    assert stages["flatten"]["tracemalloc_peak"] > 0
+    assert (tmp_path / "flatten.prof").exists()
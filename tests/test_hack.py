@@ -1,8 +1,18 @@
 import json
+import sqlite3
 
 import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
 
-from src.hack_metamask import decrypt_metamask_vault
+from src.hack_chrome_password import LoginInfo, derive_login_key, iter_login_data
+from src.hack_metamask import (
+    crack_vault_wordlist,
+    decrypt_metamask_vault,
+    parse_vault_data,
+    scan_vault_data,
+    scan_vault_file,
+)
 
 
 @pytest.mark.parametrize(
@@ -24,3 +34,79 @@ def test_metamask_vault_decryption(vault, password):
     )
     assert found, "Mnemonic phrase decryption failed"
     print(decrypted)
+
+
+VAULT = '{"data":"0MByYgMFk6V4dYZC/N1SxxbMeWPXEtVktMlM4t2gIg0mblM4HGbawHggj4cvwsLRmtIM3nT6f8KcceGhDHJJGB1iWmpVeC4HhA+QR75MdbyR4fhZ9AyvDoSQ0K1m7ckziRWExQG0s9xj4x+0x3k45UDYziKMTXWgrD3SwkkP5asMOOITcdR0rdlmndAIcBz+IBf3zs76EEpsUJx6dhHqRUxAgfH4WRLRq/h2/LyhfnKvhmH+RYz6MZ/sa5P+fcCgZCtOTOdbu8LdJBHsXewUY43d2ti+QfrGmvXCP0ZHj97XWTWCdTwTuDIx/nXPXWhQzVXKVlKarQ5YvmauCWG3QJrYDa3sTduVMuFRwS/+1pIID+ybhrQft2EVRxBVkqcBu/gCCHeM7oOwTEw+UEv5GgduZ5iwFD/KMGRUlh9igoumtzsMIY6BOOQzQBbg5WREQA2Gbh4W+DEK6M2TxJeCg6BkVgT4QuXxgvJK7YFXNsEYNFh/LZ9FOosbx+TXiMJuJrr+czTmzA==","iv":"3/XB0MgtPNz8yFQ0GhkRZQ==","keyMetadata":{"algorithm":"PBKDF2","params":{"iterations":600000}},"salt":"jReEwKFNQ5y3hfwOSQtTALWcKtlB26y5Tu1mk7LkJA8="}'
+
+
+@pytest.mark.parametrize(
+    "candidates, expected",
+    [
+        ([b"password", b"12345678", b"87654321"], b"12345678"),
+        ([b"password", b"87654321"], None),
+    ],
+)
+def test_crack_vault_wordlist(candidates, expected):
+    result = crack_vault_wordlist(json.loads(VAULT), candidates, processes=2)
+    assert result.password == expected
+    assert result.checked <= len(candidates)
+    if expected is None:
+        assert result.checked == len(candidates)
+
+
+def test_decrypt_wrong_password():
+    with pytest.raises(ValueError):
+        decrypt_metamask_vault(json.loads(VAULT), "wrong password")
+
+
+_NOISE = b'\x00\x17{"PreferencesController":{"identities":{}}}\xff\xfe' * 2000
+_LEGACY_VAULT = '{"data":"MDAwMDAwMDAwMDAwMDAw","iv":"MTExMTExMTExMTExMTExMQ==","salt":"MjIyMjIyMjIyMjIyMjIyMg=="}'
+
+
+@pytest.mark.parametrize(
+    "record",
+    [
+        # macOS log, the vault is a JSON string
+        b'KeyringController":{"vault":' + json.dumps(VAULT).encode() + b"}",
+        # Linux log of an older vault without keyMetadata
+        b'"KeyringController":{"vault":"' + _LEGACY_VAULT.encode() + b'"',
+        # Windows ldb
+        b"Keyring0\x01" + json.dumps(_LEGACY_VAULT).encode()[1:-1] + b"}",
+        # Pre-v3 cleartext
+        b'{"wallet-seed":"license recipe sunny\\n"}',
+    ],
+)
+def test_scan_vault_data(record, tmp_path):
+    data = _NOISE + record + _NOISE
+    expected = parse_vault_data(data.decode("utf-8", errors="ignore"))
+    assert scan_vault_data(data) == expected
+
+    log = tmp_path / "000003.log"
+    log.write_bytes(data)
+    assert scan_vault_file(log) == expected
+
+
+def test_scan_vault_data_missing():
+    with pytest.raises(Exception, match="No vaults found"):
+        scan_vault_data(_NOISE)
+
+
+def test_iter_login_data(tmp_path, monkeypatch):
+    monkeypatch.setattr("platform.system", lambda: "Darwin")
+    key = derive_login_key(b"safe storage")
+    encrypted = b"v10" + AES.new(key, AES.MODE_CBC, b"\x20" * 16).encrypt(
+        pad(b"hunter2", AES.block_size)
+    )
+
+    db = tmp_path / "Login Data"
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE logins (origin_url, username_value, password_value)")
+        conn.executemany(
+            "INSERT INTO logins VALUES (?, ?, ?)",
+            [("https://a.example", "alice", encrypted), ("", "bob", b"v11xx")],
+        )
+    conn.close()
+
+    assert list(iter_login_data(db, key)) == [
+        LoginInfo("https://a.example", "alice", "hunter2")
+    ]
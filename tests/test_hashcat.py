@@ -0,0 +1,252 @@
+import json
+import os
+import sys
+
+import pytest
+
+from benchmarks.corpus import make_vault
+from src.hack_metamask import check_vault_fileds, decrypt_metamask_vault
+from src.hashcat import (
+    HASH_MODE,
+    SHORT_HASH_MODE,
+    generate_metamask_hash,
+    parse_metamask_hash,
+    parse_status_line,
+    pick_hash_mode,
+    run_hashcat,
+    vault_from_hash,
+)
+from src.main import confirm_password
+
+_STATUS = {
+    "session": "maskcracker_0",
+    "status": 3,
+    "progress": [250, 1000],
+    "recovered_hashes": [0, 1],
+    "devices": [{"device_id": 1, "speed": 40}, {"device_id": 2, "speed": 60}],
+}
+
+# Stand-in for hashcat: the first attack is exhausted, the second one is
+# interrupted and cracks the hash once restored
+_STUB = """
+import json, sys
+from pathlib import Path
+
+args = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+with open(Path(__file__).with_name("calls.log"), "a") as f:
+    f.write(json.dumps(sys.argv[1:]) + "\\n")
+restore_file = Path(args["restore-file-path"])
+if "--restore" in sys.argv:
+    outfile = json.loads(restore_file.read_text())["outfile"]
+    Path(outfile).write_text("12345678\\n")
+    restore_file.unlink()
+    sys.exit(0)
+if args["session"].endswith("_0"):
+    sys.exit(1)
+print("hashcat (v6.2.6) starting")
+print(STATUS)
+restore_file.write_text(json.dumps({"outfile": args["outfile"]}))
+sys.exit(2)
+"""
+
+# Stand-in for hashcat: the first attack is exhausted, the others are
+# interrupted on their first run and exhausted once restored, only the `new`
+# attack cracks the hash
+_RESUME_STUB = """
+import json, sys
+from pathlib import Path
+
+args = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+with open(Path(__file__).with_name("calls.log"), "a") as f:
+    f.write(json.dumps(sys.argv[1:]) + "\\n")
+restore_file = Path(args["restore-file-path"])
+if "--restore" in sys.argv:
+    restore_file.unlink()
+    sys.exit(1)
+if args["session"].endswith("_new"):
+    Path(args["outfile"]).write_text("12345678\\n")
+    sys.exit(0)
+if args["session"].endswith("_0"):
+    sys.exit(1)
+restore_file.write_text("{}")
+sys.exit(2)
+"""
+
+
+def test_metamask_hashes(tmp_path):
+    vault = make_vault("password", iterations=100)
+    data, iv, salt, iterations = check_vault_fileds(vault)
+    full = generate_metamask_hash(vault, tmp_path / "hash.txt")
+    assert full == (f"$metamask${vault['salt']}$100${vault['iv']}${vault['data']}")
+    assert parse_metamask_hash(full) == (data, iv, salt, iterations)
+    assert decrypt_metamask_vault(vault_from_hash(full), "password")
+
+    short = generate_metamask_hash(vault, tmp_path / "short.txt", SHORT_HASH_MODE)
+    assert short.startswith("$metamask-short$")
+    assert parse_metamask_hash(short) == (data[:32], iv, salt, iterations)
+    with pytest.raises(ValueError):
+        vault_from_hash(short)
+    with pytest.raises(ValueError):
+        parse_metamask_hash("$metamask$b'salt'$100$b'iv'$b'data'")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="stub needs a shebang")
+def test_pick_hash_mode(tmp_path):
+    fields = check_vault_fileds(make_vault("password", iterations=100))
+    stub = tmp_path / "hashcat"
+    stub.write_text(f"#!{sys.executable}\nprint('Hash mode #26610')\n")
+    os.chmod(stub, 0o755)
+    assert pick_hash_mode(stub, fields) == SHORT_HASH_MODE
+    # Too little data for the plaintext check
+    assert pick_hash_mode(stub, (fields[0][:40], *fields[1:])) == HASH_MODE
+    old = tmp_path / "old_hashcat"
+    old.write_text(f"#!{sys.executable}\nimport sys\nsys.exit(255)\n")
+    os.chmod(old, 0o755)
+    assert pick_hash_mode(old, fields) == HASH_MODE
+    assert pick_hash_mode(tmp_path / "missing", fields) == HASH_MODE
+
+
+def test_parse_status_line():
+    status = parse_status_line(json.dumps(_STATUS) + "\n")
+    assert (status.progress, status.total, status.speed) == (250, 1000, 100)
+    assert status.percent == 25.0
+    assert status.eta == 7.5
+    assert parse_status_line("Session..........: hashcat") is None
+    assert parse_status_line("{not json") is None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="stub needs a shebang")
+def test_run_hashcat_restore(tmp_path):
+    stub = tmp_path / "hashcat"
+    stub.write_text(
+        f"#!{sys.executable}\n" + _STUB.replace("STATUS", repr(json.dumps(_STATUS)))
+    )
+    os.chmod(stub, 0o755)
+    hashfile = tmp_path / "hash.txt"
+    hashfile.write_text("$metamask$...")
+    attacks = [["rules.txt"], ["plain_pass_1.txt", "plain_pass_2.txt"]]
+
+    statuses = []
+    with pytest.raises(RuntimeError, match="exit code 2"):
+        run_hashcat(stub, hashfile, attacks, on_status=statuses.append)
+    assert [status.speed for status in statuses] == [100]
+    assert (tmp_path / "maskcracker_1.restore").exists()
+
+    assert run_hashcat(stub, hashfile, attacks) == "12345678"
+    calls = [
+        json.loads(line) for line in (tmp_path / "calls.log").read_text().splitlines()
+    ]
+    assert [call[0] for call in calls] == [
+        "--session=maskcracker_0",
+        "--session=maskcracker_1",
+        "--session=maskcracker_1",
+    ]
+    assert calls[1][-2:] == attacks[1]
+    # The exhausted attack is not repeated, the interrupted one is restored
+    assert calls[2][-1] == "--restore"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="stub needs a shebang")
+def test_run_hashcat_named_sessions(tmp_path):
+    stub = tmp_path / "hashcat"
+    stub.write_text(
+        f"#!{sys.executable}\n" + _STUB.replace("STATUS", repr(json.dumps(_STATUS)))
+    )
+    os.chmod(stub, 0o755)
+    hashfile = tmp_path / "hash.txt"
+    hashfile.write_text("$metamask$...")
+    attacks = [["rules.txt"], ["plain_pass_1.txt"]]
+
+    exhausted, statuses = [], []
+    with pytest.raises(RuntimeError, match="exit code 2"):
+        run_hashcat(
+            stub,
+            hashfile,
+            attacks,
+            on_status=statuses.append,
+            names=["rules_0", "a1b2"],
+            on_exhausted=exhausted.append,
+            mode=SHORT_HASH_MODE,
+        )
+    assert exhausted == [0]
+    calls = (tmp_path / "calls.log").read_text().splitlines()
+    assert all(json.loads(call)[2:4] == ["-m", SHORT_HASH_MODE] for call in calls)
+    assert statuses[0].session == "maskcracker_0"
+    assert (tmp_path / "maskcracker_a1b2.restore").exists()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="stub needs a shebang")
+def test_run_hashcat_new_attack_before_interrupted(tmp_path):
+    stub = tmp_path / "hashcat"
+    stub.write_text(f"#!{sys.executable}\n" + _RESUME_STUB)
+    os.chmod(stub, 0o755)
+    hashfile = tmp_path / "hash.txt"
+    hashfile.write_text("$metamask$...")
+
+    with pytest.raises(RuntimeError, match="exit code 2"):
+        run_hashcat(stub, hashfile, [["plain_pass_5.txt"]], names=["bulk"])
+
+    # A higher priority attack was added in front of the interrupted one
+    exhausted = []
+    attacks = [["plain_pass_personal_1.txt"], ["plain_pass_5.txt"]]
+    password = run_hashcat(
+        stub, hashfile, attacks, names=["new", "bulk"], on_exhausted=exhausted.append
+    )
+    assert password == "12345678"
+    assert exhausted == [1]
+    calls = [
+        json.loads(line) for line in (tmp_path / "calls.log").read_text().splitlines()
+    ]
+    assert [call[0] for call in calls] == [
+        "--session=maskcracker_bulk",
+        "--session=maskcracker_bulk",
+        "--session=maskcracker_new",
+    ]
+    assert calls[1][-1] == "--restore"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="stub needs a shebang")
+def test_run_hashcat_restore_skips_finished_attacks(tmp_path):
+    stub = tmp_path / "hashcat"
+    stub.write_text(f"#!{sys.executable}\n" + _RESUME_STUB)
+    os.chmod(stub, 0o755)
+    hashfile = tmp_path / "hash.txt"
+    hashfile.write_text("$metamask$...")
+    attacks = [["plain_pass_1.txt"], ["plain_pass_2.txt"]]
+
+    with pytest.raises(RuntimeError, match="exit code 2"):
+        run_hashcat(stub, hashfile, attacks)
+    exhausted = []
+    assert run_hashcat(stub, hashfile, attacks, on_exhausted=exhausted.append) is None
+    assert exhausted == [1]
+    calls = [
+        json.loads(line) for line in (tmp_path / "calls.log").read_text().splitlines()
+    ]
+    # The exhausted first attack is not started again
+    assert [call[0] for call in calls] == [
+        "--session=maskcracker_0",
+        "--session=maskcracker_1",
+        "--session=maskcracker_1",
+    ]
+    assert calls[2][-1] == "--restore"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="stub needs a shebang")
+def test_run_hashcat_non_ascii_password(tmp_path):
+    password = "pässwörd-密码"
+    hashfile = tmp_path / "hash.txt"
+    generate_metamask_hash(make_vault(password, iterations=100), hashfile)
+    stub = tmp_path / "hashcat"
+    plain = "$HEX[" + password.encode().hex() + "]"
+    stub.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "from pathlib import Path\n"
+        "args = dict(a[2:].split('=', 1) for a in sys.argv[1:] if '=' in a)\n"
+        f"Path(args['outfile']).write_text({plain!r} + '\\n')\n"
+    )
+    os.chmod(stub, 0o755)
+
+    cracked = run_hashcat(stub, hashfile, [["plain_pass_1.txt"]])
+    assert cracked == password
+    assert confirm_password(hashfile, cracked)
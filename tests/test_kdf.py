@@ -0,0 +1,43 @@
+import pytest
+
+from src import kdf
+from src.kdf import (
+    KEY_LENGTH,
+    available_backends,
+    benchmark_backends,
+    derive_key,
+    get_backend,
+    set_backend,
+)
+
+
+@pytest.fixture(autouse=True)
+def restore_backend(monkeypatch):
+    # set_backend changes the backend of the whole process
+    monkeypatch.setattr(kdf, "_selected", None)
+
+
+def test_backends_derive_same_key():
+    keys = {
+        name: derive_key_with(name, b"12345678", b"salt" * 8, 1000)
+        for name in available_backends()
+    }
+    assert len(set(keys.values())) == 1
+    assert all(len(key) == KEY_LENGTH for key in keys.values())
+
+
+def derive_key_with(name, password, salt, iterations):
+    set_backend(name)
+    return derive_key(password, salt, iterations)
+
+
+def test_benchmark_and_selection():
+    results = benchmark_backends(1000, rounds=1)
+    assert set(results) == set(available_backends())
+    rates = list(results.values())
+    assert rates == sorted(rates, reverse=True)
+
+    assert set_backend() in available_backends()
+    assert get_backend() in available_backends()
+    with pytest.raises(ValueError):
+        set_backend("unknown")
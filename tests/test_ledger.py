@@ -0,0 +1,129 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.corpus import make_vault
+from src.generate_dic import generate_dict
+from src.hack_metamask import check_vault_fileds
+from src.hashcat import generate_metamask_hash, parse_metamask_hash
+from src.ledger import (
+    LEDGER_NAME,
+    VaultLedger,
+    covered_checksums,
+    shard_checksum,
+    vault_fingerprint,
+    verify_shard,
+)
+from src.main import hashcat_attacks
+from src.shard_index import ShardIndex, find_shards
+
+
+def test_vault_fingerprint(tmp_path):
+    vault = make_vault("password", iterations=100)
+    fields = check_vault_fileds(vault)
+    hash_string = generate_metamask_hash(vault, tmp_path / "hash.txt")
+    # The hashfile identifies the same vault
+    assert vault_fingerprint(parse_metamask_hash(hash_string)) == vault_fingerprint(
+        fields
+    )
+    assert vault_fingerprint(fields) != vault_fingerprint(
+        check_vault_fileds(make_vault("password", iterations=100, seed=1))
+    )
+
+
+def test_ledger_per_vault(tmp_path):
+    ledger = VaultLedger(tmp_path, "vault-a")
+    ledger.record_progress("shard-1", "plain_pass_1.txt", 500)
+    ledger.record_progress("shard-1", "plain_pass_1.txt", 200)
+    ledger.mark_tested("shard-2", "plain_pass_2.txt")
+    ledger.save()
+    other = VaultLedger(tmp_path, "vault-b")
+    other.record_progress("shard-3", "plain_pass_3.txt", 10)
+    other.save()
+
+    ledger = VaultLedger(tmp_path, "vault-a")
+    assert ledger.progress("shard-1") == 500 and not ledger.tested("shard-1")
+    assert ledger.tested("shard-2")
+    assert ledger.progress("shard-3") == 0
+    assert covered_checksums(tmp_path) == {"shard-1", "shard-2", "shard-3"}
+    data = json.loads((tmp_path / LEDGER_NAME).read_text())
+    assert sorted(data["vaults"]) == ["vault-a", "vault-b"]
+
+
+def test_ledger_excludes_tested_work(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"password1\npassword5\n")
+    (tmp_path / "curated").mkdir()
+    (tmp_path / "curated" / "top.txt").write_bytes(b"password2\n")
+    generate_dict(tmp_path, incremental=True)
+    curated, bulk = find_shards(tmp_path)
+
+    ledger = VaultLedger(tmp_path, "vault")
+    ledger.mark_tested(shard_checksum(curated), curated.name)
+    ledger.record_progress(shard_checksum(bulk), bulk.name, 1)
+    ledger.save()
+    attacks = hashcat_attacks(tmp_path / "hash.txt", tmp_path, False, ledger)
+    assert attacks == [
+        (shard_checksum(bulk), ["--skip=1", "-a", "0", str(bulk.resolve())])
+    ]
+
+    # Tested shards are not extended, new candidates get a shard of their own
+    (tmp_path / "b.txt").write_bytes(b"password3\n")
+    (tmp_path / "curated" / "new.txt").write_bytes(b"password4\n")
+    generate_dict(tmp_path, incremental=True)
+    assert [shard.name for shard in find_shards(tmp_path)] == [
+        "plain_pass_curated_1.txt",
+        "plain_pass_curated_2.txt",
+        "plain_pass_1.txt",
+        "plain_pass_2.txt",
+    ]
+    assert curated.read_bytes() == b"password2\n"
+    assert bulk.read_bytes() == b"password1\npassword5\n"
+
+
+def test_ledger_trusts_verified_shards(tmp_path):
+    (tmp_path / "curated").mkdir()
+    (tmp_path / "curated" / "top.txt").write_bytes(b"password1\npassword2\n")
+    (tmp_path / "a.txt").write_bytes(b"password3\n")
+    generate_dict(tmp_path, incremental=True)
+    first, second = find_shards(tmp_path)
+    assert verify_shard(first)
+
+    ledger = VaultLedger(tmp_path, "vault")
+    ledger.mark_tested(shard_checksum(first), first.name)
+    # Interrupted at the very end of the wordlist
+    ledger.record_progress(shard_checksum(second), second.name, 1)
+    assert hashcat_attacks(tmp_path / "hash.txt", tmp_path, False, ledger) == []
+
+    # Edited in place without a change of size or index
+    mtime_ns = first.stat().st_mtime_ns
+    first.write_bytes(first.read_bytes().replace(b"password", b"passw0rd"))
+    # Within the resolution of the file system clock the edit keeps the mtime
+    os.utime(first, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+    attacks = hashcat_attacks(tmp_path / "hash.txt", tmp_path, False, ledger)
+    assert attacks == [(shard_checksum(first), ["-a", "0", str(first.resolve())])]
+    assert verify_shard(first)
+
+
+def test_ledger_rereads_only_changed_shards(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_bytes(b"password1\npassword2\n")
+    generate_dict(tmp_path, incremental=True)
+    (shard,) = find_shards(tmp_path)
+    ledger = VaultLedger(tmp_path, "vault")
+    ledger.record_progress(shard_checksum(shard), shard.name, 1)
+
+    # Edited in place, keeping the size and the mtime
+    stat = shard.stat()
+    shard.write_bytes(b"passw0rd1\npassw0rd2\n")
+    os.utime(shard, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    verify = ShardIndex.verify
+    monkeypatch.setattr(ShardIndex, "verify", lambda self, shard: pytest.fail())
+    attacks = hashcat_attacks(tmp_path / "hash.txt", tmp_path, False, ledger)
+    assert attacks == [
+        (shard_checksum(shard), ["--skip=1", "-a", "0", str(shard.resolve())])
+    ]
+
+    # An explicit verify reads the content
+    monkeypatch.setattr(ShardIndex, "verify", verify)
+    attacks = hashcat_attacks(tmp_path / "hash.txt", tmp_path, False, ledger, True)
+    assert attacks == [(shard_checksum(shard), ["-a", "0", str(shard.resolve())])]
@@ -0,0 +1,137 @@
+import json
+import struct
+
+import pytest
+
+from src.leveldb import (
+    iter_log_entries,
+    iter_table_entries,
+    read_keyring_vault,
+    snappy_decompress,
+)
+
+_VAULT = {"data": "ZGF0YQ==", "iv": "aXY=", "salt": "c2FsdA=="}
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _snappy_literal(data: bytes) -> bytes:
+    # A valid Snappy block made of a single literal
+    n = len(data) - 1
+    if n < 60:
+        return _varint(len(data)) + bytes([n << 2]) + data
+    return _varint(len(data)) + bytes([61 << 2]) + n.to_bytes(2, "little") + data
+
+
+def _batch(sequence: int, entries: list[tuple[bytes, bytes | None]]) -> bytes:
+    out = bytearray(struct.pack("<QI", sequence, len(entries)))
+    for key, value in entries:
+        out += bytes([value is not None]) + _varint(len(key)) + key
+        if value is not None:
+            out += _varint(len(value)) + value
+    return bytes(out)
+
+
+def _log(records: list[bytes]) -> bytes:
+    # Fragment every record over 32KiB blocks like the LevelDB log writer
+    out = bytearray()
+    for record in records:
+        first = True
+        while True:
+            left = 32 * 1024 - len(out) % (32 * 1024)
+            if left < 7:
+                out += b"\x00" * left
+                left = 32 * 1024
+            fragment, record = record[: left - 7], record[left - 7 :]
+            if first and not record:
+                kind = 1
+            elif first:
+                kind = 2
+            elif record:
+                kind = 3
+            else:
+                kind = 4
+            out += struct.pack("<IHB", 0, len(fragment), kind) + fragment
+            first = False
+            if not record:
+                break
+    return bytes(out)
+
+
+def _block(entries: list[tuple[bytes, bytes]]) -> bytes:
+    out = bytearray()
+    for key, value in entries:
+        out += _varint(0) + _varint(len(key)) + _varint(len(value)) + key + value
+    return bytes(out) + struct.pack("<II", 0, 1)
+
+
+def _table(entries: list[tuple[bytes, int, bytes]]) -> bytes:
+    data_block = _snappy_literal(
+        _block([(key + struct.pack("<Q", seq << 8 | 1), v) for key, seq, v in entries])
+    )
+    out = bytearray(data_block + b"\x01" + b"\x00" * 4)
+    index = _block([(b"\xff", _varint(0) + _varint(len(data_block)))])
+    index_offset = len(out)
+    out += index + b"\x00" * 5
+    footer = _varint(0) + _varint(0) + _varint(index_offset) + _varint(len(index))
+    footer = footer.ljust(40, b"\x00") + struct.pack("<Q", 0xDB4775248B80FB57)
+    return bytes(out + footer)
+
+
+def _controller(vault: dict) -> bytes:
+    return json.dumps({"vault": json.dumps(vault)}).encode()
+
+
+def test_snappy_decompress():
+    # Literal "abc" followed by an overlapping copy of 9 bytes at offset 3
+    assert snappy_decompress(b"\x0c\x08abc\x15\x03") == b"abc" * 4
+    assert snappy_decompress(_snappy_literal(b"x" * 100)) == b"x" * 100
+    with pytest.raises(ValueError):
+        snappy_decompress(b"\x0d\x08abc\x15\x03")
+
+
+def test_iter_log_entries():
+    value = b"v" * 70000
+    data = _log([_batch(1, [(b"a", b"1"), (b"b", None)]), _batch(3, [(b"c", value)])])
+    assert list(iter_log_entries(data)) == [
+        (b"a", 1, b"1"),
+        (b"b", 2, None),
+        (b"c", 3, value),
+    ]
+    # A torn tail is ignored
+    assert list(iter_log_entries(data[:100])) == [(b"a", 1, b"1"), (b"b", 2, None)]
+
+
+def test_iter_table_entries():
+    data = _table([(b"a", 5, b"x" * 200), (b"b", 6, b"y")])
+    assert list(iter_table_entries(data)) == [(b"a", 5, b"x" * 200), (b"b", 6, b"y")]
+
+
+def test_read_keyring_vault(tmp_path):
+    stale = dict(_VAULT, iv="c3RhbGU=")
+    (tmp_path / "000005.ldb").write_bytes(
+        _table([(b"KeyringController", 4, _controller(stale))])
+    )
+    (tmp_path / "000003.log").write_bytes(
+        _log(
+            [
+                _batch(2, [(b"KeyringController", _controller(stale))]),
+                _batch(7, [(b"KeyringController", _controller(_VAULT))]),
+            ]
+        )
+    )
+    (tmp_path / "LOCK").write_bytes(b"")
+    assert read_keyring_vault(tmp_path) == _VAULT
+
+
+def test_read_keyring_vault_missing(tmp_path):
+    (tmp_path / "000003.log").write_bytes(_log([_batch(1, [(b"data", b"{}")])]))
+    with pytest.raises(Exception, match="No vaults found"):
+        read_keyring_vault(tmp_path)
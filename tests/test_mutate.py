@@ -0,0 +1,53 @@
+import pytest
+
+from src.mutate import (
+    apply_rule,
+    generate_base_words,
+    generate_rules,
+    split_structure,
+    write_mutation_files,
+)
+
+PASSWORDS = ["summer2019!", "Summer2020", "john.smith88", "Tr0ub4dor&3"]
+
+
+@pytest.mark.parametrize(
+    "password, expected",
+    [
+        ("summer2019!", ("", "summer", "2019!")),
+        ("2024Summer.Sun!99", ("2024", "Summer.Sun", "!99")),
+        ("12345678", ("", "12345678", "")),
+    ],
+)
+def test_split_structure(password, expected):
+    assert split_structure(password) == expected
+
+
+@pytest.mark.parametrize(
+    "variant",
+    [
+        "summer2021",
+        "Summer2019!",
+        "summer2020",
+        "john_smith88",
+        "johnsmith88",
+        "SUMMER123",
+    ],
+)
+def test_rules_reach_variants(variant):
+    words = generate_base_words(PASSWORDS)
+    rules = generate_rules(PASSWORDS)
+    assert any(apply_rule(word, rule) == variant for word in words for rule in rules)
+
+
+def test_rules_are_ranked(tmp_path):
+    assert len(generate_rules(PASSWORDS, max_rules=50)) == 50
+    rules = generate_rules(PASSWORDS)
+    assert rules[0] == ":"
+    # Suffixes of the user's own passwords rank above generic ones
+    assert rules.index("$2$0$1$9$!") < rules.index("$1$2$3")
+
+    base_path, rule_path = write_mutation_files(PASSWORDS + ["a\nb"], tmp_path)
+    assert generate_base_words(PASSWORDS)[0] == "summer"
+    assert base_path.read_text().splitlines() == generate_base_words(PASSWORDS)
+    assert len(rule_path.read_text().splitlines()) <= 2000
@@ -0,0 +1,112 @@
+import io
+import itertools
+
+from benchmarks.corpus import human_passwords
+from src.pcfg import (
+    MODEL_NAME,
+    PcfgModel,
+    ShardFilter,
+    evaluate,
+    load_or_train,
+    parse_password,
+    write_guesses,
+)
+from src.shard_writer import ShardWriter
+
+
+def test_parse_password():
+    assert parse_password("Password12!") == [
+        ("L8", "password"),
+        ("M8", "Ulllllll"),
+        ("D2", "12"),
+        ("S1", "!"),
+    ]
+    assert parse_password("") == []
+
+
+def test_guesses_in_descending_probability():
+    model = PcfgModel()
+    model.train(["password1"] * 6 + ["Password1"] * 2 + ["password2", "dragon12"])
+    model.train(["monkey99!"], weight=3)
+    guesses = list(model.guesses())
+    # L8 M8 D1 in 9 of 13, `llllllll` in 7 of 9 and `1` in 8 of 9
+    assert guesses[0] == ("password1", 9 / 13 * 7 / 9 * 8 / 9)
+    probabilities = [p for _, p in guesses]
+    assert probabilities == sorted(probabilities, reverse=True)
+    passwords = [password for password, _ in guesses]
+    # Every combination of the learned parts, exactly once
+    assert len(passwords) == len(set(passwords))
+    assert {"Password1", "password2", "dragon12", "monkey99!"} <= set(passwords)
+    # Unseen combinations of seen parts
+    assert {"Password2", "monkey12", "dragon99!"} <= set(passwords)
+    # Too short for a MetaMask password
+    assert "dragon1" not in passwords
+    assert [p for p, _ in model.guesses(budget=3)] == passwords[:3]
+
+
+def test_enumeration_matches_brute_force():
+    model = PcfgModel()
+    model.train(human_passwords(2000))
+    guesses = list(model.guesses(budget=5000))
+    # The probability of a guess from the model's own counters
+    expected = {}
+    for slots, count in model.structures.items():
+        if sum(int(s[1:]) for s in slots if s[0] != "M") < 8:
+            continue
+        terminals = [model.terminals[slot].items() for slot in slots]
+        for combination in itertools.product(*terminals):
+            probability = count / model._structure_total
+            for slot, (_, n) in zip(slots, combination):
+                probability *= n / model._slot_totals[slot]
+            expected[tuple(t for t, _ in combination), slots] = probability
+    best = sorted(expected.values(), reverse=True)[: len(guesses)]
+    assert [p for _, p in guesses] == best
+
+
+def test_load_or_train_and_write(tmp_path):
+    writer = ShardWriter(tmp_path, max_size=2**20)
+    for password in human_passwords(1000):
+        writer.add(password.encode())
+    writer.close()
+
+    model = load_or_train(tmp_path, writer.shards, ["Personal2024"])
+    assert model.trained_lines == 1001
+    assert (tmp_path / MODEL_NAME).exists()
+    # Cached until the training data changes
+    cached = load_or_train(tmp_path, writer.shards, ["Personal2024"])
+    assert cached.structures == model.structures
+    retrained = load_or_train(tmp_path, writer.shards, [], max_lines=10)
+    assert retrained.trained_lines == 10
+
+    output = io.BytesIO()
+    assert write_guesses(model, output, 100) == 100
+    lines = output.getvalue().splitlines()
+    assert len(lines) == len(set(lines)) == 100
+    assert all(len(line) >= 8 for line in lines)
+
+    result = evaluate(model, human_passwords(500, seed=1) + ["short"], 1000)
+    assert result["guesses"] == 1000
+    assert 0 < result["hit_rate"] <= 1
+
+
+def test_write_guesses_excludes_shard_passwords(tmp_path):
+    writer = ShardWriter(tmp_path, max_size=2**20)
+    for password in human_passwords(1000):
+        writer.add(password.encode())
+    writer.close()
+    shard_lines = {
+        line for shard in writer.shards for line in shard.read_bytes().splitlines()
+    }
+
+    model = load_or_train(tmp_path, writer.shards)
+    exclude = ShardFilter(writer.shards)
+    assert all(line in exclude for line in shard_lines)
+    output = io.BytesIO()
+    assert write_guesses(model, output, 1000, exclude) == 1000
+    lines = output.getvalue().splitlines()
+    assert len(set(lines)) == 1000
+    assert not shard_lines & set(lines)
+    # The model does guess passwords of the shards
+    unfiltered = io.BytesIO()
+    write_guesses(model, unfiltered, 1000)
+    assert shard_lines & set(unfiltered.getvalue().splitlines())
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from src.generate_dic import iter_file_candidates, iter_range_candidates
+from src.pipeline import read_sources
+
+
+def test_read_sources_keeps_order():
+    files = [Path(f"source{i}") for i in range(8)]
+
+    def read(file, counts):
+        i = int(file.name[len("source") :])
+        for j in range(5):
+            # Later sources are read faster than earlier ones
+            time.sleep(0.001 * (8 - i))
+            counts["lines_in"] += 1
+            yield [b"%d-%d" % (i, j)]
+
+    result = []
+    for file, batches, counts in read_sources(files, read, workers=4):
+        result += [batch[0] for batch in batches]
+        assert counts["lines_in"] == 5
+    assert result == [b"%d-%d" % (i, j) for i in range(8) for j in range(5)]
+
+
+def test_read_sources_backpressure():
+    produced = 0
+    lock = threading.Lock()
+
+    def read(file, counts):
+        nonlocal produced
+        for _ in range(50):
+            with lock:
+                produced += 1
+            yield [b"x"]
+
+    consumed = 0
+    files = [Path("a"), Path("b")]
+    for _, batches, _ in read_sources(files, read, workers=2, queue_size=2):
+        for _ in batches:
+            consumed += 1
+            time.sleep(0.002)
+            # Both readers may hold a full queue plus the batch they try to put
+            assert produced - consumed <= 2 * (2 + 1)
+    assert consumed == 100
+
+
+def test_read_sources_errors_and_early_stop():
+    def read(file, counts):
+        yield [b"first"]
+        if file.name == "broken":
+            raise ValueError("corrupt source")
+        for _ in range(1000):
+            yield [b"more"]
+
+    sources = read_sources([Path("broken"), Path("big"), Path("ok")], read, workers=1)
+    file, batches, _ = next(sources)
+    assert next(batches) == [b"first"]
+    with pytest.raises(ValueError, match="corrupt source"):
+        next(batches)
+
+    # Skipping the rest of a source frees its reader for the next one
+    file, batches, _ = next(sources)
+    assert next(batches) == [b"first"]
+    batches.close()
+    file, batches, _ = next(sources)
+    assert file == Path("ok")
+    assert len(list(batches)) == 1001
+    sources.close()
+
+
+@pytest.mark.parametrize("need_split", [False, True])
+def test_iter_range_candidates(tmp_path, need_split):
+    lines = [b"user%d:password%d" % (i, i) for i in range(3000)]
+    lines += [b"short", b"no delimiter here", b"user;caf\xe9caf\xe9"]
+    source = tmp_path / "combo.txt"
+    source.write_bytes(b"\n".join(lines))
+
+    expected_counts = Counter()
+    expected = [
+        line
+        for batch in iter_file_candidates(source, expected_counts, need_split)
+        for line in batch
+    ]
+    counts = Counter()
+    with ProcessPoolExecutor(2) as executor:
+        batches = iter_range_candidates(
+            executor, source, counts, need_split, range_size=4096, window=2
+        )
+        result = [line for batch in batches for line in batch]
+    assert result == expected
+
+    def without_time(c):
+        return {key: n for key, n in c.items() if key[1:] != ("seconds",)}
+
+    assert without_time(counts) == without_time(expected_counts)
@@ -0,0 +1,50 @@
+import gzip
+import tracemalloc
+
+import pytest
+
+from src.shard_index import ShardIndex, find_shards
+from src.shard_writer import ShardWriter
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_rotation_and_resume(tmp_path, compress):
+    lines = [b"password%05d" % i for i in range(10000)]
+    writer = ShardWriter(tmp_path, max_size=50000, compress=compress, buffer_size=4096)
+    for line in lines[:6000]:
+        writer.add(line)
+    writer.close()
+    assert writer.lines == 6000
+    # 14 bytes per line, a shard is closed after the line that reaches 50000
+    assert [ShardIndex.load(s).lines for s in writer.shards] == [3572, 2428]
+
+    writer = ShardWriter(tmp_path, max_size=50000, compress=compress, buffer_size=4096)
+    writer.resume(find_shards(tmp_path))
+    for line in lines[6000:]:
+        writer.add(line)
+    writer.close()
+    shards = find_shards(tmp_path)
+    assert writer.shards == shards[1:]
+
+    content = b""
+    for shard in shards:
+        data = shard.read_bytes()
+        content += gzip.decompress(data) if compress else data
+        assert vars(ShardIndex.load(shard)) == vars(ShardIndex.build(shard))
+    assert content == b"".join(line + b"\n" for line in lines)
+
+
+def test_memory_does_not_depend_on_shard_size(tmp_path):
+    line = b"x" * 99
+    peaks = []
+    for max_size in [2**20, 2**30]:
+        (tmp_path / str(max_size)).mkdir()
+        writer = ShardWriter(tmp_path / str(max_size), max_size, buffer_size=2**16)
+        tracemalloc.start()
+        for _ in range(40000):
+            writer.add(line)
+        writer.close()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    # 4MB of lines go through a 64KiB buffer either way
+    assert max(peaks) < 2**20